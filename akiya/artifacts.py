@@ -0,0 +1,152 @@
+"""
+Artifact store for generated images.
+
+Renders are stored under the SHA-256 of their bytes and served by URL, so the
+browser and any CDN in front of the app can cache them forever instead of
+receiving base64 payloads inside JSON responses.
+
+``ArtifactStore`` is the interface; ``LocalArtifactStore`` keeps files on the
+local filesystem. An object-storage implementation only needs to provide the
+same four methods.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from starlette.responses import FileResponse
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+}
+EXTENSION_CONTENT_TYPES = {ext: content_type for content_type, ext in CONTENT_TYPE_EXTENSIONS.items()}
+
+_ARTIFACT_ID = re.compile(r"^([0-9a-f]{64})\.(png|jpg|webp)$")
+
+
+@dataclass
+class Artifact:
+    id: str
+    content_type: str
+    size: int
+    path: Optional[Path] = None
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.id.split(".", 1)[0]}"'
+
+
+def artifact_id_for(data: bytes, content_type: str) -> str:
+    extension = CONTENT_TYPE_EXTENSIONS.get(content_type, "png")
+    return f"{hashlib.sha256(data).hexdigest()}.{extension}"
+
+
+def parse_artifact_id(artifact_id: str) -> Optional[str]:
+    """Return the content type of a well-formed artifact id, or None"""
+    match = _ARTIFACT_ID.match(artifact_id)
+    if not match:
+        return None
+    return EXTENSION_CONTENT_TYPES[match.group(2)]
+
+
+class ArtifactStore:
+    """Interface for content-addressed artifact storage"""
+
+    def put(self, data: bytes, content_type: str) -> Artifact:
+        """Store bytes and return the artifact; storing the same bytes twice is a no-op"""
+        raise NotImplementedError
+
+    def get(self, artifact_id: str) -> Optional[Artifact]:
+        """Metadata of a stored artifact, or None"""
+        raise NotImplementedError
+
+    def read(self, artifact_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def delete(self, artifact_id: str) -> None:
+        raise NotImplementedError
+
+
+class LocalArtifactStore(ArtifactStore):
+    """Artifacts as files, sharded by the first two hex characters of the id"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def _path(self, artifact_id: str) -> Path:
+        return self.directory / artifact_id[:2] / artifact_id
+
+    def put(self, data: bytes, content_type: str) -> Artifact:
+        artifact_id = artifact_id_for(data, content_type)
+        path = self._path(artifact_id)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write next to the target and rename so readers never see partial files
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as tmp_file:
+                    tmp_file.write(data)
+                os.replace(tmp_name, path)
+            except OSError:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        return Artifact(artifact_id, EXTENSION_CONTENT_TYPES[artifact_id.rsplit(".", 1)[1]], len(data), path)
+
+    def get(self, artifact_id: str) -> Optional[Artifact]:
+        content_type = parse_artifact_id(artifact_id)
+        if content_type is None:
+            return None
+        path = self._path(artifact_id)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return None
+        return Artifact(artifact_id, content_type, size, path)
+
+    def read(self, artifact_id: str) -> Optional[bytes]:
+        artifact = self.get(artifact_id)
+        if artifact is None:
+            return None
+        try:
+            return artifact.path.read_bytes()
+        except OSError:
+            return None
+
+    def delete(self, artifact_id: str) -> None:
+        if parse_artifact_id(artifact_id) is not None:
+            self._path(artifact_id).unlink(missing_ok=True)
+
+
+class ArtifactFileResponse(FileResponse):
+    """
+    File response that hands the path to the server when it can.
+
+    Servers implementing the ASGI ``http.response.pathsend`` extension send
+    the file without copying it through Python. Other servers, and Range
+    requests, fall back to Starlette's chunked ``FileResponse``.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        extensions = scope.get("extensions") or {}
+        headers = dict(scope.get("headers") or [])
+        if (
+            "http.response.pathsend" in extensions
+            and self.stat_result is not None
+            and scope.get("method") == "GET"
+            and b"range" not in headers
+        ):
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            if self.background is not None:
+                await self.background()
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,284 @@
+"""
+Fingerprinted, precompressed static assets.
+
+Every file in the asset directory is also reachable under a content-hashed
+name (``script.js`` -> ``script.3f2a9c1d7e4b.js``). Hashed URLs never change
+meaning, so they are served with ``immutable`` caching; plain names are
+revalidated with a strong ETag. Templates get hashed URLs from ``url_for``.
+
+``python -m akiya.assets build public`` writes gzip (and brotli, when the
+``brotli`` package is installed) variants next to compressible files and an
+``asset-manifest.json`` recording the source hash they were built from.
+Variants are only used while the source still has that hash, and are chosen
+by ``Accept-Encoding``.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from starlette.responses import PlainTextResponse, Response
+
+from akiya.artifacts import ArtifactFileResponse
+from akiya.conditional import etag_matches
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+MANIFEST_NAME = "asset-manifest.json"
+COMPRESSIBLE_SUFFIXES = {".js", ".css", ".svg", ".html", ".json", ".txt", ".map"}
+VARIANT_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# Preferred first when the client accepts several
+ENCODING_PREFERENCE = ("br", "gzip")
+HASH_LENGTH = 12
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def fingerprinted_name(name: str, digest: str) -> str:
+    stem, dot, suffix = name.rpartition(".")
+    if not dot or "/" in suffix:
+        return f"{name}.{digest[:HASH_LENGTH]}"
+    return f"{stem}.{digest[:HASH_LENGTH]}.{suffix}"
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def accepted_encodings(header: Optional[str]) -> Tuple[str, ...]:
+    """Encodings from an Accept-Encoding header with a non-zero quality"""
+    if not header:
+        return ()
+    accepted = []
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token and quality > 0:
+            accepted.append(token.strip().lower())
+    return tuple(accepted)
+
+
+def _is_asset(path: Path, directory: Path) -> bool:
+    return (
+        path.is_file()
+        and path.name != MANIFEST_NAME
+        and path.suffix not in VARIANT_SUFFIXES.values()
+        and not any(part.startswith(".") for part in path.relative_to(directory).parts)
+    )
+
+
+@dataclass
+class Asset:
+    name: str                   # path relative to the asset directory
+    path: Path
+    digest: str
+    content_type: str
+    signature: Tuple[int, int]  # (mtime_ns, size) the digest was computed for
+    variants: Dict[str, Path] = field(default_factory=dict)
+
+    @property
+    def hashed_name(self) -> str:
+        return fingerprinted_name(self.name, self.digest)
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        # Each representation needs its own strong validator
+        suffix = f"-{encoding}" if encoding else ""
+        return f'"{self.digest[:32]}{suffix}"'
+
+
+class AssetIndex:
+    """
+    Index of an asset directory by plain and hashed name.
+
+    The directory is rescanned at most once per ``check_interval`` seconds
+    and only changed files are rehashed, like the catalog data file.
+    """
+
+    def __init__(self, directory: Path, url_prefix: str = "/public/", check_interval: float = 2.0):
+        self.directory = Path(directory)
+        self.url_prefix = url_prefix
+        self.check_interval = check_interval
+        self._assets: Dict[str, Asset] = {}
+        self._by_name: Dict[str, Asset] = {}
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _manifest(self) -> Dict[str, Dict]:
+        try:
+            with open(self.directory / MANIFEST_NAME, encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _scan_locked(self) -> None:
+        manifest = self._manifest()
+        assets: Dict[str, Asset] = {}
+        if self.directory.is_dir():
+            for path in sorted(self.directory.rglob("*")):
+                if not _is_asset(path, self.directory):
+                    continue
+                name = path.relative_to(self.directory).as_posix()
+                stat = path.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                previous = self._assets.get(name)
+                if previous is not None and previous.signature == signature:
+                    digest = previous.digest
+                else:
+                    digest = file_digest(path)
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                asset = Asset(name, path, digest, content_type, signature)
+                # Variants are trusted only if built from the current content
+                built = manifest.get(name, {})
+                if built.get("sha256") == digest:
+                    for encoding in built.get("encodings", []):
+                        variant = path.with_name(path.name + VARIANT_SUFFIXES[encoding])
+                        if variant.is_file():
+                            asset.variants[encoding] = variant
+                assets[name] = asset
+        self._assets = assets
+        self._by_name = {**assets, **{asset.hashed_name: asset for asset in assets.values()}}
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            self._scan_locked()
+
+    def lookup(self, name: str) -> Tuple[Optional[Asset], bool]:
+        """The asset for a plain or hashed name, and whether the name was hashed"""
+        self.refresh()
+        asset = self._by_name.get(name)
+        return asset, asset is not None and name != asset.name
+
+    def url_for(self, name: str) -> str:
+        """Fingerprinted URL of an asset; the plain URL if it is unknown"""
+        self.refresh()
+        asset = self._assets.get(name)
+        return f"{self.url_prefix}{asset.hashed_name if asset else name}"
+
+
+class StaticAssets:
+    """ASGI app serving an ``AssetIndex``; mount it at the index URL prefix"""
+
+    def __init__(self, index: AssetIndex):
+        self.index = index
+
+    def response(self, path: str, method: str, headers) -> Response:
+        if method not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        asset, hashed = self.index.lookup(path.lstrip("/"))
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        encoding = None
+        accepted = accepted_encodings(headers.get("accept-encoding"))
+        for candidate in ENCODING_PREFERENCE:
+            if candidate in asset.variants and candidate in accepted:
+                encoding = candidate
+                break
+        response_headers = {
+            "ETag": asset.etag(encoding),
+            "Cache-Control": IMMUTABLE if hashed else "no-cache",
+        }
+        if asset.variants:
+            response_headers["Vary"] = "Accept-Encoding"
+        if etag_matches(headers.get("if-none-match"), response_headers["ETag"]):
+            return Response(status_code=304, headers=response_headers)
+        file_path = asset.variants[encoding] if encoding else asset.path
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        return ArtifactFileResponse(
+            file_path,
+            media_type=asset.content_type,
+            headers=response_headers,
+            stat_result=os.stat(file_path),
+        )
+
+    async def __call__(self, scope, receive, send) -> None:
+        path = scope["path"]
+        # Mounted apps see the full path with the mount prefix in root_path
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope.get("headers") or ()}
+        response = self.response(path, scope["method"], headers)
+        await response(scope, receive, send)
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Encodings this process can produce, most preferred first"""
+    return tuple(encoding for encoding in ENCODING_PREFERENCE if encoding != "br" or brotli is not None)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps builds reproducible
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def build(directory: Path) -> Dict[str, Dict]:
+    """Write compressed variants and the manifest; returns the manifest entries"""
+    directory = Path(directory)
+    encodings = available_encodings()
+    files: Dict[str, Dict] = {}
+    for path in sorted(directory.rglob("*")):
+        if not _is_asset(path, directory):
+            continue
+        name = path.relative_to(directory).as_posix()
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        entry = {"sha256": digest, "hashed": fingerprinted_name(name, digest), "size": len(data), "encodings": []}
+        for encoding in encodings:
+            variant = path.with_name(path.name + VARIANT_SUFFIXES[encoding])
+            if path.suffix.lower() in COMPRESSIBLE_SUFFIXES:
+                compressed = compress(data, encoding)
+                # Only worth serving when it saves bytes
+                if len(compressed) < len(data):
+                    variant.write_bytes(compressed)
+                    entry["encodings"].append(encoding)
+                    entry[f"{encoding}_size"] = len(compressed)
+                    continue
+            variant.unlink(missing_ok=True)
+        files[name] = entry
+    with open(directory / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump({"files": files}, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Static asset tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="precompress assets and write the manifest")
+    build_parser.add_argument("directory", type=Path)
+    args = parser.parse_args()
+
+    files = build(args.directory)
+    compressed = sum(1 for entry in files.values() if entry["encodings"])
+    print(f"Indexed {len(files)} assets in {args.directory}, {compressed} precompressed")
+
+
+if __name__ == "__main__":
+    main()
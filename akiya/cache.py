@@ -0,0 +1,327 @@
+"""
+Content-addressed cache for renovation results.
+
+Results are keyed on a digest of everything that influences the model output
+(input image, style, prompts, inference steps and model version), so an
+identical request can be answered without another upstream prediction.
+
+Two tiers are used: a bounded in-memory LRU in front of an on-disk store with
+size-based eviction. Disk entries remember the prompt fingerprint of the style
+they were rendered with; when a prompt in ``RENOVATION_STYLES`` changes, the
+old entries no longer match and are dropped.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def render_cache_key(
+    image_digest: str,
+    style: str,
+    prompt: str,
+    negative_prompt: str,
+    num_inference_steps: int,
+    model_version: str,
+) -> str:
+    """Build the cache key for a single renovation request"""
+    payload = json.dumps(
+        [image_digest, style, prompt, negative_prompt, num_inference_steps, model_version],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def prompt_fingerprint(style_config: Dict[str, str]) -> str:
+    """Short digest of the prompt text of a style, used for invalidation"""
+    payload = f"{style_config.get('prompt', '')}\x00{style_config.get('negative', '')}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class CacheEntry:
+    data: bytes
+    content_type: str
+    style: str
+    fingerprint: str
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+class MemoryLRU:
+    """In-memory LRU bounded by both item count and total bytes"""
+
+    def __init__(self, max_items: int, max_bytes: int):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        if self.max_items <= 0 or entry.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_items or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def keys_for_style(self, style: str):
+        with self._lock:
+            return [key for key, entry in self._entries.items() if entry.style == style]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+
+class DiskStore:
+    """
+    On-disk store with size-based eviction.
+
+    Each entry is a ``<key>.bin`` payload next to a ``<key>.json`` metadata
+    file, sharded by the first two hex characters of the key. The index is
+    built lazily from the directory on first use so constructing the store is
+    free on serverless cold starts.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._index: Optional["OrderedDict[str, Dict]"] = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _paths(self, key: str):
+        shard = self.directory / key[:2]
+        return shard / f"{key}.bin", shard / f"{key}.json"
+
+    def _load_index(self) -> "OrderedDict[str, Dict]":
+        if self._index is not None:
+            return self._index
+        found = []
+        if self.directory.exists():
+            for meta_path in self.directory.glob("*/*.json"):
+                try:
+                    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                    data_path = meta_path.with_suffix(".bin")
+                    stat = data_path.stat()
+                except (OSError, ValueError):
+                    continue
+                meta["size"] = stat.st_size
+                found.append((stat.st_mtime, meta_path.stem, meta))
+        found.sort(key=lambda item: item[0])
+        self._index = OrderedDict((key, meta) for _, key, meta in found)
+        self._bytes = sum(meta["size"] for meta in self._index.values())
+        return self._index
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            index = self._load_index()
+            meta = index.get(key)
+            if meta is None:
+                return None
+            data_path, _ = self._paths(key)
+            try:
+                data = data_path.read_bytes()
+                os.utime(data_path)
+            except OSError:
+                self._remove_locked(key)
+                return None
+            index.move_to_end(key)
+            return CacheEntry(data, meta["content_type"], meta["style"], meta["fingerprint"])
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            index = self._load_index()
+            if key in index:
+                self._remove_locked(key)
+            data_path, meta_path = self._paths(key)
+            data_path.parent.mkdir(parents=True, exist_ok=True)
+            meta = {
+                "content_type": entry.content_type,
+                "style": entry.style,
+                "fingerprint": entry.fingerprint,
+            }
+            # Write to temporary files first so readers never see partial entries
+            tmp_data = data_path.with_suffix(".bin.tmp")
+            tmp_meta = meta_path.with_suffix(".json.tmp")
+            try:
+                tmp_data.write_bytes(entry.data)
+                tmp_meta.write_text(json.dumps(meta), encoding="utf-8")
+                os.replace(tmp_data, data_path)
+                os.replace(tmp_meta, meta_path)
+            except OSError:
+                for path in (tmp_data, tmp_meta, data_path, meta_path):
+                    path.unlink(missing_ok=True)
+                return
+            meta["size"] = entry.size
+            index[key] = meta
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and index:
+                self._remove_locked(next(iter(index)))
+
+    def _remove_locked(self, key: str) -> None:
+        meta = self._index.pop(key, None) if self._index is not None else None
+        if meta is not None:
+            self._bytes -= meta["size"]
+        for path in self._paths(key):
+            path.unlink(missing_ok=True)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._load_index()
+            self._remove_locked(key)
+
+    def remove_where(self, predicate) -> int:
+        """Remove every entry whose metadata matches ``predicate``"""
+        with self._lock:
+            index = self._load_index()
+            stale = [key for key, meta in index.items() if predicate(meta)]
+            for key in stale:
+                self._remove_locked(key)
+            return len(stale)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load_index())
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._load_index()
+            return self._bytes
+
+
+class RenderCache:
+    """Memory LRU in front of a disk store, with hit/miss accounting"""
+
+    def __init__(
+        self,
+        directory: Path,
+        memory_items: int = 64,
+        memory_bytes: int = 64 * 1024 * 1024,
+        disk_bytes: int = 512 * 1024 * 1024,
+        fingerprints: Optional[Dict[str, str]] = None,
+    ):
+        self.memory = MemoryLRU(memory_items, memory_bytes)
+        self.disk = DiskStore(directory, disk_bytes)
+        self.fingerprints: Dict[str, str] = dict(fingerprints or {})
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "invalidated": 0}
+        self._stats_lock = threading.Lock()
+        self._pruned = False
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _is_current(self, entry: CacheEntry) -> bool:
+        expected = self.fingerprints.get(entry.style)
+        return expected is None or expected == entry.fingerprint
+
+    def _prune_once(self) -> None:
+        # Drop entries rendered with outdated prompts the first time the disk is touched
+        if not self._pruned:
+            self._pruned = True
+            self.prune_stale()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self.memory.get(key)
+        if entry is not None and self._is_current(entry):
+            self._count("memory_hits")
+            return entry
+        self._prune_once()
+        entry = self.disk.get(key)
+        if entry is not None:
+            if self._is_current(entry):
+                self.memory.put(key, entry)
+                self._count("disk_hits")
+                return entry
+            self.disk.discard(key)
+        self.memory.discard(key)
+        self._count("misses")
+        return None
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        self._prune_once()
+        self.memory.put(key, entry)
+        self.disk.put(key, entry)
+        self._count("stores")
+
+    def set_fingerprints(self, fingerprints: Dict[str, str]) -> int:
+        """Replace the known prompt fingerprints and drop entries that no longer match"""
+        self.fingerprints = dict(fingerprints)
+        return self.prune_stale()
+
+    def prune_stale(self) -> int:
+        """Remove entries whose prompt fingerprint differs from the current one"""
+        removed = 0
+        for style, fingerprint in self.fingerprints.items():
+            removed += self.invalidate_style(style, keep_fingerprint=fingerprint)
+        return removed
+
+    def invalidate_style(self, style: str, keep_fingerprint: Optional[str] = None) -> int:
+        """
+        Invalidate cached results for a style.
+
+        When ``keep_fingerprint`` is given, entries rendered with that prompt
+        fingerprint are kept and only outdated ones are removed.
+        """
+        for key in self.memory.keys_for_style(style):
+            entry = self.memory.get(key)
+            if entry is not None and entry.fingerprint != keep_fingerprint:
+                self.memory.discard(key)
+        removed = self.disk.remove_where(
+            lambda meta: meta.get("style") == style and meta.get("fingerprint") != keep_fingerprint
+        )
+        self._count("invalidated", removed)
+        return removed
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.disk.remove_where(lambda meta: True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        stats["memory_entries"] = len(self.memory)
+        stats["memory_bytes"] = self.memory.total_bytes
+        stats["disk_entries"] = len(self.disk)
+        stats["disk_bytes"] = self.disk.total_bytes
+        return stats
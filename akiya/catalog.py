@@ -0,0 +1,147 @@
+"""
+House and demo-image catalog.
+
+The catalog is loaded once from a JSON data file and the API responses built
+from it are kept as pre-encoded bytes with a strong ETag. Responses are only
+rebuilt when the data file changes on disk or when the application reports a
+change (for example an upload added an image to a house), so catalog reads
+cost a dictionary lookup and clients revalidate with 304s.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.responses import Response
+
+from akiya.conditional import etag_matches
+
+
+@dataclass(frozen=True)
+class EncodedPayload:
+    body: bytes
+    etag: str
+    headers: Tuple[Tuple[str, str], ...] = ()
+
+
+def encode_payload(data: Any, headers: Optional[Dict[str, str]] = None) -> EncodedPayload:
+    """Encode ``data`` as compact JSON; ``headers`` are sent along with the body"""
+    body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return EncodedPayload(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', tuple((headers or {}).items()))
+
+
+def payload_response(payload: EncodedPayload, request, max_age: int = 0) -> Response:
+    """JSON response for a pre-encoded payload, or 304 when the client copy is current"""
+    headers = {
+        **dict(payload.headers),
+        "ETag": payload.etag,
+        "Cache-Control": f"public, max-age={max_age}, must-revalidate" if max_age else "no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), payload.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload.body, media_type="application/json", headers=headers)
+
+
+class Catalog:
+    """
+    Catalog data file with change detection and memoized encoded payloads.
+
+    ``on_reload`` is called with the parsed data after every (re)load. The
+    file is stat-ed at most once per ``check_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        check_interval: float = 2.0,
+        on_reload: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self.on_reload = on_reload
+        self.version = 0
+        self._data: Optional[Dict[str, Any]] = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._payloads: Dict[str, Tuple[Any, EncodedPayload]] = {}
+        self._payload_version = -1
+        self._lock = threading.RLock()
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load_locked(self) -> None:
+        signature = self._file_signature()
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self._data = data
+        self._signature = signature
+        self.version += 1
+        if self.on_reload is not None:
+            self.on_reload(data)
+
+    def refresh(self) -> bool:
+        """Reload the data file if it changed; returns True when it was reloaded"""
+        now = time.monotonic()
+        if self._data is not None and now - self._checked_at < self.check_interval:
+            return False
+        with self._lock:
+            self._checked_at = now
+            if self._data is not None:
+                try:
+                    if self._file_signature() == self._signature:
+                        return False
+                except OSError:
+                    # Keep serving the last good copy if the file disappears
+                    return False
+            self._load_locked()
+            return True
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        self.refresh()
+        return self._data
+
+    def bump(self) -> None:
+        """Mark the derived payloads stale after an in-process change"""
+        with self._lock:
+            self.version += 1
+
+    def houses(self) -> List[Dict[str, Any]]:
+        return self.data.get("houses", [])
+
+    def demo_images(self, house_id: str) -> Optional[List[Dict[str, str]]]:
+        """Demo images of a house, or None for unknown houses"""
+        data = self.data
+        house = next((h for h in data.get("houses", []) if h["id"] == house_id), None)
+        if house is None:
+            return None
+        return data.get("demo_images", {}).get(house.get("house_type"))
+
+    def encoded(self, name: str, build: Callable[[], Any], revision: Any = None) -> EncodedPayload:
+        """
+        Encoded payload ``name``, rebuilt with ``build`` when the catalog changed.
+
+        ``build`` returns the data to encode, or an ``EncodedPayload`` when
+        extra headers must be cached with it.
+
+        ``revision`` identifies the state of any other source the payload is
+        built from (such as a database write counter); a different value also
+        triggers a rebuild.
+        """
+        self.refresh()
+        with self._lock:
+            if self._payload_version != self.version:
+                self._payloads.clear()
+                self._payload_version = self.version
+            cached = self._payloads.get(name)
+            if cached is None or cached[0] != revision:
+                built = build()
+                cached = (revision, built if isinstance(built, EncodedPayload) else encode_payload(built))
+                self._payloads[name] = cached
+            return cached[1]
@@ -0,0 +1,143 @@
+"""
+Response compression as a pure ASGI middleware.
+
+Only responses of the configured content types (JSON by default) are
+compressed, with brotli when the client accepts it and the ``brotli``
+package is installed, gzip otherwise. Complete bodies below
+``minimum_size`` are sent as they are. Streaming bodies are never buffered:
+every chunk is compressed and flushed as it arrives, so NDJSON streams keep
+their latency. Responses that already have a ``Content-Encoding`` or are
+partial (``Content-Range``) pass through.
+"""
+import zlib
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from akiya.assets import accepted_encodings, available_encodings, brotli
+
+JSON_TYPES = ("application/json", "application/x-ndjson")
+
+
+class _Compressor:
+    """Incremental gzip or brotli stream"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits 31: gzip container
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress ``data`` and flush, so the client can decode it right away"""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """Compress eligible responses; see the module docstring"""
+
+    def __init__(
+        self, app, minimum_size: int = 1024, content_types: Tuple[str, ...] = JSON_TYPES,
+        gzip_level: int = 6, brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = frozenset(content_types)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def choose_encoding(self, accept_encoding: Optional[str]) -> Optional[str]:
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in available_encodings():
+            if encoding in accepted:
+                return encoding
+        return None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self.choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        start = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed_start(content_length: Optional[int] = None) -> None:
+            headers = MutableHeaders(scope=start)
+            headers["Content-Encoding"] = encoding
+            if content_length is not None:
+                headers["Content-Length"] = str(content_length)
+            elif "content-length" in headers:
+                del headers["content-length"]
+            # The compressed representation is no longer byte-identical
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            await send(start)
+
+        async def send_compressed(message) -> None:
+            nonlocal start, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+                eligible = (
+                    content_type in self.content_types
+                    and message["status"] not in (204, 206, 304)
+                    and message["status"] >= 200
+                    and "content-encoding" not in headers
+                    and "content-range" not in headers
+                )
+                if eligible:
+                    vary = headers.get("vary")
+                    if not vary:
+                        MutableHeaders(scope=start)["Vary"] = "Accept-Encoding"
+                    elif "accept-encoding" not in vary.lower():
+                        MutableHeaders(scope=start)["Vary"] = f"{vary}, Accept-Encoding"
+                if not eligible or encoding is None:
+                    passthrough = True
+                    await send(start)
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is not None:
+                data = compressor.chunk(body) if more_body else compressor.finish(body)
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            if not more_body and len(body) < self.minimum_size:
+                # Too small to be worth it
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+            if more_body:
+                # A stream's size is unknown up front, so it is always compressed
+                await send_compressed_start()
+                await send({"type": "http.response.body", "body": compressor.chunk(body), "more_body": True})
+            else:
+                compressed = compressor.finish(body)
+                await send_compressed_start(len(compressed))
+                await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, send_compressed)
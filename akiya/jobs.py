@@ -0,0 +1,417 @@
+"""
+Background renovation jobs.
+
+Upstream predictions are blocking calls that take tens of seconds, so they run
+in a bounded thread pool instead of on the event loop. Every submission gets a
+job record that can be polled until it finishes.
+
+Submissions with a key are coalesced: while a job for that key is in flight,
+identical submissions attach to it instead of starting another upstream
+call, and every waiter receives the same result.
+
+Waiting jobs sit in a bounded fair queue (``akiya.scheduler.FairQueue``)
+keyed by client, so one client's burst cannot starve the others. When the
+queue is full, submissions are rejected right away with a predicted wait.
+
+Status changes, queue moves and progress reported by the running function
+are published on ``JobManager.events`` for streaming to clients.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from akiya.progress import ProgressBroker
+from akiya.scheduler import FairQueue, QueueFull
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobError(Exception):
+    """
+    Raised by job functions with a message that is safe to show to clients.
+
+    ``status_code`` is the HTTP status to answer with and ``retry_after`` the
+    seconds a client should wait before trying again, when known.
+    """
+
+    def __init__(self, message: str, status_code: int = 500, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class JobRejected(JobError):
+    """The work queue is full; ``retry_after`` is the predicted wait"""
+
+    def __init__(self, retry_after: float, message: str = "現在リクエストが混み合っています。しばらくしてから再度お試しください"):
+        super().__init__(message, status_code=503, retry_after=retry_after)
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    error_status: int = 500
+    retry_after: Optional[float] = None
+    future: Optional[Future] = field(default=None, repr=False)
+    key: Optional[str] = None
+    client: Hashable = ""
+    # The queued call, dropped once it starts
+    call: Optional[Tuple[Callable, tuple, dict]] = field(default=None, repr=False)
+    # Callers awaiting the result; a queued job nobody waits for is cancelled
+    waiters: int = 0
+    # Polled through the jobs API, so never cancelled for lack of waiters
+    detached: bool = False
+    # What a running job is doing, e.g. "upstream", and how far along (0-1)
+    phase: Optional[str] = None
+    progress: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": datetime.fromtimestamp(self.created_at).isoformat(),
+        }
+        if self.started_at is not None:
+            data["started_at"] = datetime.fromtimestamp(self.started_at).isoformat()
+        if self.finished_at is not None:
+            data["finished_at"] = datetime.fromtimestamp(self.finished_at).isoformat()
+        if self.phase is not None and not self.done:
+            data["phase"] = self.phase
+            if self.progress is not None:
+                data["progress"] = round(self.progress, 3)
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        if self.retry_after is not None:
+            data["retry_after"] = math.ceil(self.retry_after)
+        return data
+
+
+class JobManager:
+    """
+    Runs job functions on ``max_workers`` worker threads and keeps their status.
+
+    Jobs wait in a fair queue of at most ``max_queued`` jobs, and at most
+    ``max_queued_per_client`` of one client. Job records live in process
+    memory; finished jobs are forgotten after ``ttl`` seconds or once more
+    than ``max_jobs`` records are held.
+    """
+
+    def __init__(
+        self, max_workers: int = 4, max_jobs: int = 1000, ttl: float = 3600.0,
+        max_queued: int = 100, max_queued_per_client: Optional[int] = None, service_time: float = 30.0,
+    ):
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.queue = FairQueue(max_size=max_queued, max_per_client=max_queued_per_client)
+        # Moving average of how long a job runs, for predicted waits
+        self.service_time = service_time
+        self._jobs: Dict[str, Job] = {}
+        self._inflight: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        # The job each worker thread is running, for progress reports
+        self._current = threading.local()
+        self.events = ProgressBroker()
+        self.started = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        self.rejected = 0
+
+    def _ensure_workers(self) -> None:
+        # Started on first use so importing the app does not start threads
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        for i in range(len(self._workers), self.max_workers):
+            worker = threading.Thread(target=self._work, args=(self.queue,), name=f"renovate_{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self, queue: FairQueue) -> None:
+        # Bound to the queue it was started for, so it exits when that one is closed
+        while True:
+            job = queue.get()
+            if job is None:
+                return
+            try:
+                self._process(job)
+            except Exception as e:
+                # Fail this job only; the worker keeps serving the queue
+                logging.error(f"Render worker failed on job {job.id}: {e}")
+                if not job.future.done():
+                    job.status = FAILED
+                    job.error = "画像生成に失敗しました"
+                    job.future.set_exception(e)
+
+    def _process(self, job: Job) -> None:
+        # Claimed before its call is read: a waiter may cancel it right after the dequeue
+        if not job.future.set_running_or_notify_cancel():
+            return
+        with self._lock:
+            fn, args, kwargs = job.call
+            job.call = None
+        self._publish_positions()
+        try:
+            result = self._run(job, fn, args, kwargs)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+
+    def _publish(self, job: Job, data: Optional[Dict[str, Any]] = None) -> None:
+        if job.id in self.events:
+            self.events.publish(job.id, data if data is not None else self.describe(job))
+
+    def _publish_positions(self) -> None:
+        """Tell subscribers of queued jobs that they moved up"""
+        jobs = [job for job in map(self.get, self.events.keys()) if job is not None and job.status == QUEUED]
+        if not jobs:
+            return
+        # One look-ahead at the queue for all of them, not one per subscriber
+        for job, position in zip(jobs, self.queue.positions(jobs)):
+            self._publish(job, self._describe(job, position))
+
+    def reporter(self) -> Callable[..., None]:
+        """
+        ``report(phase, progress=None)`` for the job running on this thread.
+
+        The function can be handed to other threads the job starts. It is a
+        no-op outside a job. Progress within a phase only moves forward, so
+        hedged attempts reporting at once do not make it jump back.
+        """
+        job = getattr(self._current, "job", None)
+        if job is None:
+            return lambda phase, progress=None: None
+
+        def report(phase: str, progress: Optional[float] = None) -> None:
+            if job.done:
+                return
+            with self._lock:
+                if phase == job.phase and progress is not None and job.progress is not None:
+                    progress = max(progress, job.progress)
+                job.phase = phase
+                job.progress = progress
+            self._publish(job)
+
+        return report
+
+    def predicted_wait(self, position: int) -> float:
+        """Seconds until the job at queue ``position`` starts, with every worker busy"""
+        return (position // max(1, self.max_workers) + 0.5) * self.service_time
+
+    def _rejected(self) -> JobRejected:
+        self.rejected += 1
+        return JobRejected(retry_after=self.predicted_wait(len(self.queue)))
+
+    def admit(self, client: Hashable, count: int = 1) -> None:
+        """
+        Raise ``JobRejected`` unless ``count`` more jobs of ``client`` fit in
+        the queue, so requests can be shed before any work is done for them.
+        """
+        try:
+            self.queue.check(client, count)
+        except QueueFull:
+            with self._lock:
+                raise self._rejected() from None
+
+    def _enqueue_locked(self, job: Job, fn, args, kwargs) -> None:
+        job.future = Future()
+        job.call = (fn, args, kwargs)
+        try:
+            self.queue.put(job.client, job)
+        except QueueFull:
+            del self._jobs[job.id]
+            if job.key is not None:
+                self._inflight.pop(job.key, None)
+            raise self._rejected() from None
+        self.started += 1
+        self._ensure_workers()
+
+    def submit(self, fn: Callable[..., Dict[str, Any]], *args, client: Hashable = "", **kwargs) -> Job:
+        job = Job(id=str(uuid.uuid4()), client=client)
+        with self._lock:
+            self._prune_locked()
+            self._jobs[job.id] = job
+            self._enqueue_locked(job, fn, args, kwargs)
+        return job
+
+    def submit_shared(
+        self, key: str, fn: Callable[..., Dict[str, Any]], *args, detached: bool = False, client: Hashable = ""
+    ) -> Tuple[Job, bool]:
+        """
+        Run ``fn(*args)`` unless a job with ``key`` is in flight.
+
+        Returns the job and whether an in-flight job was joined. Unless
+        ``detached``, the caller counts as a waiter and must ``wait`` on the
+        job. Raises ``JobRejected`` when a new job does not fit in the queue.
+        """
+        with self._lock:
+            job = self._inflight.get(key)
+            joined = job is not None
+            if joined:
+                self.coalesced += 1
+            else:
+                self._prune_locked()
+                job = Job(id=str(uuid.uuid4()), key=key, client=client)
+                self._jobs[job.id] = job
+                self._inflight[key] = job
+                # Enqueued under the lock so joiners always see the future
+                self._enqueue_locked(job, fn, args, {})
+            if detached:
+                job.detached = True
+            else:
+                job.waiters += 1
+        return job, joined
+
+    def _run(self, job: Job, fn, args, kwargs) -> Dict[str, Any]:
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._current.job = job
+        self._publish(job)
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = SUCCEEDED
+            return job.result
+        except JobError as e:
+            job.error = str(e)
+            job.error_status = e.status_code
+            job.retry_after = e.retry_after
+            job.status = FAILED
+            raise
+        except Exception:
+            job.error = "画像生成に失敗しました"
+            job.status = FAILED
+            raise
+        finally:
+            self._current.job = None
+            job.finished_at = time.time()
+            with self._lock:
+                self.service_time += 0.2 * ((job.finished_at - job.started_at) - self.service_time)
+            self._forget_inflight(job)
+            self._publish(job)
+
+    def _forget_inflight(self, job: Job) -> None:
+        if job.key is not None:
+            with self._lock:
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+
+    async def wait(self, job: Job) -> Dict[str, Any]:
+        """
+        Await a job without blocking the event loop.
+
+        Cancelling the wait (for example when the client disconnects) only
+        detaches this waiter. The job itself is cancelled only if it has not
+        started yet and nobody else is waiting for it or polling it.
+        """
+        abandoned = False
+        try:
+            # Shielded so one cancelled waiter does not cancel the shared future
+            return await asyncio.shield(asyncio.wrap_future(job.future))
+        except asyncio.CancelledError:
+            abandoned = True
+            raise
+        finally:
+            self._release(job, abandoned)
+
+    def _release(self, job: Job, abandoned: bool = False) -> None:
+        with self._lock:
+            job.waiters = max(0, job.waiters - 1)
+            if not abandoned or job.waiters or job.detached:
+                return
+            # Only succeeds while the job is still queued
+            if not job.future.cancel():
+                return
+            self.queue.remove(job)
+            job.call = None
+            self.abandoned += 1
+            job.status = FAILED
+            job.error = "キャンセルされました"
+            job.finished_at = time.time()
+            if job.key is not None and self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+        self._publish(job)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "renders_started": self.started,
+                "renders_coalesced": self.coalesced,
+                "renders_abandoned": self.abandoned,
+                "renders_in_flight": len(self._inflight),
+                "renders_queued": len(self.queue),
+                "renders_rejected": self.rejected,
+            }
+
+    def describe(self, job: Job) -> Dict[str, Any]:
+        """``job.to_dict()`` with its place in the queue while it waits"""
+        return self._describe(job, self.queue.position(job) if job.status == QUEUED else None)
+
+    def _describe(self, job: Job, position: Optional[int]) -> Dict[str, Any]:
+        data = job.to_dict()
+        if job.status == QUEUED and position is not None:
+            data["queue_position"] = position + 1
+            data["estimated_wait"] = math.ceil(self.predicted_wait(position))
+        return data
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune_locked(self) -> None:
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.done and job.finished_at is not None and now - job.finished_at > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        # Drop the oldest finished jobs when over capacity
+        if len(self._jobs) >= self.max_jobs:
+            finished = sorted(
+                (job for job in self._jobs.values() if job.done),
+                key=lambda job: job.finished_at or 0,
+            )
+            for job in finished[: len(self._jobs) - self.max_jobs + 1]:
+                del self._jobs[job.id]
+
+    def shutdown(self) -> None:
+        """
+        Stop the workers; queued jobs are cancelled, running ones finish.
+
+        The manager starts over with an empty queue, so it can be used again
+        (for example by the next app lifespan in the same process).
+        """
+        with self._lock:
+            queue = self.queue
+            self.queue = FairQueue(max_size=queue.max_size, max_per_client=queue.max_per_client)
+            self._workers = []
+        for job in queue.close():
+            job.call = None
+            if job.future.cancel():
+                job.status = FAILED
+                job.error = "キャンセルされました"
+                job.finished_at = time.time()
+                self._forget_inflight(job)
+                self._publish(job)
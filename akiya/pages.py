@@ -0,0 +1,91 @@
+"""
+Pages rendered once and served from memory.
+
+Templates without per-request data do not need Jinja2 on every hit.
+``PrerenderedPage`` renders one template to bytes, compresses it once per
+accepted encoding, and answers with a strong ETag per representation and
+``304`` on a matching ``If-None-Match``. With ``reload_interval`` set (for
+development) the template is rendered again at most that often, and the
+variants are rebuilt only when the output changed.
+"""
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Mapping, Optional
+
+from starlette.responses import Response
+
+from akiya.assets import accepted_encodings, available_encodings, compress
+from akiya.conditional import etag_matches
+
+
+@dataclass
+class RenderedPage:
+    body: bytes
+    digest: str
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        suffix = f"-{encoding}" if encoding else ""
+        return f'"{self.digest[:32]}{suffix}"'
+
+
+class PrerenderedPage:
+    """
+    One rendered template with gzip (and brotli, when installed) variants.
+
+    ``render`` returns the page HTML; it is called on first use or by
+    ``refresh()`` at startup, and again on reload checks.
+    """
+
+    def __init__(
+        self, render: Callable[[], str], media_type: str = "text/html; charset=utf-8",
+        reload_interval: Optional[float] = None,
+    ):
+        self._render = render
+        self.media_type = media_type
+        self.reload_interval = reload_interval
+        self._page: Optional[RenderedPage] = None
+        self._rendered_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _build(self, body: bytes) -> RenderedPage:
+        page = RenderedPage(body, hashlib.sha256(body).hexdigest())
+        for encoding in available_encodings():
+            compressed = compress(body, encoding)
+            if len(compressed) < len(body):
+                page.variants[encoding] = compressed
+        return page
+
+    def refresh(self, force: bool = False) -> RenderedPage:
+        """The current rendering, rendering again if it is missing or due for a reload check"""
+        now = time.monotonic()
+        with self._lock:
+            due = self._page is None or force or (
+                self.reload_interval is not None and now - self._rendered_at >= self.reload_interval
+            )
+            if due:
+                body = self._render().encode("utf-8")
+                if self._page is None or body != self._page.body:
+                    self._page = self._build(body)
+                self._rendered_at = now
+            return self._page
+
+    def response(self, headers: Mapping[str, str]) -> Response:
+        page = self.refresh()
+        encoding = None
+        accepted = accepted_encodings(headers.get("accept-encoding"))
+        for candidate in available_encodings():
+            if candidate in page.variants and candidate in accepted:
+                encoding = candidate
+                break
+        response_headers = {"ETag": page.etag(encoding), "Cache-Control": "no-cache"}
+        if page.variants:
+            response_headers["Vary"] = "Accept-Encoding"
+        if etag_matches(headers.get("if-none-match"), response_headers["ETag"]):
+            return Response(status_code=304, headers=response_headers)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        body = page.variants[encoding] if encoding else page.body
+        return Response(content=body, media_type=self.media_type, headers=response_headers)
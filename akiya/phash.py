@@ -0,0 +1,244 @@
+"""
+Perceptual hashes and a near-duplicate index for render inputs.
+
+The same listing photo is often uploaded again after cropping, recompressing
+or resizing. Its bytes differ, so the exact render cache misses, but its
+difference hash (dHash) stays within a few bits. ``NearDuplicateIndex`` maps
+the dHash of every rendered input to its render cache key so such re-uploads
+can reuse the earlier render.
+
+Lookups use multi-index hashing: the 64-bit hash is split into four 16-bit
+chunks, each with its own table. Two hashes within distance ``r`` agree on at
+least one chunk up to ``r // 4`` bits (pigeonhole), so only a few table
+probes are needed instead of a scan. This stays well under a millisecond at
+hundreds of thousands of entries.
+"""
+import io
+import json
+import os
+import threading
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def dhash(content: bytes, size: int = 8) -> Optional[int]:
+    """64-bit difference hash of an image; None when it cannot be decoded"""
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(content)) as opened:
+            # JPEGs decode at a fraction of their size, plenty for a 9x8 thumbnail
+            opened.draft("L", (size * 8, size * 8))
+            image = ImageOps.exif_transpose(opened).convert("L").resize((size + 1, size), Image.BOX)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    pixels = np.asarray(image, dtype=np.int16)
+    # One bit per horizontally adjacent pair: is the right pixel brighter
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _chunks(value: int) -> List[int]:
+    return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+_flip_masks: Dict[int, List[int]] = {}
+
+
+def _masks(radius: int) -> List[int]:
+    """Every chunk mask with at most ``radius`` bits set"""
+    masks = _flip_masks.get(radius)
+    if masks is None:
+        masks = [0]
+        for bits in range(1, radius + 1):
+            for positions in combinations(range(CHUNK_BITS), bits):
+                masks.append(sum(1 << p for p in positions))
+        _flip_masks[radius] = masks
+    return masks
+
+
+class HammingIndex:
+    """Multi-index hash table of 64-bit hashes, each with a set of values"""
+
+    def __init__(self):
+        self._values: Dict[int, Set[str]] = {}
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in range(CHUNKS)]
+
+    def __len__(self) -> int:
+        return sum(len(values) for values in self._values.values())
+
+    def __contains__(self, item: Tuple[int, str]) -> bool:
+        value_hash, value = item
+        return value in self._values.get(value_hash, ())
+
+    def items(self) -> Iterator[Tuple[int, str]]:
+        for value_hash, values in self._values.items():
+            for value in values:
+                yield value_hash, value
+
+    def add(self, value_hash: int, value: str) -> bool:
+        """Add an entry; False if it was already there"""
+        values = self._values.get(value_hash)
+        if values is None:
+            values = self._values[value_hash] = set()
+            for table, chunk in zip(self._tables, _chunks(value_hash)):
+                table.setdefault(chunk, set()).add(value_hash)
+        elif value in values:
+            return False
+        values.add(value)
+        return True
+
+    def remove(self, value_hash: int, value: str) -> bool:
+        """Remove an entry; False if it was not there"""
+        values = self._values.get(value_hash)
+        if values is None or value not in values:
+            return False
+        values.discard(value)
+        if not values:
+            del self._values[value_hash]
+            for table, chunk in zip(self._tables, _chunks(value_hash)):
+                bucket = table.get(chunk)
+                if bucket is not None:
+                    bucket.discard(value_hash)
+                    if not bucket:
+                        del table[chunk]
+        return True
+
+    def search(self, query: int, max_distance: int) -> List[Tuple[int, int, str]]:
+        """``(distance, hash, value)`` of every entry within ``max_distance``, nearest first"""
+        if max_distance < 0:
+            return []
+        masks = _masks(max_distance // CHUNKS)
+        candidates: Set[int] = set()
+        for table, chunk in zip(self._tables, _chunks(query)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+        found = []
+        for candidate in candidates:
+            distance = hamming(candidate, query)
+            if distance <= max_distance:
+                found.extend((distance, candidate, value) for value in self._values[candidate])
+        found.sort()
+        return found
+
+
+class NearDuplicateIndex:
+    """
+    Render cache keys by perceptual hash, partitioned by render context.
+
+    The context identifies everything but the input image (style, prompts,
+    steps and model version), so a near-duplicate is only reused for an
+    otherwise identical render. Entries are appended to a JSON lines file
+    and read back lazily on first use; removals are appended as tombstones
+    and the file is compacted once they dominate.
+    """
+
+    def __init__(self, path: Optional[Path], max_distance: int = 6):
+        self.path = Path(path) if path is not None else None
+        self.max_distance = max_distance
+        self._indexes: Optional[Dict[str, HammingIndex]] = None
+        self._lines = 0
+        self._live = 0
+        self._hits = 0
+        self._lock = threading.Lock()
+
+    def _apply(self, record: Dict) -> None:
+        index = self._indexes.setdefault(record["context"], HammingIndex())
+        value_hash = int(record["hash"], 16)
+        if record.get("removed"):
+            self._live -= index.remove(value_hash, record["key"])
+        else:
+            self._live += index.add(value_hash, record["key"])
+
+    def _load_locked(self) -> Dict[str, HammingIndex]:
+        if self._indexes is not None:
+            return self._indexes
+        self._indexes = {}
+        if self.path is not None and self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    self._lines += 1
+        return self._indexes
+
+    def _append_locked(self, records: Iterable[Dict]) -> None:
+        for record in records:
+            self._apply(record)
+            if self.path is None:
+                continue
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            self._lines += 1
+        if self.path is not None and self._lines > 2 * self._live + 1000:
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        lines = 0
+        with open(temporary, "w", encoding="utf-8") as f:
+            for context, index in self._indexes.items():
+                for value_hash, key in index.items():
+                    f.write(json.dumps({"context": context, "hash": f"{value_hash:016x}", "key": key}) + "\n")
+                    lines += 1
+        os.replace(temporary, self.path)
+        self._lines = lines
+
+    def add(self, context: str, value_hash: int, key: str) -> None:
+        with self._lock:
+            self._load_locked()
+            existing = self._indexes.get(context)
+            if existing is not None and (value_hash, key) in existing:
+                return
+            self._append_locked([{"context": context, "hash": f"{value_hash:016x}", "key": key}])
+
+    def remove(self, context: str, value_hash: int, key: str) -> None:
+        with self._lock:
+            existing = self._load_locked().get(context)
+            if existing is None or (value_hash, key) not in existing:
+                return
+            self._append_locked([{"context": context, "hash": f"{value_hash:016x}", "key": key, "removed": True}])
+
+    def find(self, context: str, value_hash: int) -> List[Tuple[int, int, str]]:
+        """Entries of ``context`` within the distance threshold, nearest first"""
+        if self.max_distance < 0:
+            return []
+        with self._lock:
+            index = self._load_locked().get(context)
+            return index.search(value_hash, self.max_distance) if index is not None else []
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self._hits += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes = {}
+            self._lines = 0
+            self._live = 0
+            if self.path is not None:
+                self.path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._load_locked()
+            return {
+                "near_duplicate_entries": self._live,
+                "near_duplicate_hits": self._hits,
+            }
@@ -0,0 +1,205 @@
+"""
+Web renditions of finished renders.
+
+Generated images come back at full model resolution. After a render is
+stored, ``PostProcessor`` derives from it:
+
+- ``thumbnail``: a small WebP for galleries and lists;
+- ``display``: a WebP bounded to a typical viewport for the result view;
+- ``before``: the input photo at exactly the display size, so the
+  before/after slider lines up without downloading the original;
+- ``composite``: before and after side by side in one JPEG, for sharing and
+  comparison grids (optional).
+
+Resizing and encoding are CPU-bound, so they run in a process pool and only
+ever block the job worker waiting for them, never the event loop. Outputs
+are stored as content-addressed artifacts next to the render, and an index
+keyed by render and input remembers them so cache hits reuse them.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from akiya.artifacts import ArtifactStore
+
+THUMBNAIL_WIDTH = 320
+DISPLAY_WIDTH = 1280
+COMPOSITE_HEIGHT = 720
+COMPOSITE_GAP = 8
+QUALITY = 80
+
+
+def _encode(image, content_type: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if content_type == "image/webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _fit_width(image, width: int):
+    from PIL import Image
+
+    if image.width <= width:
+        return image
+    return image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+
+def _cover(image, size: Tuple[int, int]):
+    """Scale and centre-crop ``image`` to exactly ``size``"""
+    from PIL import Image, ImageOps
+
+    return ImageOps.fit(image, size, Image.LANCZOS)
+
+
+def make_renditions(
+    output: bytes, before: Optional[bytes] = None, composite: bool = True,
+    thumbnail_width: int = THUMBNAIL_WIDTH, display_width: int = DISPLAY_WIDTH,
+    composite_height: int = COMPOSITE_HEIGHT, quality: int = QUALITY,
+) -> Dict[str, Tuple[bytes, str, int, int]]:
+    """
+    Encode the renditions of one render; runs in a worker process.
+
+    Returns ``{name: (data, content_type, width, height)}``.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(output)) as opened:
+        after = opened.convert("RGB")
+    renditions = {}
+    display = _fit_width(after, display_width)
+    renditions["display"] = display
+    renditions["thumbnail"] = _fit_width(display, thumbnail_width)
+
+    original = None
+    if before:
+        with Image.open(io.BytesIO(before)) as opened:
+            opened.draft("RGB", display.size)
+            original = ImageOps.exif_transpose(opened).convert("RGB")
+        renditions["before"] = _cover(original, display.size)
+
+    encoded = {
+        name: (_encode(image, "image/webp", quality), "image/webp", image.width, image.height)
+        for name, image in renditions.items()
+    }
+
+    if original is not None and composite:
+        height = min(composite_height, after.height)
+        half = max(1, round(after.width * height / after.height))
+        sheet = Image.new("RGB", (2 * half + COMPOSITE_GAP, height), (255, 255, 255))
+        sheet.paste(_cover(original, (half, height)), (0, 0))
+        sheet.paste(after.resize((half, height), Image.LANCZOS), (half + COMPOSITE_GAP, 0))
+        encoded["composite"] = (_encode(sheet, "image/jpeg", quality + 5), "image/jpeg", sheet.width, sheet.height)
+    return encoded
+
+
+class PostProcessor:
+    """
+    Runs ``make_renditions`` in a process pool and stores the results.
+
+    ``max_workers=0`` processes in the calling thread, for hosts that cannot
+    start processes. The pool is created on first use with the forkserver
+    method, which is safe to use from a multi-threaded server. If it cannot
+    be started, processing falls back to the calling thread for good.
+    """
+
+    def __init__(
+        self, store: ArtifactStore, index_dir: Optional[Path], url_prefix: str,
+        max_workers: int = 2, composite: bool = True,
+    ):
+        self.store = store
+        self.index_dir = Path(index_dir) if index_dir is not None else None
+        self.url_prefix = url_prefix
+        self.max_workers = max_workers
+        self.composite = composite
+        self.processed = 0
+        self.reused = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context(method)
+                )
+            return self._executor
+
+    def _index_path(self, output_id: str, before_digest: Optional[str]) -> Path:
+        settings = f"{THUMBNAIL_WIDTH}:{DISPLAY_WIDTH}:{COMPOSITE_HEIGHT}:{QUALITY}:{self.composite}"
+        key = hashlib.sha256(f"{output_id}\0{before_digest}\0{settings}".encode("utf-8")).hexdigest()
+        return self.index_dir / key[:2] / f"{key}.json"
+
+    def _load(self, path: Path) -> Optional[Dict[str, Dict]]:
+        try:
+            renditions = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        # Only while every artifact is still there
+        for rendition in renditions.values():
+            if self.store.get(rendition["url"][len(self.url_prefix):]) is None:
+                return None
+        return renditions
+
+    def renditions(
+        self, output_id: str, output: bytes, before: Optional[bytes] = None, before_digest: Optional[str] = None,
+    ) -> Dict[str, Dict]:
+        """
+        ``{name: {"url", "width", "height"}}`` of the renditions of a stored
+        render, made now or reused from an earlier call. Blocks until done.
+        """
+        path = self._index_path(output_id, before_digest if before else None) if self.index_dir else None
+        if path is not None:
+            existing = self._load(path)
+            if existing is not None:
+                with self._lock:
+                    self.reused += 1
+                return existing
+
+        options = {"before": before, "composite": self.composite}
+        encoded = None
+        if self.max_workers > 0:
+            try:
+                future = self.executor.submit(make_renditions, output, **options)
+            except (OSError, NotImplementedError) as e:
+                # No /dev/shm or no process support (serverless): don't try again every render
+                logging.warning(f"Post-processing pool unavailable, encoding in-process: {e}")
+                self.max_workers = 0
+                self.shutdown()
+            else:
+                encoded = future.result()
+        if encoded is None:
+            encoded = make_renditions(output, **options)
+        renditions = {}
+        for name, (data, content_type, width, height) in encoded.items():
+            artifact = self.store.put(data, content_type)
+            renditions[name] = {"url": f"{self.url_prefix}{artifact.id}", "width": width, "height": height}
+
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            temporary.write_text(json.dumps(renditions), encoding="utf-8")
+            os.replace(temporary, path)
+        with self._lock:
+            self.processed += 1
+        return renditions
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"renditions_processed": self.processed, "renditions_reused": self.reused}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
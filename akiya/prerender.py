@@ -0,0 +1,259 @@
+"""
+Offline renders of every demo image in every style.
+
+Demo renovations have a finite set of inputs, so ``python -m akiya.prerender
+build`` renders all demo image x style combinations ahead of time with the
+configured backend and writes them to ``public/prerendered/`` with a manifest.
+Each entry records the render cache key it was made for; entries whose key
+still matches (same input image, prompts, steps and model version) are
+skipped, so an interrupted or repeated run only renders what is missing or
+stale. The manifest is rewritten after every finished render.
+
+The app answers demo renovations from the manifest without an upstream
+prediction and without charging the renovate rate limit.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from akiya.backends import InferenceBackend, RenderInput, get_backend, read_output
+from akiya.cache import render_cache_key
+from akiya.styles import NEGATIVE_PROMPT, NUM_INFERENCE_STEPS, RENOVATION_STYLES
+from akiya.uploads import sniff_image_type
+
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+
+
+def render_key(source_digest: str, style: str, model_version: str) -> str:
+    """Render cache key of a demo render, from the current prompts"""
+    return render_cache_key(
+        image_digest=source_digest,
+        style=style,
+        prompt=RENOVATION_STYLES[style]["prompt"],
+        negative_prompt=NEGATIVE_PROMPT,
+        num_inference_steps=NUM_INFERENCE_STEPS,
+        model_version=model_version,
+    )
+
+
+def load_manifest(path: Path) -> Dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    return {"directory": manifest.get("directory", "prerendered"), "renders": manifest.get("renders", {})}
+
+
+def save_manifest(path: Path, manifest: Dict) -> None:
+    """Write the manifest atomically, so an interrupted run never leaves a broken file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    os.replace(temporary, path)
+
+
+class Prerendered:
+    """
+    Lookup of prerendered demo renders by source image URL and style.
+
+    ``digest_for(source)`` returns the digest of the image the app would send
+    upstream for ``source``; an entry is only used when it was rendered from
+    that image with the current prompts and ``model_version``. The manifest
+    is read on the first lookup, keeping it off the cold start path.
+    """
+
+    def __init__(
+        self, manifest_path: Path, public_dir: Path, model_version: str,
+        digest_for: Callable[[str], str],
+    ):
+        self.manifest_path = Path(manifest_path)
+        self.public_dir = Path(public_dir)
+        self.model_version = model_version
+        self.digest_for = digest_for
+        self._renders: Optional[Dict[str, Dict[str, Dict]]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Dict]]:
+        manifest = load_manifest(self.manifest_path)
+        directory = manifest["directory"]
+        renders: Dict[str, Dict[str, Dict]] = {}
+        for source, styles in manifest["renders"].items():
+            digest = self.digest_for(source)
+            for style, entry in styles.items():
+                if style not in RENOVATION_STYLES or entry.get("model_version") != self.model_version:
+                    continue
+                if entry.get("key") != render_key(digest, style, self.model_version):
+                    continue
+                if not (self.public_dir / directory / entry["file"]).is_file():
+                    continue
+                renders.setdefault(source, {})[style] = {**entry, "asset": f"{directory}/{entry['file']}"}
+        return renders
+
+    def lookup(self, source: str, style: str) -> Optional[Dict]:
+        """The manifest entry, with its asset name under ``asset``; None when not prerendered"""
+        if self._renders is None:
+            with self._lock:
+                if self._renders is None:
+                    self._renders = self._load()
+        return self._renders.get(source, {}).get(style)
+
+
+@dataclass
+class Task:
+    source: str     # demo image URL, e.g. /public/demo1.jpg
+    style: str
+    path: Path      # the image sent upstream for it
+    digest: str
+    key: str
+
+
+def plan(
+    inputs: Dict[str, Path], styles: Iterable[str], manifest: Dict, output_dir: Path,
+    model_version: str, force: bool = False,
+) -> List[Task]:
+    """Renders that are missing or stale"""
+    tasks = []
+    for source, path in inputs.items():
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        for style in styles:
+            key = render_key(digest, style, model_version)
+            entry = manifest["renders"].get(source, {}).get(style)
+            if (
+                not force and entry is not None and entry.get("key") == key
+                and (output_dir / entry["file"]).is_file()
+            ):
+                continue
+            tasks.append(Task(source, style, path, digest, key))
+    return tasks
+
+
+def _download(url: str) -> bytes:
+    import httpx
+
+    response = httpx.get(url, timeout=60.0, follow_redirects=True)
+    response.raise_for_status()
+    return response.content
+
+
+def render(backend: InferenceBackend, task: Task, output_dir: Path) -> Dict:
+    """Render one task and write the output file; returns its manifest entry"""
+    content = task.path.read_bytes()
+    content_type = sniff_image_type(content[:16]) or "image/jpeg"
+    prepared = RenderInput(
+        data=task.source,
+        digest=task.digest,
+        # Sent inline: an offline job has no public URL for the demo image
+        input=f"data:{content_type};base64,{base64.b64encode(content).decode('ascii')}",
+        content=content,
+    )
+    output = backend.predict(
+        prepared,
+        style=task.style,
+        prompt=RENOVATION_STYLES[task.style]["prompt"],
+        negative_prompt=NEGATIVE_PROMPT,
+        num_inference_steps=NUM_INFERENCE_STEPS,
+    )
+    data, url = read_output(output)
+    if data is None and url:
+        data = _download(url)
+    if not data:
+        raise ValueError("prediction returned no image")
+    output_type = sniff_image_type(data[:16]) or "image/png"
+    name = f"{Path(task.source).stem}-{task.style}{EXTENSIONS.get(output_type, '.png')}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / name).write_bytes(data)
+    return {
+        "file": name,
+        "key": task.key,
+        "source_sha256": task.digest,
+        "model_version": backend.version,
+        "content_type": output_type,
+        "bytes": len(data),
+    }
+
+
+def run(
+    backend: InferenceBackend, tasks: List[Task], output_dir: Path, manifest_path: Path, manifest: Dict,
+    concurrency: int = 4, report: Callable[[str], None] = print,
+) -> int:
+    """Render ``tasks`` with at most ``concurrency`` in flight; returns the number of failures"""
+    lock = threading.Lock()
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(render, backend, task, output_dir): task for task in tasks}
+        for done, future in enumerate(as_completed(futures), start=1):
+            task = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                failures += 1
+                logging.error(f"Prerender of {task.source} in {task.style} failed: {e}")
+                report(f"[{done}/{len(tasks)}] {task.source} {task.style}: failed")
+                continue
+            with lock:
+                manifest["renders"].setdefault(task.source, {})[task.style] = entry
+                # Saved after every render so an interrupted run can resume
+                save_manifest(manifest_path, manifest)
+            report(f"[{done}/{len(tasks)}] {task.source} {task.style}: {entry['file']}")
+    return failures
+
+
+def demo_inputs(catalog_path: Path, public_dir: Path, variants_path: Path) -> Dict[str, Path]:
+    """Image sent upstream for every demo image: its model-resolution rendition when built"""
+    from akiya.variants import load_manifest as load_variant_manifest, model_inputs
+
+    with open(catalog_path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    models = model_inputs(load_variant_manifest(variants_path), public_dir)
+    inputs = {}
+    for group in catalog.get("demo_images", {}).values():
+        for image in group:
+            url = image["url"]
+            if url.startswith("/public/"):
+                inputs[url] = public_dir / models.get(url, url)[len("/public/"):]
+    return inputs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prerender demo renovations")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="render every demo image in every style")
+    build_parser.add_argument("--catalog", type=Path, default=Path("data/catalog.json"))
+    build_parser.add_argument("--public", type=Path, default=Path("public"))
+    build_parser.add_argument("--variants", type=Path, default=Path("data/demo-variants.json"))
+    build_parser.add_argument("--output", type=Path, default=Path("public/prerendered"))
+    build_parser.add_argument("--manifest", type=Path, default=Path("data/prerendered.json"))
+    build_parser.add_argument("--concurrency", type=int, default=4, help="predictions in flight")
+    build_parser.add_argument("--style", action="append", choices=sorted(RENOVATION_STYLES), help="only these styles")
+    build_parser.add_argument("--force", action="store_true", help="render up-to-date entries again")
+    args = parser.parse_args()
+
+    backend = get_backend()
+    if backend.name == "mock":
+        raise SystemExit("The mock backend only echoes its input; set REPLICATE_API_TOKEN or INFERENCE_BACKEND")
+
+    manifest = load_manifest(args.manifest)
+    manifest["directory"] = args.output.relative_to(args.public).as_posix()
+    inputs = demo_inputs(args.catalog, args.public, args.variants)
+    tasks = plan(inputs, args.style or list(RENOVATION_STYLES), manifest, args.output, backend.version, args.force)
+    print(f"{len(tasks)} of {len(inputs) * len(args.style or RENOVATION_STYLES)} renders to do with {backend.name}")
+    failures = run(backend, tasks, args.output, args.manifest, manifest, concurrency=args.concurrency)
+    if not tasks:
+        save_manifest(args.manifest, manifest)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
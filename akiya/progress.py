@@ -0,0 +1,99 @@
+"""
+Fan-out of job progress events to Server-Sent Events subscribers.
+
+Events are published from job worker threads and delivered to subscribers
+on the event loop with ``call_soon_threadsafe``. A subscriber is just a
+small ``asyncio.Queue``, so thousands of idle connections cost no threads
+and no polling. Slow subscribers lose their oldest undelivered events
+instead of growing without bound; every event carries the full job state,
+so only intermediate steps are skipped.
+"""
+import asyncio
+import json
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Set
+
+
+def sse_message(data: Dict[str, Any], event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """One Server-Sent Events message with a JSON payload"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscription:
+    """Events for one key, read on the loop the subscription was made on"""
+
+    def __init__(self, broker: "ProgressBroker", key: Hashable, max_pending: int):
+        self.broker = broker
+        self.key = key
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+
+    def _offer(self, event: Dict[str, Any]) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """The next event, or None when none arrives within ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.broker._unsubscribe(self)
+
+
+class ProgressBroker:
+    """Thread-safe publish, loop-side subscribe, keyed by job id"""
+
+    def __init__(self, max_pending: int = 32):
+        self.max_pending = max_pending
+        self._subscribers: Dict[Hashable, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key: Hashable) -> Subscription:
+        """Subscribe to ``key``; must be called on the event loop. Close it when done."""
+        subscription = Subscription(self, key, self.max_pending)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.key]
+
+    def keys(self) -> List[Hashable]:
+        """Keys with at least one subscriber"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, key: Hashable, event: Dict[str, Any]) -> None:
+        """Deliver ``event`` to every subscriber of ``key``; callable from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._offer, event)
+            except RuntimeError:
+                # Its loop is closed; nobody is reading any more
+                self._unsubscribe(subscription)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._subscribers
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
@@ -0,0 +1,283 @@
+"""
+Token-bucket rate limiting with pluggable shared stores.
+
+Each named limit ("default", "renovate", ...) is a bucket per client that
+holds up to ``capacity`` tokens and refills continuously. A request takes
+``cost`` tokens, so an expensive request (a multi-style batch) uses more of
+the budget than a cheap one. Refill-and-take is a single atomic O(1)
+operation in the store:
+
+- ``MemoryStore``: in-process, for a single worker
+- ``SQLiteStore``: a SQLite file, shared by every worker on the host. SQLite's
+  file locking makes the refill-and-take atomic across processes.
+
+A networked store (Redis or similar) implements the same ``take`` method,
+for example as a server-side script, so budgets are shared by every
+serverless instance.
+
+Allowed and rejected responses carry ``X-RateLimit-Limit`` and
+``X-RateLimit-Remaining``. Rejections are 429s with ``Retry-After``.
+"""
+import math
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    name: str
+    capacity: int
+    period: float  # seconds to refill an empty bucket
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.period
+
+    def describe(self) -> str:
+        unit = next((name for name, seconds in _PERIODS.items() if seconds == self.period), None)
+        return f"{self.capacity} per 1 {unit}" if unit else f"{self.capacity} per {self.period:g} seconds"
+
+
+def parse_rate(name: str, spec: str) -> RateLimit:
+    """Parse "10/hour" style specs"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(second|minute|hour|day)\s*", spec)
+    if not match:
+        raise ValueError(f"Invalid rate limit: {spec}")
+    return RateLimit(name, int(match.group(1)), float(_PERIODS[match.group(2)]))
+
+
+@dataclass(frozen=True)
+class TakeResult:
+    allowed: bool
+    remaining: float
+    retry_after: float  # seconds until ``cost`` tokens are available (0 when allowed)
+
+
+def _refill_and_take(tokens: float, updated: float, now: float, capacity: int, rate: float, cost: float):
+    tokens = min(float(capacity), tokens + max(0.0, now - updated) * rate)
+    if tokens >= cost:
+        # A negative cost is a refund, which never overfills the bucket
+        return True, min(float(capacity), tokens - cost), 0.0
+    return False, tokens, (cost - tokens) / rate
+
+
+class BucketStore:
+    """Interface for bucket storage"""
+
+    def take(self, key: str, capacity: int, rate: float, cost: float, now: float) -> TakeResult:
+        """Atomically refill the bucket ``key`` up to ``now`` and take ``cost`` tokens if available"""
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryStore(BucketStore):
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost, now):
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (float(capacity), now, now))
+            allowed, tokens, retry_after = _refill_and_take(tokens, updated, now, capacity, rate, cost)
+            # Remember when the bucket will be full again so idle buckets can be dropped
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self._buckets) > self.max_keys:
+                self._prune_locked(now)
+            return TakeResult(allowed, tokens, retry_after)
+
+    def _prune_locked(self, now: float) -> None:
+        full = [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]
+        for key in full:
+            del self._buckets[key]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteStore(BucketStore):
+    """Buckets in a SQLite table, shared by all processes using the same file"""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._takes = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, rate, cost, now):
+        connection = self.connection
+        # BEGIN IMMEDIATE takes the write lock up front, so the read and the
+        # update below cannot interleave with another process
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (float(capacity), now)
+            allowed, tokens, retry_after = _refill_and_take(tokens, updated, now, capacity, rate, cost)
+            connection.execute(
+                "INSERT INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, "
+                "updated = excluded.updated, full_at = excluded.full_at",
+                (key, tokens, now, now + (capacity - tokens) / rate),
+            )
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                connection.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return TakeResult(allowed, tokens, retry_after)
+
+    def reset(self) -> None:
+        self.connection.execute("DELETE FROM buckets")
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, limit: RateLimit, result: TakeResult):
+        super().__init__(f"Rate limit exceeded: {limit.describe()}")
+        self.limit = limit
+        self.result = result
+
+
+def client_address(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """Applies named limits to requests, keyed per client"""
+
+    def __init__(
+        self,
+        store: BucketStore,
+        limits: Dict[str, RateLimit],
+        key_func: Callable[[Request], str] = client_address,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.store = store
+        self.limits = limits
+        self.key_func = key_func
+        self.clock = clock
+        self.enabled = True
+
+    def hit(self, request: Request, name: str = "default", cost: float = 1) -> TakeResult:
+        """
+        Take ``cost`` tokens from the caller's ``name`` bucket.
+
+        Costs above the bucket capacity are clamped to it, so the most
+        expensive request empties the budget instead of never fitting.
+        Raises ``RateLimitExceeded`` when the budget is exhausted.
+        """
+        limit = self.limits[name]
+        if not self.enabled:
+            return TakeResult(True, float(limit.capacity), 0.0)
+        cost = min(float(cost), float(limit.capacity))
+        result = self.store.take(
+            f"{name}:{self.key_func(request)}", limit.capacity, limit.refill_rate, cost, self.clock()
+        )
+        # Picked up by RateLimitHeadersMiddleware when the response starts
+        request.state.rate_limit = (limit, result)
+        if not result.allowed:
+            raise RateLimitExceeded(limit, result)
+        return result
+
+    async def hit_async(self, request: Request, name: str = "default", cost: float = 1) -> TakeResult:
+        """``hit`` for async endpoints: the store may block (SQLite), so it runs in a thread"""
+        return await run_in_threadpool(self.hit, request, name, cost)
+
+    def refund(self, request: Request, name: str = "default", cost: float = 1) -> None:
+        """Give back tokens taken by ``hit`` for work that was not done after all"""
+        limit = self.limits[name]
+        if not self.enabled:
+            return
+        cost = min(float(cost), float(limit.capacity))
+        result = self.store.take(
+            f"{name}:{self.key_func(request)}", limit.capacity, limit.refill_rate, -cost, self.clock()
+        )
+        request.state.rate_limit = (limit, result)
+
+    async def refund_async(self, request: Request, name: str = "default", cost: float = 1) -> None:
+        await run_in_threadpool(self.refund, request, name, cost)
+
+    def dependency(self, name: str = "default", cost: float = 1):
+        """FastAPI dependency charging a fixed cost before the endpoint runs"""
+        def check(request: Request) -> None:
+            self.hit(request, name, cost)
+        return check
+
+    def reset(self) -> None:
+        self.store.reset()
+
+
+def rate_limit_headers(limit: RateLimit, result: TakeResult) -> Dict[str, str]:
+    headers = {
+        "X-RateLimit-Limit": str(limit.capacity),
+        "X-RateLimit-Remaining": str(int(math.floor(result.remaining))),
+    }
+    if not result.allowed:
+        headers["Retry-After"] = str(max(1, math.ceil(result.retry_after)))
+    return headers
+
+
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.result.retry_after)))},
+    )
+
+
+class RateLimitHeadersMiddleware:
+    """Adds the remaining budget of the limit charged during the request to the response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message) -> None:
+            if message["type"] == "http.response.start":
+                charged = (scope.get("state") or {}).get("rate_limit")
+                if charged is not None:
+                    existing = {name.lower() for name, _ in message.get("headers") or ()}
+                    extra = [
+                        (name.lower().encode("latin-1"), value.encode("latin-1"))
+                        for name, value in rate_limit_headers(*charged).items()
+                        if name.lower().encode("latin-1") not in existing
+                    ]
+                    message["headers"] = list(message.get("headers") or ()) + extra
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,368 @@
+"""
+Shared HTTP connection pool and prefetching of remote input images.
+
+``HttpPool`` holds one keep-alive pool for the whole process: an
+``httpx.AsyncClient`` for requests made on the event loop and a sync
+transport for the blocking Replicate client on the worker threads. HTTP/2 is
+used when the optional ``h2`` package is installed. The app opens the pool
+at startup and closes it at shutdown.
+
+``RemoteImages`` downloads ``http(s)`` input images so they can be sent to
+the model inline instead of by URL. Downloads are capped in size, only go to
+public addresses (connecting, through ``PinnedBackend``, to the address that
+was checked, so a second DNS answer cannot point elsewhere), and are cached
+on disk with their validators, so a repeat is answered from the cache while
+fresh and revalidated with a conditional GET
+(``If-None-Match``/``If-Modified-Since``) after that.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from akiya.uploads import sniff_image_type
+
+MAX_REDIRECTS = 3
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class HttpPool:
+    """One connection pool shared by every outgoing request of the process"""
+
+    def __init__(
+        self, max_connections: int = 100, max_keepalive: int = 20, keepalive_expiry: float = 30.0,
+        timeout: float = 30.0, async_transport=None,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        # Replaces the network transport of the async client, e.g. in tests
+        self.async_transport = async_transport
+        self._client = None
+        self._transport = None
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        import httpx
+
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def client(self):
+        """The shared async client, created on first use when the app did not open it"""
+        with self._lock:
+            if self._client is None:
+                import httpx
+
+                self._client = httpx.AsyncClient(
+                    http2=http2_available(),
+                    limits=self._limits(),
+                    transport=self.async_transport or pinned_transport(http2_available(), self._limits()),
+                    timeout=httpx.Timeout(self.timeout, connect=5.0),
+                    # Redirects are followed by hand so every hop is checked
+                    follow_redirects=False,
+                )
+            return self._client
+
+    @property
+    def transport(self):
+        """Shared sync transport for blocking clients such as Replicate's"""
+        with self._lock:
+            if self._transport is None:
+                import httpx
+
+                self._transport = httpx.HTTPTransport(http2=http2_available(), limits=self._limits())
+            return self._transport
+
+    def start(self) -> None:
+        self.client
+
+    async def aclose(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+            transport, self._transport = self._transport, None
+        if client is not None:
+            await client.aclose()
+        if transport is not None:
+            transport.close()
+
+
+# The (hostname, vetted address) a connection opened by this task must use
+_pinned_address: ContextVar[Optional[Tuple[str, str]]] = ContextVar("pinned_address", default=None)
+
+
+class PinnedBackend:
+    """
+    httpcore network backend that connects to the vetted address of a host.
+
+    The URL keeps its hostname, so the pool keys connections by hostname and
+    TLS checks the certificate against it; only the TCP connect goes to the
+    address ``check_host`` approved, instead of resolving the name again.
+    Connections of other hosts (or without a pinned address) resolve as usual.
+    """
+
+    def __init__(self):
+        import httpcore
+
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host: str, port: int, timeout=None, local_address=None, socket_options=None):
+        pinned = _pinned_address.get()
+        if pinned is not None and pinned[0] == host:
+            host = pinned[1]
+        return await self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+
+    async def connect_unix_socket(self, path: str, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+def pinned_transport(http2: bool, limits):
+    """An ``httpx.AsyncHTTPTransport`` whose connections go through ``PinnedBackend``"""
+    import httpcore
+    import httpx
+
+    transport = httpx.AsyncHTTPTransport(http2=http2, limits=limits)
+    # httpx has no option for the network backend, so its pool is replaced
+    transport._pool = httpcore.AsyncConnectionPool(
+        ssl_context=httpx.create_ssl_context(),
+        max_connections=limits.max_connections,
+        max_keepalive_connections=limits.max_keepalive_connections,
+        keepalive_expiry=limits.keepalive_expiry,
+        http1=True,
+        http2=http2,
+        network_backend=PinnedBackend(),
+    )
+    return transport
+
+
+class RemoteImageError(Exception):
+    """A remote input image that cannot be used, with the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def public_address_only(host: str) -> str:
+    """
+    Refuse hosts that resolve to loopback, private, link-local or reserved
+    addresses; returns the vetted address the request must connect to.
+    """
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, None)]
+    except (socket.gaierror, UnicodeError):
+        raise RemoteImageError(400, "画像のURLに接続できません")
+    if not addresses:
+        raise RemoteImageError(400, "画像のURLに接続できません")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global:
+            raise RemoteImageError(400, "画像のURLに接続できません")
+    return addresses[0].split("%")[0]
+
+
+def _max_age(cache_control: Optional[str]) -> float:
+    if not cache_control or "no-store" in cache_control or "no-cache" in cache_control:
+        return 0.0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return float(match.group(1)) if match else 0.0
+
+
+@dataclass
+class CachedImage:
+    content: bytes
+    content_type: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fresh_until: float = 0.0
+
+
+class RemoteImages:
+    """
+    Size-capped, revalidating fetcher for remote input images.
+
+    Entries live in ``directory`` as ``<sha256 of url>.bin`` with a JSON
+    sidecar of validators; the oldest beyond ``max_entries`` are removed.
+    ``check_host`` runs (in a thread) before every request and redirect hop
+    and returns the address to connect to, or None to connect by name.
+    """
+
+    def __init__(
+        self, pool: HttpPool, directory: Optional[Path], max_bytes: int = 15 * 1024 * 1024,
+        max_entries: int = 500, check_host: Callable[[str], Optional[str]] = public_address_only,
+    ):
+        self.pool = pool
+        self.directory = Path(directory) if directory is not None else None
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.check_host = check_host
+        self.counts = {"remote_fetches": 0, "remote_fresh_hits": 0, "remote_revalidated": 0}
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str):
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.directory / f"{name}.bin", self.directory / f"{name}.json"
+
+    def _load(self, url: str) -> Optional[CachedImage]:
+        if self.directory is None:
+            return None
+        content_path, meta_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            content = content_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        return CachedImage(content, meta["content_type"], meta.get("etag"), meta.get("last_modified"), meta.get("fresh_until", 0.0))
+
+    def _store(self, url: str, image: CachedImage) -> None:
+        if self.directory is None:
+            return
+        content_path, meta_path = self._paths(url)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "url": url,
+            "content_type": image.content_type,
+            "etag": image.etag,
+            "last_modified": image.last_modified,
+            "fresh_until": image.fresh_until,
+        }
+        # Unique temporary names: the same URL may be fetched by two requests at once
+        suffix = f".{threading.get_ident()}.tmp"
+        temporary = content_path.with_name(content_path.name + suffix)
+        temporary.write_bytes(image.content)
+        os.replace(temporary, content_path)
+        temporary = meta_path.with_name(meta_path.name + suffix)
+        temporary.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(temporary, meta_path)
+        self._prune()
+
+    def _prune(self) -> None:
+        with self._lock:
+            entries = []
+            for meta_path in self.directory.glob("*.json"):
+                try:
+                    entries.append((meta_path.stat().st_mtime, meta_path))
+                except OSError:
+                    continue
+            entries.sort()
+            for _, meta_path in entries[: max(0, len(entries) - self.max_entries)]:
+                meta_path.unlink(missing_ok=True)
+                meta_path.with_suffix(".bin").unlink(missing_ok=True)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _validators(self, response, cached: Optional[CachedImage], content: bytes, content_type: str) -> CachedImage:
+        fresh_until = time.time() + _max_age(response.headers.get("cache-control"))
+        return CachedImage(
+            content=content,
+            content_type=content_type,
+            etag=response.headers.get("etag") or (cached.etag if cached else None),
+            last_modified=response.headers.get("last-modified") or (cached.last_modified if cached else None),
+            fresh_until=fresh_until,
+        )
+
+    async def _read_capped(self, response) -> bytes:
+        declared = response.headers.get("content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            raise RemoteImageError(413, "画像ファイルが大きすぎます")
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if received > self.max_bytes:
+                raise RemoteImageError(413, "画像ファイルが大きすぎます")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    @asynccontextmanager
+    async def _stream(self, url: str, headers: Dict[str, str], address: Optional[str]):
+        """Stream a GET of ``url``; a new connection for it goes to ``address``"""
+        pinned = _pinned_address.set((urlsplit(url).hostname, address) if address else None)
+        try:
+            async with self.pool.client.stream("GET", url, headers=headers) as response:
+                yield response
+        finally:
+            _pinned_address.reset(pinned)
+
+    async def fetch(self, url: str) -> CachedImage:
+        """The image at ``url``, from the cache when still fresh or confirmed unchanged"""
+        import httpx
+
+        cached = await asyncio.to_thread(self._load, url)
+        if cached is not None and cached.fresh_until > time.time():
+            self._count("remote_fresh_hits")
+            return cached
+
+        headers = {"Accept": "image/*"}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        target = url
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                parts = urlsplit(target)
+                if parts.scheme not in ("http", "https") or not parts.hostname:
+                    raise RemoteImageError(400, "画像のURLが不正です")
+                # Connect to the address that was checked, not to whatever the name resolves to next
+                address = await asyncio.to_thread(self.check_host, parts.hostname)
+                async with self._stream(target, headers, address) as response:
+                    if response.is_redirect and "location" in response.headers:
+                        target = urljoin(target, response.headers["location"])
+                        continue
+                    if response.status_code == 304 and cached is not None:
+                        self._count("remote_revalidated")
+                        image = self._validators(response, cached, cached.content, cached.content_type)
+                        await asyncio.to_thread(self._store, url, image)
+                        return image
+                    if response.status_code != 200:
+                        raise RemoteImageError(400, "画像を取得できませんでした")
+                    content = await self._read_capped(response)
+                    break
+            else:
+                raise RemoteImageError(400, "画像を取得できませんでした")
+        except httpx.HTTPError as e:
+            logging.warning(f"Fetching remote image failed: {e}")
+            raise RemoteImageError(400, "画像を取得できませんでした")
+
+        content_type = sniff_image_type(content[:16])
+        if content_type is None:
+            raise RemoteImageError(415, "対応していない画像形式です")
+        self._count("remote_fetches")
+        image = self._validators(response, cached, content, content_type)
+        await asyncio.to_thread(self._store, url, image)
+        return image
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
@@ -0,0 +1,372 @@
+"""
+SQLite-backed listing repository.
+
+Listings keep their display strings ("3,800万円", "180㎡", "築80年") next to
+normalized numeric columns (yen, m², years) that are indexed for filtering
+and sorting. Queries are keyset-paginated, so deep pages cost the same as the
+first one. Uploaded and generated images are linked to their house and looked
+up by primary key.
+
+Only the standard library is used. One connection is kept per thread, and the
+database runs in WAL mode so several workers can read while one writes.
+
+Import listings from a JSON file (a list of house records, or an object with
+a ``houses`` list)::
+
+    python -m akiya.repository import listings.json --db /path/to/akiya.db
+"""
+import argparse
+import base64
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS houses (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    address TEXT NOT NULL DEFAULT '',
+    ward TEXT,
+    price TEXT NOT NULL DEFAULT '',
+    area TEXT NOT NULL DEFAULT '',
+    age TEXT NOT NULL DEFAULT '',
+    price_yen INTEGER,
+    area_m2 REAL,
+    age_years INTEGER,
+    description TEXT NOT NULL DEFAULT '',
+    house_type TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_houses_ward ON houses (ward, id);
+CREATE INDEX IF NOT EXISTS idx_houses_price ON houses (price_yen, id);
+CREATE INDEX IF NOT EXISTS idx_houses_area ON houses (area_m2, id);
+CREATE INDEX IF NOT EXISTS idx_houses_age ON houses (age_years, id);
+CREATE TABLE IF NOT EXISTS house_images (
+    id TEXT PRIMARY KEY,
+    house_id TEXT NOT NULL REFERENCES houses (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    url TEXT NOT NULL,
+    style TEXT,
+    source TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_house_images_house ON house_images (house_id, kind, created_at);
+"""
+
+# Sort keys accepted by list_houses, mapped to their column
+SORT_COLUMNS = {
+    "id": "id",
+    "price": "price_yen",
+    "area": "area_m2",
+    "age": "age_years",
+}
+
+IMAGE_UPLOAD = "upload"
+IMAGE_GENERATED = "generated"
+
+
+def parse_price_yen(text: str) -> Optional[int]:
+    """"3,800万円" -> 38000000, "1億2,000万円" -> 120000000"""
+    if not text:
+        return None
+    cleaned = text.replace(",", "").replace("，", "").strip()
+    match = re.fullmatch(r"(?:(\d+(?:\.\d+)?)億)?(?:(\d+(?:\.\d+)?)万)?(\d+)?円?", cleaned)
+    if not match or not any(match.groups()):
+        return None
+    oku, man, yen = match.groups()
+    total = 0.0
+    if oku:
+        total += float(oku) * 100_000_000
+    if man:
+        total += float(man) * 10_000
+    if yen:
+        total += int(yen)
+    return int(round(total))
+
+
+def parse_area_m2(text: str) -> Optional[float]:
+    """"180㎡" -> 180.0"""
+    match = re.search(r"(\d+(?:\.\d+)?)", (text or "").replace(",", ""))
+    return float(match.group(1)) if match else None
+
+
+def parse_age_years(text: str) -> Optional[int]:
+    """"築80年" -> 80, "新築" -> 0"""
+    if text and "新築" in text:
+        return 0
+    match = re.search(r"(\d+)", text or "")
+    return int(match.group(1)) if match else None
+
+
+def parse_ward(address: str) -> Optional[str]:
+    """"東京都世田谷区" -> "世田谷区" (the municipality after the prefecture)"""
+    match = re.match(r"^(?:.+?[都道府県])?(.+?[区市町村])", address or "")
+    return match.group(1) if match else None
+
+
+def encode_cursor(values: Tuple[Any, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """The sort value and house id of a cursor; ValueError for anything we did not issue"""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Malformed cursor")
+    value, house_id = values
+    # Bound straight into the keyset comparison, so only plain scalars
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, type(None))) or not isinstance(house_id, str):
+        raise ValueError("Malformed cursor")
+    return value, house_id
+
+
+class Repository:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path), timeout=10.0, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            with self._init_lock:
+                if not self._initialized:
+                    connection.executescript(SCHEMA)
+                    self._initialized = True
+            self._local.connection = connection
+        return connection
+
+    def _write(self, statements: Iterable[Tuple[str, tuple]]) -> int:
+        """
+        Run statements in one transaction; the revision counter is bumped
+        only when they changed a row. Returns the number of rows changed.
+        """
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            before = connection.total_changes
+            for sql, params in statements:
+                connection.execute(sql, params)
+            changed = connection.total_changes - before
+            if changed:
+                connection.execute(
+                    "INSERT INTO meta (key, value) VALUES ('revision', 1) "
+                    "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return changed
+
+    def revision(self) -> int:
+        """Counter bumped by every write, from any process sharing the database"""
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        return row["value"] if row else 0
+
+    # Houses
+
+    def upsert_houses(self, records: Iterable[Dict[str, Any]]) -> int:
+        statements = []
+        for record in records:
+            statements.append((
+                """
+                INSERT INTO houses (id, name, address, ward, price, area, age,
+                                    price_yen, area_m2, age_years, description, house_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    name = excluded.name, address = excluded.address, ward = excluded.ward,
+                    price = excluded.price, area = excluded.area, age = excluded.age,
+                    price_yen = excluded.price_yen, area_m2 = excluded.area_m2,
+                    age_years = excluded.age_years, description = excluded.description,
+                    house_type = excluded.house_type
+                """,
+                (
+                    record["id"],
+                    record["name"],
+                    record.get("address", ""),
+                    record.get("ward") or parse_ward(record.get("address", "")),
+                    record.get("price", ""),
+                    record.get("area", ""),
+                    record.get("age", ""),
+                    record.get("price_yen", parse_price_yen(record.get("price", ""))),
+                    record.get("area_m2", parse_area_m2(record.get("area", ""))),
+                    record.get("age_years", parse_age_years(record.get("age", ""))),
+                    record.get("description", ""),
+                    record.get("house_type"),
+                ),
+            ))
+        if statements:
+            self._write(statements)
+        return len(statements)
+
+    def get_house(self, house_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute("SELECT * FROM houses WHERE id = ?", (house_id,)).fetchone()
+        return dict(row) if row else None
+
+    def house_exists(self, house_id: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM houses WHERE id = ?", (house_id,)).fetchone() is not None
+
+    def list_houses(
+        self,
+        ward: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        min_area: Optional[float] = None,
+        max_area: Optional[float] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+        sort: str = "id",
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Filtered, sorted, keyset-paginated listing query.
+
+        ``sort`` is one of ``SORT_COLUMNS``, prefixed with ``-`` for
+        descending order. Listings without a parsed value for the sort column
+        are left out of that ordering. Returns the rows and the cursor of the
+        next page (None on the last page).
+        """
+        descending = sort.startswith("-")
+        column = SORT_COLUMNS.get(sort.lstrip("-"))
+        if column is None:
+            raise ValueError(f"Unknown sort key: {sort}")
+
+        clauses, params = [], []
+        for condition, value in (
+            ("ward = ?", ward),
+            ("price_yen >= ?", min_price),
+            ("price_yen <= ?", max_price),
+            ("area_m2 >= ?", min_area),
+            ("area_m2 <= ?", max_area),
+            ("age_years >= ?", min_age),
+            ("age_years <= ?", max_age),
+        ):
+            if value is not None:
+                clauses.append(condition)
+                params.append(value)
+        if column != "id":
+            clauses.append(f"{column} IS NOT NULL")
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            comparison = "<" if descending else ">"
+            if column == "id":
+                clauses.append(f"id {comparison} ?")
+                params.append(last_id)
+            else:
+                clauses.append(f"({column}, id) {comparison} (?, ?)")
+                params.extend([value, last_id])
+
+        direction = "DESC" if descending else "ASC"
+        order = f"id {direction}" if column == "id" else f"{column} {direction}, id {direction}"
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.connection.execute(
+            f"SELECT * FROM houses {where} ORDER BY {order} LIMIT ?",
+            (*params, limit + 1),
+        ).fetchall()
+
+        houses = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = houses[-1]
+            next_cursor = encode_cursor((last[column], last["id"]))
+        return houses, next_cursor
+
+    # Images
+
+    def add_image(
+        self,
+        house_id: str,
+        kind: str,
+        url: str,
+        name: str = "",
+        style: Optional[str] = None,
+        source: Optional[str] = None,
+        image_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Link an image to a house; adding an existing ``image_id`` again is a no-op"""
+        if image_id is not None:
+            # Checked first so repeats do not even take the write lock
+            existing = self.get_image(house_id, image_id)
+            if existing is not None:
+                return existing
+        image = {
+            "id": image_id or uuid.uuid4().hex,
+            "house_id": house_id,
+            "kind": kind,
+            "name": name,
+            "url": url,
+            "style": style,
+            "source": source,
+            "created_at": time.time(),
+        }
+        self._write([(
+            "INSERT OR IGNORE INTO house_images (id, house_id, kind, name, url, style, source, created_at) "
+            "VALUES (:id, :house_id, :kind, :name, :url, :style, :source, :created_at)",
+            image,
+        )])
+        return image
+
+    def get_image(self, house_id: str, image_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute(
+            "SELECT * FROM house_images WHERE id = ? AND house_id = ?", (image_id, house_id)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def images_for(self, house_ids: List[str], kind: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Images of several houses in one query, oldest first"""
+        images: Dict[str, List[Dict[str, Any]]] = {house_id: [] for house_id in house_ids}
+        if not house_ids:
+            return images
+        placeholders = ",".join("?" * len(house_ids))
+        sql = f"SELECT * FROM house_images WHERE house_id IN ({placeholders})"
+        params: List[Any] = list(house_ids)
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        for row in self.connection.execute(sql + " ORDER BY house_id, kind, created_at", params):
+            images[row["house_id"]].append(dict(row))
+        return images
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the AkiyaVision listing database")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    importer = subcommands.add_parser("import", help="Import listings from a JSON file")
+    importer.add_argument("path", type=Path)
+    importer.add_argument("--db", type=Path, required=True)
+    args = parser.parse_args(argv)
+
+    data = json.loads(args.path.read_text(encoding="utf-8"))
+    records = data["houses"] if isinstance(data, dict) else data
+    count = Repository(args.db).upsert_houses(records)
+    print(f"Imported {count} listings into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
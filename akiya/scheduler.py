@@ -0,0 +1,169 @@
+"""
+Bounded fair queue for renovation work.
+
+Each client has its own FIFO and clients are served by deficit round-robin
+(DRR): every turn a client earns ``quantum`` credit and is served while its
+credit covers the cost of its next item. One client queueing a large batch
+therefore only delays everyone else by one item per round instead of by the
+whole batch.
+
+Admission is bounded in total and per client, so overload is rejected at
+the door rather than piling up as latency.
+"""
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+class QueueFull(Exception):
+    """The queue, or the client's share of it, is full"""
+
+
+class _DRRState:
+    """Per-client queues and credits; copied to look ahead at the service order"""
+
+    def __init__(self, quantum: float):
+        self.quantum = quantum
+        self.queues: Dict[Hashable, Deque[Tuple[Any, float]]] = {}
+        self.deficit: Dict[Hashable, float] = {}
+        self.ring: Deque[Hashable] = deque()
+        self.turn_started = False
+        self.size = 0
+
+    def copy(self) -> "_DRRState":
+        state = _DRRState(self.quantum)
+        state.queues = {client: deque(queue) for client, queue in self.queues.items()}
+        state.deficit = dict(self.deficit)
+        state.ring = deque(self.ring)
+        state.turn_started = self.turn_started
+        state.size = self.size
+        return state
+
+    def push(self, client: Hashable, item: Any, cost: float) -> None:
+        queue = self.queues.get(client)
+        if queue is None:
+            queue = self.queues[client] = deque()
+            self.deficit[client] = 0.0
+            self.ring.append(client)
+        queue.append((item, cost))
+        self.size += 1
+
+    def _drop_client(self, client: Hashable) -> None:
+        if self.ring and self.ring[0] == client:
+            self.turn_started = False
+        self.ring.remove(client)
+        del self.queues[client]
+        del self.deficit[client]
+
+    def pop(self) -> Any:
+        while True:
+            client = self.ring[0]
+            queue = self.queues[client]
+            if not self.turn_started:
+                self.deficit[client] += self.quantum
+                self.turn_started = True
+            item, cost = queue[0]
+            if self.deficit[client] >= cost:
+                queue.popleft()
+                self.size -= 1
+                self.deficit[client] -= cost
+                if not queue:
+                    # An idle client does not bank credit
+                    self._drop_client(client)
+                return item
+            self.ring.rotate(-1)
+            self.turn_started = False
+
+    def remove(self, item: Any) -> bool:
+        for client, queue in self.queues.items():
+            for entry in queue:
+                if entry[0] is item:
+                    queue.remove(entry)
+                    self.size -= 1
+                    if not queue:
+                        self._drop_client(client)
+                    return True
+        return False
+
+
+class FairQueue:
+    """
+    Blocking DRR queue with a global and a per-client bound.
+
+    ``put`` raises ``QueueFull`` instead of blocking; ``get`` blocks until an
+    item is available or the queue is closed (then it returns None).
+    """
+
+    def __init__(self, max_size: int = 100, max_per_client: Optional[int] = None, quantum: float = 1.0):
+        self.max_size = max_size
+        self.max_per_client = max_per_client
+        self._state = _DRRState(quantum)
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return self._state.size
+
+    def depth(self, client: Hashable) -> int:
+        with self._condition:
+            return len(self._state.queues.get(client, ()))
+
+    def check(self, client: Hashable, count: int = 1) -> None:
+        """Raise ``QueueFull`` unless ``count`` more items of ``client`` would be admitted"""
+        with self._condition:
+            self._check_locked(client, count)
+
+    def _check_locked(self, client: Hashable, count: int) -> None:
+        if self._state.size + count > self.max_size:
+            raise QueueFull("queue is full")
+        if self.max_per_client is not None and len(self._state.queues.get(client, ())) + count > self.max_per_client:
+            raise QueueFull("client share of the queue is full")
+
+    def put(self, client: Hashable, item: Any, cost: float = 1.0) -> None:
+        with self._condition:
+            if self._closed:
+                raise QueueFull("queue is closed")
+            self._check_locked(client, 1)
+            self._state.push(client, item, cost)
+            self._condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._state.size or self._closed, timeout):
+                return None
+            if not self._state.size:
+                return None
+            return self._state.pop()
+
+    def remove(self, item: Any) -> bool:
+        """Take a queued item out, e.g. when its caller went away"""
+        with self._condition:
+            return self._state.remove(item)
+
+    def position(self, item: Any) -> Optional[int]:
+        """How many queued items will be served before ``item``; None if it is not queued"""
+        return self.positions([item])[0]
+
+    def positions(self, items: List[Any]) -> List[Optional[int]]:
+        """``position`` of each of ``items`` from one look-ahead at the service order"""
+        with self._condition:
+            state = self._state.copy()
+        wanted = {id(item): index for index, item in enumerate(items)}
+        found: List[Optional[int]] = [None] * len(items)
+        for position in range(state.size):
+            if not wanted:
+                break
+            index = wanted.pop(id(state.pop()), None)
+            if index is not None:
+                found[index] = position
+        return found
+
+    def close(self) -> List[Any]:
+        """Wake every waiting ``get`` and return the items that were still queued"""
+        with self._condition:
+            self._closed = True
+            items = []
+            while self._state.size:
+                items.append(self._state.pop())
+            self._condition.notify_all()
+            return items
@@ -0,0 +1,73 @@
+"""
+Renovation styles and the model parameters shared by every render.
+
+The prompts, the negative prompt and the step count are all part of the
+render cache key, used by the app and by the offline prerender job.
+"""
+
+RENOVATION_STYLES = {
+    "modern": {
+        "name": "モダン",
+        "prompt": "A sleek modern minimalist interior with clean lines, neutral color palette, open floor plan, floor-to-ceiling windows, polished concrete floors, designer furniture, ambient LED lighting, and sophisticated architectural details",
+        "negative": "old, damaged, dark, cluttered, low quality, traditional, ornate"
+    },
+    "traditional": {
+        "name": "和モダン",
+        "prompt": "A refined Japanese modern interior featuring tatami floors, shoji screens, natural wood elements, minimalist zen aesthetic, built-in storage, paper lantern lighting, indoor garden views, and contemporary Japanese furniture",
+        "negative": "western style, damaged, dark, old, low quality, cluttered, colorful"
+    },
+    "western": {
+        "name": "洋風",
+        "prompt": "A luxurious Western-style interior with hardwood flooring, crown molding, elegant furniture, crystal chandelier, marble accents, rich color scheme, formal dining area, and classic American or European design elements",
+        "negative": "japanese style, old, damaged, dark, low quality, minimalist, modern"
+    },
+    "scandinavian": {
+        "name": "北欧風",
+        "prompt": "A cozy Scandinavian interior with white walls, light oak floors, hygge atmosphere, natural textiles, minimalist furniture, abundant natural light, indoor plants, warm throw blankets, and Nordic design elements",
+        "negative": "dark, cluttered, damaged, old, low quality, ornate, colorful"
+    },
+    "industrial": {
+        "name": "インダストリアル",
+        "prompt": "An industrial loft interior with exposed concrete walls, metal beams, Edison bulb lighting, vintage leather furniture, steel fixtures, open ductwork, large factory-style windows, and raw wood accents",
+        "negative": "fancy, ornate, traditional, carpeted, closed spaces"
+    },
+    "zen": {
+        "name": "ミニマリスト禅",
+        "prompt": "A serene minimalist zen interior with white walls, natural stone elements, bamboo accents, floor cushions, low wooden tables, indirect lighting, empty space as design element, and a small indoor rock garden",
+        "negative": "cluttered, colorful, busy patterns, western furniture"
+    },
+    "showa": {
+        "name": "昭和レトロ",
+        "prompt": "A nostalgic Showa-era interior with wood paneling, vintage Japanese furniture, retro appliances, warm lighting, traditional kotatsu table, classic posters, and period-appropriate color scheme",
+        "negative": "modern, minimalist, high-tech, western style"
+    },
+    "luxury": {
+        "name": "ラグジュアリー",
+        "prompt": "A luxury hotel-style interior with plush carpeting, elegant furniture, marble accents, designer lighting fixtures, rich textures, sophisticated color palette, and premium finishes throughout",
+        "negative": "cheap, simple, rustic, industrial, DIY"
+    },
+    "eco": {
+        "name": "エコナチュラル",
+        "prompt": "A sustainable eco-friendly interior with reclaimed wood, living walls, natural fiber furniture, solar tube lighting, cork flooring, recycled materials, and abundant greenery",
+        "negative": "synthetic, plastic, artificial lighting, non-sustainable"
+    },
+    "mediterranean": {
+        "name": "地中海風",
+        "prompt": "A Mediterranean coastal interior with white stucco walls, terracotta tiles, arched doorways, wrought iron details, blue accents, natural wood beams, and sun-drenched atmosphere",
+        "negative": "dark, industrial, modern, Japanese traditional"
+    },
+    "smart": {
+        "name": "スマートホーム",
+        "prompt": "A futuristic smart home interior with integrated LED panels, voice-controlled lighting, minimalist tech furniture, hidden screens, automated systems, and seamless technology integration",
+        "negative": "traditional, vintage, rustic, manual controls"
+    },
+    "bohemian": {
+        "name": "ボヘミアン",
+        "prompt": "A bohemian eclectic interior with layered textiles, macrame wall art, vintage rugs, mixed patterns, indoor plants, warm earth tones, floor cushions, and artistic decorative elements",
+        "negative": "minimal, modern, structured, monochrome"
+    }
+}
+
+# Model parameters - part of the render cache key together with the backend version
+NEGATIVE_PROMPT = "lowres, watermark, banner, logo, watermark, contactinfo, text, deformed, blurry, blur, out of focus, out of frame, surreal, extra, ugly, upholstered walls, fabric walls, plush walls, mirror, mirrored, functional"
+NUM_INFERENCE_STEPS = 25
@@ -0,0 +1,229 @@
+"""
+Streaming image uploads.
+
+The multipart body is parsed as it arrives and the file part is written to a
+spooled temporary file, so memory stays bounded and oversized uploads are cut
+off as soon as they cross the byte limit. The image header is validated
+before anything is decoded, and the stored copy is orientation-corrected and
+downscaled to the working resolution of the model.
+"""
+import io
+import re
+import tempfile
+import threading
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp"}
+
+# Leading bytes of the allowed formats
+IMAGE_SIGNATURES = {
+    "image/jpeg": (b"\xff\xd8\xff",),
+    "image/png": (b"\x89PNG\r\n\x1a\n",),
+    "image/webp": (b"RIFF",),
+}
+
+# Largest image, in pixels, that is ever decoded
+MAX_PIXELS = 40_000_000
+
+# Files below this size stay in memory, larger ones spill to disk
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+_IMAGE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    """Raised for uploads that must be rejected, with the HTTP status to use"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class ReceivedFile:
+    filename: str
+    content_type: str
+    size: int
+    file: tempfile.SpooledTemporaryFile
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Identify an allowed image format from its first bytes"""
+    for content_type, signatures in IMAGE_SIGNATURES.items():
+        if any(header.startswith(signature) for signature in signatures):
+            if content_type == "image/webp" and header[8:12] != b"WEBP":
+                continue
+            return content_type
+    return None
+
+
+async def receive_file(request, field_name: str = "file", max_bytes: int = 15 * 1024 * 1024) -> ReceivedFile:
+    """
+    Stream the ``field_name`` part of a multipart request to a spooled file.
+
+    Raises ``UploadError`` with 413 as soon as the part exceeds ``max_bytes``
+    and 400 when the body is not multipart or the part is missing.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError(400, "multipart/form-data が必要です")
+
+    # Reject early when the declared body size is already too large
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + 64 * 1024:
+        raise UploadError(413, "ファイルサイズが大きすぎます")
+
+    state: Dict = {"headers": {}, "field": b"", "value": b"", "target": None, "found": None}
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    size = 0
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["target"] = None
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].decode("latin-1").lower()] = state["value"].decode("latin-1")
+        state["field"] = b""
+        state["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get("content-disposition"))
+        if disposition.get(b"name", b"").decode("latin-1") == field_name and state["found"] is None:
+            filename = disposition.get(b"filename", b"").decode("utf-8", "replace")
+            part_type = state["headers"].get("content-type", "application/octet-stream")
+            state["found"] = (filename, part_type.split(";")[0].strip().lower())
+            state["target"] = spool
+
+    def on_part_data(data, start, end):
+        nonlocal size
+        if state["target"] is None:
+            return
+        size += end - start
+        if size > max_bytes:
+            raise UploadError(413, "ファイルサイズが大きすぎます")
+        state["target"].write(data[start:end])
+
+    def on_part_end():
+        state["target"] = None
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except UploadError:
+        spool.close()
+        raise
+    except Exception:
+        spool.close()
+        raise UploadError(400, "アップロードの形式が不正です")
+
+    if state["found"] is None:
+        spool.close()
+        raise UploadError(400, "ファイルがありません")
+    spool.seek(0)
+    filename, part_type = state["found"]
+    return ReceivedFile(filename=filename, content_type=part_type, size=size, file=spool)
+
+
+def check_dimensions(source, max_pixels: int = MAX_PIXELS) -> Tuple[int, int]:
+    """
+    Read the dimensions from an image header and refuse decompression bombs.
+
+    Only the header is parsed; pixel data is not decoded here.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(source) as image:
+            dimensions = image.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise UploadError(400, "画像を読み込めません")
+    if dimensions[0] * dimensions[1] > max_pixels:
+        raise UploadError(400, "画像の解像度が大きすぎます")
+    return dimensions
+
+
+def validate_image(received: ReceivedFile, max_pixels: int = MAX_PIXELS) -> Tuple[str, Tuple[int, int]]:
+    """Check the declared type, magic bytes and header dimensions of an upload"""
+    if received.content_type not in ALLOWED_IMAGE_TYPES:
+        raise UploadError(400, "ファイルタイプが無効です")
+    header = received.file.read(16)
+    received.file.seek(0)
+    sniffed = sniff_image_type(header)
+    if sniffed is None:
+        raise UploadError(400, "ファイルタイプが無効です")
+    try:
+        dimensions = check_dimensions(received.file, max_pixels)
+    finally:
+        received.file.seek(0)
+    return sniffed, dimensions
+
+
+def normalize_image(source, max_side: int = 1024, quality: int = 90) -> Tuple[bytes, Tuple[int, int]]:
+    """
+    Apply EXIF orientation, downscale to ``max_side`` and re-encode as JPEG.
+
+    JPEG sources are decoded at a reduced scale via ``draft`` so large phone
+    photos never materialise at full resolution.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        return buffer.getvalue(), image.size
+
+
+class UploadStore:
+    """Normalized uploads on the local filesystem, addressed by image id"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+
+    def save(self, content: bytes) -> str:
+        image_id = uuid.uuid4().hex
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.directory / f"{image_id}.tmp"
+            tmp_path.write_bytes(content)
+            tmp_path.replace(self.path(image_id))
+        return image_id
+
+    def path(self, image_id: str) -> Optional[Path]:
+        if not _IMAGE_ID.match(image_id):
+            return None
+        return self.directory / f"{image_id}.jpg"
+
+    def read(self, image_id: str) -> Optional[bytes]:
+        path = self.path(image_id)
+        if path is None or not path.is_file():
+            return None
+        return path.read_bytes()
@@ -0,0 +1,413 @@
+"""
+Guarded calls to the inference backend.
+
+``UpstreamClient.call`` wraps every prediction with:
+
+- an adaptive concurrency limit (AIMD): the limit grows by about one per
+  window of fast successes and is cut multiplicatively when latency rises
+  well above its recent baseline or a call fails, so a slow upstream gets
+  fewer concurrent requests instead of a pile-up;
+- a circuit breaker that opens when the recent error rate spikes (or the
+  upstream asks us to back off) and fails calls fast with a ``Retry-After``
+  until a single probe succeeds again;
+- a per-call deadline, after which the caller gets a timeout error;
+- optional retries of failed attempts within the deadline (never after the
+  upstream asked us to back off);
+- optional hedging: a prediction still running past a latency percentile
+  gets a second, parallel attempt and the first result wins.
+
+Backend calls are blocking, so attempts run in their own thread pool. An
+attempt abandoned at its deadline keeps its concurrency slot until it
+really finishes, so the limit always reflects the load on the upstream.
+Cancellable calls get a ``cancel`` event per attempt, set for a losing
+hedge and at the deadline, so the backend can stop (and stop paying for)
+work nobody waits for any more.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional
+
+from akiya.jobs import JobError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Seconds to back off after a 429/503 that did not say how long to wait
+THROTTLE_BACKOFF = 5.0
+
+
+class UpstreamUnavailable(JobError):
+    """The upstream is failing or saturated; retry after ``retry_after`` seconds"""
+
+    def __init__(self, message: str = "画像生成サービスが混雑しています。しばらくしてから再度お試しください", retry_after: float = 30.0):
+        super().__init__(message, status_code=503, retry_after=retry_after)
+
+
+class UpstreamTimeout(JobError):
+    def __init__(self, message: str = "画像生成がタイムアウトしました"):
+        super().__init__(message, status_code=504)
+
+
+class LatencyWindow:
+    """The most recent latencies, for percentiles"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, max(0, math.ceil(quantile * len(samples)) - 1))]
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit.
+
+    A success faster than ``tolerance`` times the baseline latency (the 10th
+    percentile of recent calls) adds ``1 / limit``, so about one per window
+    of ``limit`` calls. A failure, or a success slower than that, multiplies
+    the limit by ``backoff``, at most once per baseline latency so one slow
+    burst is not counted once per request.
+    """
+
+    def __init__(
+        self, initial: int = 4, minimum: int = 1, maximum: int = 32, tolerance: float = 2.0,
+        backoff: float = 0.7, min_samples: int = 10, clock: Callable[[], float] = time.monotonic,
+    ):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.min_samples = min_samples
+        self.clock = clock
+        self.latencies = LatencyWindow()
+        self.in_flight = 0
+        self._last_decrease = -math.inf
+        self._condition = threading.Condition()
+
+    @property
+    def target(self) -> Optional[float]:
+        """Latency above which the limit is decreased; None until enough calls were seen"""
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(0.1) * self.tolerance
+
+    def acquire(self, timeout: float) -> bool:
+        """Take a slot, waiting up to ``timeout`` seconds; False if none became free"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def abandon(self) -> None:
+        """Give back a slot that was never used"""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def release(self, latency: float, ok: bool) -> None:
+        """Give back a slot, adjusting the limit by the outcome of its call"""
+        target = self.target
+        with self._condition:
+            self.in_flight -= 1
+            if not ok or (target is not None and latency > target):
+                now = self.clock()
+                baseline = self.latencies.percentile(0.1) or 0.0
+                if now - self._last_decrease >= baseline:
+                    self._last_decrease = now
+                    self.limit = max(float(self.minimum), self.limit * self.backoff)
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+        if ok:
+            self.latencies.add(latency)
+
+
+class CircuitBreaker:
+    """
+    Opens when at least ``failure_rate`` of the last ``window`` calls failed
+    (once ``min_calls`` were seen), or when the upstream sends ``Retry-After``.
+    While open every call is rejected; after the cooldown one probe call is let
+    through and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(
+        self, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10, cooldown: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_until = 0.0
+        self.trips = 0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        return max(1.0, self.opened_until - self.clock())
+
+    def before_call(self) -> None:
+        """Raise ``UpstreamUnavailable`` unless a call may go ahead"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and self.clock() >= self.opened_until:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            retry_after = self.retry_after() if self.state == OPEN else 1.0
+        raise UpstreamUnavailable(retry_after=retry_after)
+
+    def _open_locked(self, duration: float) -> None:
+        if self.state != OPEN:
+            self.trips += 1
+        self.state = OPEN
+        self.opened_until = max(self.opened_until, self.clock() + duration)
+        self._probing = False
+        self._outcomes.clear()
+
+    def release_probe(self) -> None:
+        """Let another probe through when this call never reached the upstream; records no outcome"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            if retry_after is not None:
+                self._open_locked(retry_after)
+                return
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if ok:
+                    self.state = CLOSED
+                else:
+                    self._open_locked(self.cooldown)
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_rate * len(self._outcomes):
+                self._open_locked(self.cooldown)
+
+
+def upstream_retry_after(error: BaseException) -> Optional[float]:
+    """Back-off requested by the upstream (HTTP 429/503 with Retry-After), if any"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return None
+    if getattr(error, "status", None) in (429, 503):
+        return THROTTLE_BACKOFF
+    return None
+
+
+class UpstreamClient:
+    """Adaptive limit, circuit breaker, deadlines and hedging around blocking backend calls"""
+
+    def __init__(
+        self,
+        limit: Optional[AdaptiveLimit] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        timeout: float = 120.0,
+        queue_timeout: float = 30.0,
+        hedge_quantile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+        retries: int = 0,
+    ):
+        self.limit = limit or AdaptiveLimit()
+        self.breaker = breaker or CircuitBreaker()
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.retries = retries
+        self.counts = dict.fromkeys(
+            ("calls", "succeeded", "failed", "timeouts", "rejected", "retried", "hedged", "hedge_wins"), 0
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Every running attempt holds a slot, so the limit bounds the threads in use
+                self._executor = ThreadPoolExecutor(max_workers=self.limit.maximum, thread_name_prefix="upstream")
+            return self._executor
+
+    def hedge_delay(self) -> Optional[float]:
+        if self.hedge_quantile is None or len(self.limit.latencies) < self.hedge_min_samples:
+            return None
+        return self.limit.latencies.percentile(self.hedge_quantile)
+
+    @staticmethod
+    def _attempt(limit: AdaptiveLimit, cancel: Optional[threading.Event], fn: Callable[..., Any], args, kwargs) -> Any:
+        started = time.monotonic()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            if not ok and cancel is not None and cancel.is_set():
+                # Stopped by us, which says nothing about the upstream
+                limit.abandon()
+            else:
+                limit.release(time.monotonic() - started, ok)
+
+    def _start(
+        self, fn, args, kwargs, timeout: float, cancels: Dict[Future, threading.Event], cancellable: bool,
+    ) -> Optional[Future]:
+        limit = self.limit
+        if not limit.acquire(timeout):
+            return None
+        cancel = threading.Event() if cancellable else None
+        if cancel is not None:
+            kwargs = {**kwargs, "cancel": cancel}
+        try:
+            future = self.executor.submit(self._attempt, limit, cancel, fn, args, kwargs)
+        except RuntimeError:
+            limit.abandon()
+            raise
+        if cancel is not None:
+            cancels[future] = cancel
+        return future
+
+    @staticmethod
+    def _cancel(futures, cancels: Dict[Future, threading.Event]) -> None:
+        for future in futures:
+            cancel = cancels.get(future)
+            if cancel is not None:
+                cancel.set()
+
+    def call(self, fn: Callable[..., Any], *args, cancellable: bool = False, **kwargs) -> Any:
+        """
+        Run ``fn(*args, **kwargs)`` against the upstream.
+
+        With ``cancellable`` every attempt also gets ``cancel=threading.Event()``,
+        set when its result is no longer wanted. Raises ``UpstreamUnavailable``
+        when the circuit is open or no slot frees up in time,
+        ``UpstreamTimeout`` past the deadline, and the backend's own exception
+        when every attempt failed.
+        """
+        self._count("calls")
+        try:
+            self.breaker.before_call()
+        except UpstreamUnavailable:
+            self._count("rejected")
+            raise
+        started = time.monotonic()
+        deadline = started + self.timeout
+        cancels: Dict[Future, threading.Event] = {}
+        first = self._start(fn, args, kwargs, min(self.queue_timeout, self.timeout), cancels, cancellable)
+        if first is None:
+            self._count("rejected")
+            # Never reached the upstream, so there is no outcome to record
+            self.breaker.release_probe()
+            raise UpstreamUnavailable(retry_after=max(1.0, self.limit.latencies.percentile(0.5) or 1.0))
+
+        pending = {first}
+        hedges = set()
+        retries = self.retries
+        hedge_delay = self.hedge_delay()
+        hedge_at = started + hedge_delay if hedge_delay is not None else None
+        error: Optional[BaseException] = None
+        while pending:
+            wake = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future in hedges:
+                        self._count("hedge_wins")
+                    # The other attempt lost the race
+                    self._cancel(pending, cancels)
+                    self._count("succeeded")
+                    self.breaker.record(True)
+                    return future.result()
+                error = future.exception()
+                if upstream_retry_after(error) is not None:
+                    # Throttled: more attempts would only add to the overload
+                    retries = 0
+                    hedge_at = None
+            now = time.monotonic()
+            if pending and now >= deadline:
+                self._cancel(pending, cancels)
+                self._count("timeouts")
+                self.breaker.record(False)
+                raise UpstreamTimeout()
+            if done and not pending and retries > 0:
+                retries -= 1
+                retry = self._start(fn, args, kwargs, min(self.queue_timeout, deadline - now), cancels, cancellable)
+                if retry is not None:
+                    self._count("retried")
+                    pending.add(retry)
+            if hedge_at is not None and now >= hedge_at and pending:
+                hedge_at = None
+                # Only hedge into spare capacity, never by waiting for a slot
+                hedge = self._start(fn, args, kwargs, 0.0, cancels, cancellable)
+                if hedge is not None:
+                    self._count("hedged")
+                    hedges.add(hedge)
+                    pending.add(hedge)
+        self._count("failed")
+        self.breaker.record(False, upstream_retry_after(error))
+        logging.warning(f"Upstream call failed: {error}")
+        raise error
+
+    def reset(self) -> None:
+        """Forget learned limits, circuit state and counters"""
+        self.limit = AdaptiveLimit(
+            initial=self.limit.initial, minimum=self.limit.minimum, maximum=self.limit.maximum,
+            tolerance=self.limit.tolerance, backoff=self.limit.backoff, min_samples=self.limit.min_samples,
+            clock=self.limit.clock,
+        )
+        self.breaker = CircuitBreaker(
+            failure_rate=self.breaker.failure_rate, window=self.breaker.window, min_calls=self.breaker.min_calls,
+            cooldown=self.breaker.cooldown, clock=self.breaker.clock,
+        )
+        with self._lock:
+            self.counts = dict.fromkeys(self.counts, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            **counts,
+            "concurrency_limit": self.limit.limit,
+            "in_flight": self.limit.in_flight,
+            "circuit": self.breaker.state,
+            "circuit_trips": self.breaker.trips,
+        }
@@ -0,0 +1,180 @@
+"""
+Responsive renditions of the demo images, generated ahead of time.
+
+``python -m akiya.variants build`` resizes every demo image in the catalog to
+a few widths in WebP and JPEG, plus one JPEG at the model input resolution,
+and writes a manifest mapping demo ids to their renditions. Images are
+processed in parallel in a process pool.
+
+The API turns the manifest into ``srcset`` strings for the browser, and
+renovations send the model-resolution rendition upstream instead of the
+full-size original.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+WIDTHS = (320, 640, 1024)
+FORMATS = (("webp", "image/webp"), ("jpeg", "image/jpeg"))
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+# Interior AI works at about this resolution; larger inputs only cost transfer time
+MODEL_WIDTH = 1024
+QUALITY = 80
+
+
+def rendition_widths(source_width: int, widths: Sequence[int]) -> List[int]:
+    """Requested widths below the source width, plus the source width if it is smaller than the largest"""
+    selected = [width for width in sorted(widths) if width < source_width]
+    if source_width <= max(widths) and source_width not in selected:
+        selected.append(source_width)
+    return selected
+
+
+def _encode(image, image_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=6)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def render_image(
+    demo_id: str, source: str, output_dir: str, widths: Sequence[int] = WIDTHS,
+    model_width: int = MODEL_WIDTH, quality: int = QUALITY,
+) -> Dict:
+    """
+    Write all renditions of one image; runs in a worker process.
+
+    Returns the manifest entry. File names are relative to ``output_dir``.
+    """
+    from PIL import Image, ImageOps
+
+    data = Path(source).read_bytes()
+    with Image.open(io.BytesIO(data)) as opened:
+        original = opened.size
+        # Decode JPEGs at reduced scale when even the largest rendition is much smaller
+        largest = max(tuple(widths) + (model_width,))
+        opened.draft("RGB", (largest, largest))
+        decoded = opened.size
+        image = ImageOps.exif_transpose(opened).convert("RGB")
+    if image.size != decoded:
+        # Rotated by its EXIF orientation
+        original = original[::-1]
+    width, height = image.size
+
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    renditions = []
+    # Largest first so each step resizes an already smaller image
+    current = image
+    for target in sorted(rendition_widths(width, widths), reverse=True):
+        if target != current.width:
+            current = current.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+        for image_format, content_type in FORMATS:
+            encoded = _encode(current, image_format, quality)
+            name = f"{demo_id}-{target}w.{EXTENSIONS[image_format]}"
+            (output / name).write_bytes(encoded)
+            renditions.append({
+                "file": name,
+                "width": current.width,
+                "height": current.height,
+                "content_type": content_type,
+                "bytes": len(encoded),
+            })
+
+    model_target = min(model_width, width)
+    model_image = image if model_target == width else image.resize(
+        (model_target, max(1, round(height * model_target / width))), Image.LANCZOS
+    )
+    model_name = f"{demo_id}-model.jpg"
+    (output / model_name).write_bytes(_encode(model_image, "jpeg", 90))
+
+    return {
+        "source_sha256": hashlib.sha256(data).hexdigest(),
+        "width": original[0],
+        "height": original[1],
+        "renditions": sorted(renditions, key=lambda r: (r["content_type"], r["width"])),
+        "model": model_name,
+    }
+
+
+def build(
+    images: Iterable[Tuple[str, Path]], output_dir: Path, workers: Optional[int] = None, **options,
+) -> Dict[str, Dict]:
+    """Render ``(demo_id, source_path)`` pairs in a process pool; returns the manifest entries"""
+    images = list(images)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            demo_id: pool.submit(render_image, demo_id, str(source), str(output_dir), **options)
+            for demo_id, source in images
+        }
+        return {demo_id: future.result() for demo_id, future in futures.items()}
+
+
+def load_manifest(path: Path) -> Dict:
+    """The manifest, or an empty one when the variants were never built"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    return {"directory": manifest.get("directory", "variants"), "images": manifest.get("images", {})}
+
+
+def model_inputs(manifest: Dict, public_dir: Path, url_prefix: str = "/public/") -> Dict[str, str]:
+    """URL of the model-resolution rendition by original image URL, for renditions on disk"""
+    directory = manifest["directory"]
+    return {
+        f"{url_prefix}{entry['source']}": f"{url_prefix}{directory}/{entry['model']}"
+        for entry in manifest["images"].values()
+        if "source" in entry and (Path(public_dir) / directory / entry["model"]).is_file()
+    }
+
+
+def srcset(entry: Dict, content_type: str, url_for) -> str:
+    """``srcset`` attribute value for one format, with URLs from ``url_for(file)``"""
+    return ", ".join(
+        f"{url_for(rendition['file'])} {rendition['width']}w"
+        for rendition in entry["renditions"]
+        if rendition["content_type"] == content_type
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Demo image renditions")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="render all demo images in the catalog")
+    build_parser.add_argument("--catalog", type=Path, default=Path("data/catalog.json"))
+    build_parser.add_argument("--public", type=Path, default=Path("public"))
+    build_parser.add_argument("--output", type=Path, default=Path("public/variants"))
+    build_parser.add_argument("--manifest", type=Path, default=Path("data/demo-variants.json"))
+    build_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with open(args.catalog, encoding="utf-8") as f:
+        catalog = json.load(f)
+    sources = {
+        image["id"]: image["url"][len("/public/"):]
+        for group in catalog.get("demo_images", {}).values()
+        for image in group
+        if image["url"].startswith("/public/")
+    }
+    entries = build(((demo_id, args.public / source) for demo_id, source in sources.items()), args.output, workers=args.workers)
+    for demo_id, entry in entries.items():
+        entry["source"] = sources[demo_id]
+    args.manifest.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.manifest, "w", encoding="utf-8") as f:
+        json.dump({"directory": args.output.relative_to(args.public).as_posix(), "images": entries}, f, indent=2)
+        f.write("\n")
+    total = sum(len(entry["renditions"]) + 1 for entry in entries.values())
+    print(f"Wrote {total} renditions of {len(entries)} images to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,84 +2,129 @@
 AkiyaVision - AI-powered vacant house renovation visualizer
 """
 import os
+import io
 import base64
-from typing import Dict, List, Optional
+import binascii
+import hashlib
+import logging
+import math
+import tempfile
+import asyncio
+import json
+from typing import Dict, List, Literal, Optional, Tuple, Union
 from datetime import datetime
+from pathlib import Path
+import time
 import uuid
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 from pydantic import BaseModel, validator, Field
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-import uvicorn
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
-
-# Initialize FastAPI app
-app = FastAPI(title="AkiyaVision", version="1.0.0")
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-# Security headers middleware
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        
-        # Security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        
-        # Content Security Policy - adjust as needed
-        csp = (
-            "default-src 'self'; "
-            "script-src 'self' https://cdn.tailwindcss.com 'unsafe-inline'; "
-            "style-src 'self' https://cdn.tailwindcss.com 'unsafe-inline'; "
-            "img-src 'self' data: https:; "
-            "font-src 'self' https://fonts.gstatic.com; "
-            "connect-src 'self'; "
-            "frame-ancestors 'none';"
-        )
-        response.headers["Content-Security-Policy"] = csp
-        
-        return response
-
-app.add_middleware(SecurityHeadersMiddleware)
-
-# Configure CORS - Restrict to specific origins in production
-# For development, you can add localhost origins
-allowed_origins = [
-    "http://localhost:8000",
-    "http://localhost:3000",
-    "http://127.0.0.1:8000",
-    # Add your production domain here when deploying
-    # "https://your-domain.com"
-    "*",  # Allow all origins temporarily for debugging
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins,
-    allow_credentials=True,
-    allow_methods=["GET", "POST"],
-    allow_headers=["Content-Type", "Authorization", "Accept", "Origin"],
+
+from akiya.artifacts import ArtifactFileResponse, LocalArtifactStore
+from akiya.assets import AssetIndex, StaticAssets
+from akiya.backends import DEFAULT_REPLICATE_VERSION, RenderInput, get_backend, read_output, use_transport
+from akiya.cache import CacheEntry, RenderCache, prompt_fingerprint, render_cache_key
+from akiya.catalog import Catalog, EncodedPayload, encode_payload, payload_response
+from akiya.compression import CompressionMiddleware
+from akiya.conditional import etag_matches
+from akiya.jobs import FAILED, SUCCEEDED, JobError, JobManager, JobRejected
+from akiya.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, LoopLagMonitor, MetricsMiddleware, Registry
+from akiya.pages import PrerenderedPage
+from akiya.phash import NearDuplicateIndex, dhash
+from akiya.postprocess import PostProcessor
+from akiya.progress import sse_message
+from akiya.prerender import Prerendered
+from akiya.ratelimit import (
+    MemoryStore,
+    RateLimiter,
+    RateLimitExceeded,
+    RateLimitHeadersMiddleware,
+    SQLiteStore,
+    parse_rate,
+    rate_limit_exceeded_handler,
+)
+from akiya.remote import HttpPool, RemoteImageError, RemoteImages
+from akiya.repository import IMAGE_GENERATED, IMAGE_UPLOAD, Repository
+from akiya.security import API_CSP, PAGE_CSP, SecurityHeadersMiddleware
+from akiya.styles import NEGATIVE_PROMPT, NUM_INFERENCE_STEPS, RENOVATION_STYLES
+from akiya.uploads import UploadError, UploadStore, check_dimensions, normalize_image, receive_file, sniff_image_type, validate_image
+from akiya.upstream import AdaptiveLimit, CircuitBreaker, UpstreamClient, UpstreamTimeout, UpstreamUnavailable
+from akiya.variants import load_manifest as load_variant_manifest, model_inputs, srcset
+
+# Load environment variables from .env when there is one
+# Deployments set them directly, so cold starts skip importing dotenv
+if Path(".env").is_file() or (Path(__file__).resolve().parent / ".env").is_file():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+# Initialize rate limiter - token buckets per client, cost-weighted
+# The sqlite store shares budgets between all workers using the same file
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+if RATE_LIMIT_STORE == "sqlite":
+    rate_limit_store = SQLiteStore(Path(os.getenv("RATE_LIMIT_DB", str(Path(tempfile.gettempdir()) / "akiya-vision" / "ratelimit.db"))))
+else:
+    rate_limit_store = MemoryStore()
+limiter = RateLimiter(
+    rate_limit_store,
+    {
+        "default": parse_rate("default", os.getenv("RATE_LIMIT_DEFAULT", "100/minute")),
+        "upload": parse_rate("upload", os.getenv("RATE_LIMIT_UPLOAD", "30/hour")),
+        # Strict limit for expensive AI operations
+        "renovate": parse_rate("renovate", os.getenv("RATE_LIMIT_RENOVATE", "10/hour")),
+    },
+)
+
+# Metrics, exposed in Prometheus text format on /api/metrics
+metrics = Registry()
+loop_lag = LoopLagMonitor()
+metrics.gauge("akiya_event_loop_lag_seconds", "Latest event loop scheduling delay", callback=lambda: loop_lag.lag)
+metrics.gauge("akiya_event_loop_lag_max_seconds", "Worst event loop scheduling delay in the last minute", callback=lambda: loop_lag.max_lag)
+renovation_phase = metrics.histogram(
+    "akiya_renovation_phase_seconds",
+    "Time spent in each phase of a renovation (input, queue, cache_lookup, upstream, output_decode, output_store, postprocess)",
+    ("phase",),
+)
+renovations_total = metrics.counter("akiya_renovations_total", "Finished renders by backend and outcome", ("backend", "outcome"))
+renovation_bytes = metrics.counter(
+    "akiya_renovation_bytes_total", "Image bytes read as render input and received as output", ("direction",)
 )
+rate_limit_rejections = metrics.counter("akiya_rate_limit_rejections_total", "Requests rejected by a rate limit", ("limit",))
 
-# Mount static files and templates
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag.start()
+    index_page.refresh()
+    await run_in_threadpool(catalog.refresh)
+    # One keep-alive pool for remote input images and Replicate API calls
+    http_pool.start()
+    use_transport(http_pool.transport)
+    yield
+    # Queued renders are cancelled; running ones finish before the pool closes under them
+    renovation_jobs.shutdown()
+    use_transport(None)
+    await http_pool.aclose()
+    postprocessor.shutdown()
+    await loop_lag.stop()
+
+
+async def handle_rate_limit_exceeded(request: Request, exc: RateLimitExceeded):
+    rate_limit_rejections.inc(limit=exc.limit.name)
+    return await rate_limit_exceeded_handler(request, exc)
+
+
+# Routes are collected on a router and installed by create_app()
+router = APIRouter()
+
+
+# Static files and templates
 import sys
-from pathlib import Path
 
 # Get the project root directory
 if hasattr(sys, '_MEIPASS'):
@@ -89,15 +134,47 @@ else:
     # Running in normal Python environment
     BASE_DIR = Path(__file__).resolve().parent
 
-# Mount public folder for local development
-if (BASE_DIR / "public").exists():
-    app.mount("/public", StaticFiles(directory=str(BASE_DIR / "public")), name="public")
+# Static assets are served from public/ only, under plain and content-hashed names
+# Run `python -m akiya.assets build public` to precompress them
+assets = AssetIndex(BASE_DIR / "public", url_prefix="/public/")
+
+
+@lru_cache(maxsize=None)
+def get_templates():
+    """Page templates, compiled on the first page request instead of at import"""
+    from fastapi.templating import Jinja2Templates
+
+    templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+    templates.env.globals["asset_url"] = assets.url_for
+    return templates
 
-# Also mount static for backward compatibility if it exists
-if (BASE_DIR / "static").exists():
-    app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 
-templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+# The web UI renders with one request per style by default; with
+# RENOVATE_PROGRESS_STREAM=1 it queues jobs and follows their progress
+# stream, which needs follow-up requests to reach the same instance
+RENOVATE_PROGRESS_STREAM = os.getenv("RENOVATE_PROGRESS_STREAM", "0") == "1"
+
+# The landing page has no per-request data: rendered once, served from memory
+# PAGE_RELOAD=1 re-renders it when the template or assets change, for development
+index_page = PrerenderedPage(
+    lambda: get_templates().get_template("index.html").render(progress_stream=RENOVATE_PROGRESS_STREAM),
+    reload_interval=2.0 if os.getenv("PAGE_RELOAD", "0") == "1" else None,
+)
+
+
+# Responsive demo image renditions, built by `python -m akiya.variants build`
+demo_variants = load_variant_manifest(BASE_DIR / "data" / "demo-variants.json")
+# Demo images are sent upstream at model resolution instead of full size
+demo_model_inputs = model_inputs(demo_variants, BASE_DIR / "public")
+
+# Demo renders made ahead of time by `python -m akiya.prerender build`
+# Only used while they match the current demo image, prompts and model version
+prerendered = Prerendered(
+    BASE_DIR / "data" / "prerendered.json",
+    BASE_DIR / "public",
+    model_version=os.getenv("REPLICATE_MODEL_VERSION", DEFAULT_REPLICATE_VERSION),
+    digest_for=lambda source: image_digest(source, load_image_bytes(demo_model_inputs.get(source, source))),
+)
 
 # Data models
 class House(BaseModel):
@@ -109,322 +186,971 @@ class House(BaseModel):
     age: str
     description: str
     images: List[Dict[str, str]] = []
+    # Normalized values parsed from the display strings
+    ward: Optional[str] = None
+    price_yen: Optional[int] = None
+    area_m2: Optional[float] = None
+    age_years: Optional[int] = None
 
 class RenovateRequest(BaseModel):
     style: str = Field(..., min_length=1, max_length=50, pattern="^[a-zA-Z_]+$")
     image_url: Optional[str] = Field(None, max_length=5000)
 
-# Demo images for each house type
-# In production, these could be hosted on a CDN or external storage
-# For now, using local paths that will be served by Vercel
-DEMO_IMAGES = {
-    "kominka": [
-        {
-            "id": "demo1",
-            "name": "台所",
-            "url": "/public/demo1.jpg",
-            "description": "Kitchen"
-        },
-        {
-            "id": "demo2", 
-            "name": "外観",
-            "url": "/public/demo2.jpg",
-            "description": "Exterior view"
-        },
-        {
-            "id": "demo3",
-            "name": "廊下",
-            "url": "/public/demo3.jpeg",
-            "description": "Corridor"
-        }
-    ],
-    "ikkodate": [
-        {
-            "id": "demo4",
-            "name": "和室",
-            "url": "/public/demo4.jpeg",
-            "description": "Japanese-style room"
-        },
-        {
-            "id": "demo5",
-            "name": "空き部屋",
-            "url": "/public/demo5.jpg",
-            "description": "Empty room"
-        },
-        {
-            "id": "demo6",
-            "name": "リビング",
-            "url": "/public/demo6.jpg",
-            "description": "Living room"
-        }
-    ]
-}
+class BatchRenovateRequest(BaseModel):
+    styles: Union[Literal["all"], List[str]] = Field(..., description='Style keys, or "all"')
+    image_url: Optional[str] = Field(None, max_length=5000)
 
-# Get demo houses data - function ensures data is always available in serverless
-def get_demo_houses() -> Dict[str, House]:
-    return {
-        "house1": House(
-            id="house1",
-            name="世田谷区 - 古民家",
-            address="東京都世田谷区",
-            price="3,800万円",
-            area="180㎡",
-            age="築80年",
-            description="伝統的な日本家屋。広い庭付き。リノベーション向き。",
-            images=[]
-        ),
-        "house2": House(
-            id="house2",
-            name="杉並区 - 一戸建て",
-            address="東京都杉並区",
-            price="5,200万円",
-            area="120㎡",
-            age="築50年",
-            description="静かな住宅街の一軒家。駅から徒歩15分。",
-            images=[]
-        )
-    }
+def house_from_row(row: Dict, images: List[Dict]) -> House:
+    house = House(**{key: value for key, value in row.items() if key in House.model_fields and key != "images"})
+    house.images = [{"id": image["id"], "name": image["name"], "url": image["url"]} for image in images]
+    return house
 
-# In-memory storage - will be populated on each request in serverless
-houses_db: Dict[str, House] = {}
+# Listing repository - SQLite in the writable temp directory unless configured
+repository = Repository(Path(os.getenv("DATABASE_PATH", str(Path(tempfile.gettempdir()) / "akiya-vision" / "akiya.db"))))
 
-# Renovation styles and prompts
-RENOVATION_STYLES = {
-    "modern": {
-        "name": "モダン",
-        "prompt": "A sleek modern minimalist interior with clean lines, neutral color palette, open floor plan, floor-to-ceiling windows, polished concrete floors, designer furniture, ambient LED lighting, and sophisticated architectural details",
-        "negative": "old, damaged, dark, cluttered, low quality, traditional, ornate"
-    },
-    "traditional": {
-        "name": "和モダン",
-        "prompt": "A refined Japanese modern interior featuring tatami floors, shoji screens, natural wood elements, minimalist zen aesthetic, built-in storage, paper lantern lighting, indoor garden views, and contemporary Japanese furniture",
-        "negative": "western style, damaged, dark, old, low quality, cluttered, colorful"
-    },
-    "western": {
-        "name": "洋風",
-        "prompt": "A luxurious Western-style interior with hardwood flooring, crown molding, elegant furniture, crystal chandelier, marble accents, rich color scheme, formal dining area, and classic American or European design elements",
-        "negative": "japanese style, old, damaged, dark, low quality, minimalist, modern"
-    },
-    "scandinavian": {
-        "name": "北欧風",
-        "prompt": "A cozy Scandinavian interior with white walls, light oak floors, hygge atmosphere, natural textiles, minimalist furniture, abundant natural light, indoor plants, warm throw blankets, and Nordic design elements",
-        "negative": "dark, cluttered, damaged, old, low quality, ornate, colorful"
-    },
-    "industrial": {
-        "name": "インダストリアル",
-        "prompt": "An industrial loft interior with exposed concrete walls, metal beams, Edison bulb lighting, vintage leather furniture, steel fixtures, open ductwork, large factory-style windows, and raw wood accents",
-        "negative": "fancy, ornate, traditional, carpeted, closed spaces"
-    },
-    "zen": {
-        "name": "ミニマリスト禅",
-        "prompt": "A serene minimalist zen interior with white walls, natural stone elements, bamboo accents, floor cushions, low wooden tables, indirect lighting, empty space as design element, and a small indoor rock garden",
-        "negative": "cluttered, colorful, busy patterns, western furniture"
-    },
-    "showa": {
-        "name": "昭和レトロ",
-        "prompt": "A nostalgic Showa-era interior with wood paneling, vintage Japanese furniture, retro appliances, warm lighting, traditional kotatsu table, classic posters, and period-appropriate color scheme",
-        "negative": "modern, minimalist, high-tech, western style"
-    },
-    "luxury": {
-        "name": "ラグジュアリー",
-        "prompt": "A luxury hotel-style interior with plush carpeting, elegant furniture, marble accents, designer lighting fixtures, rich textures, sophisticated color palette, and premium finishes throughout",
-        "negative": "cheap, simple, rustic, industrial, DIY"
-    },
-    "eco": {
-        "name": "エコナチュラル",
-        "prompt": "A sustainable eco-friendly interior with reclaimed wood, living walls, natural fiber furniture, solar tube lighting, cork flooring, recycled materials, and abundant greenery",
-        "negative": "synthetic, plastic, artificial lighting, non-sustainable"
-    },
-    "mediterranean": {
-        "name": "地中海風",
-        "prompt": "A Mediterranean coastal interior with white stucco walls, terracotta tiles, arched doorways, wrought iron details, blue accents, natural wood beams, and sun-drenched atmosphere",
-        "negative": "dark, industrial, modern, Japanese traditional"
-    },
-    "smart": {
-        "name": "スマートホーム",
-        "prompt": "A futuristic smart home interior with integrated LED panels, voice-controlled lighting, minimalist tech furniture, hidden screens, automated systems, and seamless technology integration",
-        "negative": "traditional, vintage, rustic, manual controls"
-    },
-    "bohemian": {
-        "name": "ボヘミアン",
-        "prompt": "A bohemian eclectic interior with layered textiles, macrame wall art, vintage rugs, mixed patterns, indoor plants, warm earth tones, floor cushions, and artistic decorative elements",
-        "negative": "minimal, modern, structured, monochrome"
-    }
-}
+def seed_repository(data: Dict) -> None:
+    """Upsert the houses of the catalog data file into the repository"""
+    repository.upsert_houses(data.get("houses", []))
+
+# House and demo-image catalog - loaded from the data file, reloaded when it changes
+# Not loaded at import: the first request, or the lifespan startup, seeds the repository
+catalog = Catalog(BASE_DIR / "data" / "catalog.json", on_reload=seed_repository)
+
+# Render cache - memory LRU in front of a disk store
+# Serverless functions can only write to the temp directory
+render_cache = RenderCache(
+    directory=Path(os.getenv("RENDER_CACHE_DIR", str(Path(tempfile.gettempdir()) / "akiya-vision" / "renders"))),
+    memory_items=int(os.getenv("RENDER_CACHE_MEMORY_ITEMS", "64")),
+    memory_bytes=int(os.getenv("RENDER_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024))),
+    disk_bytes=int(os.getenv("RENDER_CACHE_DISK_BYTES", str(512 * 1024 * 1024))),
+    fingerprints={key: prompt_fingerprint(config) for key, config in RENOVATION_STYLES.items()},
+)
+
+# Perceptual hashes of rendered inputs, so re-uploads of a photo (cropped,
+# resized or recompressed) within NEAR_DUPLICATE_DISTANCE bits of 64 reuse
+# the earlier render; a negative distance disables the lookup
+near_duplicates = NearDuplicateIndex(
+    render_cache.disk.directory / "near-duplicates.jsonl",
+    max_distance=int(os.getenv("NEAR_DUPLICATE_DISTANCE", "6")),
+)
+
+# Worker pool for upstream predictions - keeps the event loop free
+# Waiting renders are served round-robin per client from a bounded queue;
+# once it is full, renovations are rejected with 503 and a predicted wait
+renovation_jobs = JobManager(
+    max_workers=int(os.getenv("RENOVATE_WORKERS", "4")),
+    max_jobs=int(os.getenv("RENOVATE_MAX_JOBS", "1000")),
+    max_queued=int(os.getenv("RENOVATE_MAX_QUEUED", "100")),
+    max_queued_per_client=int(os.getenv("RENOVATE_MAX_QUEUED_PER_CLIENT", "20")),
+)
+# Progress streams send a comment line this often so proxies keep them open
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))
+SSE_RETRY_MS = 3000
+metrics.gauge("akiya_progress_subscribers", "Open renovation progress streams", callback=lambda: len(renovation_jobs.events))
+metrics.gauge(
+    "akiya_renovations_in_flight", "Distinct renders queued or running", callback=lambda: renovation_jobs.stats()["renders_in_flight"]
+)
+metrics.gauge("akiya_renovation_queue_depth", "Renders waiting for a worker", callback=lambda: len(renovation_jobs.queue))
+
+# Guards upstream predictions: adaptive concurrency limit, circuit breaker,
+# per-call deadline, retries and optional hedging past a latency percentile
+upstream = UpstreamClient(
+    limit=AdaptiveLimit(
+        initial=int(os.getenv("UPSTREAM_CONCURRENCY_INITIAL", os.getenv("RENOVATE_WORKERS", "4"))),
+        minimum=int(os.getenv("UPSTREAM_CONCURRENCY_MIN", "1")),
+        maximum=int(os.getenv("UPSTREAM_CONCURRENCY_MAX", "32")),
+    ),
+    breaker=CircuitBreaker(
+        failure_rate=float(os.getenv("UPSTREAM_BREAKER_FAILURE_RATE", "0.5")),
+        cooldown=float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30")),
+    ),
+    timeout=float(os.getenv("UPSTREAM_TIMEOUT", "120")),
+    queue_timeout=float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "30")),
+    hedge_quantile=float(os.environ["UPSTREAM_HEDGE_QUANTILE"]) if os.getenv("UPSTREAM_HEDGE_QUANTILE") else None,
+    retries=int(os.getenv("UPSTREAM_RETRIES", "1")),
+)
+metrics.gauge("akiya_upstream_concurrency_limit", "Adaptive limit of concurrent upstream predictions", callback=lambda: upstream.limit.limit)
+metrics.gauge("akiya_upstream_in_flight", "Upstream predictions running", callback=lambda: upstream.limit.in_flight)
+metrics.gauge(
+    "akiya_upstream_circuit_open", "1 while the upstream circuit breaker rejects calls",
+    callback=lambda: 0.0 if upstream.breaker.state == "closed" else 1.0,
+)
+
+# Maximum number of styles of one batch rendered at the same time
+RENOVATE_BATCH_PARALLELISM = int(os.getenv("RENOVATE_BATCH_PARALLELISM", "4"))
+
+# Uploaded photos - normalized to the working resolution of the model
+UPLOAD_URL_PREFIX = "/api/uploads/"
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+UPLOAD_MAX_SIDE = int(os.getenv("UPLOAD_MAX_SIDE", "1024"))
+upload_store = UploadStore(Path(os.getenv("UPLOAD_DIR", str(Path(tempfile.gettempdir()) / "akiya-vision" / "uploads"))))
+
+# Generated images - served by URL from /api/results instead of inline base64
+RESULTS_URL_PREFIX = "/api/results/"
+artifact_store = LocalArtifactStore(Path(os.getenv("ARTIFACT_DIR", str(Path(tempfile.gettempdir()) / "akiya-vision" / "results"))))
+
+# Serverless functions cannot start process pools (no /dev/shm)
+SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+
+# Thumbnail, display, before and side-by-side renditions of every render,
+# encoded in POSTPROCESS_WORKERS processes (0: in the job worker itself)
+postprocessor = PostProcessor(
+    artifact_store,
+    artifact_store.directory / "renditions",
+    RESULTS_URL_PREFIX,
+    max_workers=int(os.getenv("POSTPROCESS_WORKERS", "0" if SERVERLESS else "2")),
+    composite=os.getenv("POSTPROCESS_COMPOSITE", "1") != "0",
+)
 
-@app.get("/api/health")
+# Outgoing HTTP connections, shared by the whole process
+http_pool = HttpPool(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+    max_keepalive=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+)
+# Remote input images are downloaded (at most REMOTE_IMAGE_MAX_BYTES), cached
+# with their validators and sent to the model inline
+remote_images = RemoteImages(
+    http_pool,
+    Path(os.getenv("REMOTE_IMAGE_DIR", str(Path(tempfile.gettempdir()) / "akiya-vision" / "remote"))),
+    max_bytes=int(os.getenv("REMOTE_IMAGE_MAX_BYTES", str(UPLOAD_MAX_BYTES))),
+)
+
+# Default page size of /api/houses
+HOUSES_PAGE_SIZE = int(os.getenv("HOUSES_PAGE_SIZE", "50"))
+
+
+def load_image_bytes(image_data: str) -> Optional[bytes]:
+    """Return the raw bytes of an image reference, or None for remote URLs"""
+    if image_data.startswith("data:"):
+        _, _, encoded = image_data.partition(",")
+        return base64.b64decode(encoded, validate=False)
+    if image_data.startswith("http"):
+        return None
+    if image_data.startswith(UPLOAD_URL_PREFIX):
+        return upload_store.read(image_data[len(UPLOAD_URL_PREFIX):])
+    if image_data.startswith("/public/"):
+        public_dir = (BASE_DIR / "public").resolve()
+        path = (public_dir / image_data[len("/public/"):]).resolve()
+        # Never read outside the public folder
+        if public_dir not in path.parents or not path.is_file():
+            return None
+        return path.read_bytes()
+    try:
+        return base64.b64decode(image_data, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def image_digest(image_data: str, content: Optional[bytes] = None) -> str:
+    """Digest of the image content, falling back to the reference itself"""
+    if content is None:
+        content = load_image_bytes(image_data)
+    if content is None:
+        content = image_data.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def to_data_url(content: bytes, content_type: str = "image/png") -> str:
+    return f"data:{content_type};base64,{base64.b64encode(content).decode('utf-8')}"
+
+
+@router.get("/api/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "ok", "timestamp": datetime.now().isoformat()}
 
-@app.get("/", response_class=HTMLResponse)
-@limiter.limit("100/minute")
+@router.get("/api/metrics")
+async def get_metrics():
+    """Metrics in Prometheus text format"""
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@router.get("/api/cache/stats")
+async def cache_stats():
+    """Render cache hit/miss counters and renders saved by request coalescing"""
+    return {
+        **render_cache.stats(), **near_duplicates.stats(), **renovation_jobs.stats(),
+        **remote_images.stats(), **postprocessor.stats(),
+    }
+
+
+@router.get("/api/upstream/stats")
+async def upstream_stats():
+    """Adaptive concurrency limit, circuit breaker state and upstream call counters"""
+    return upstream.stats()
+
+@router.get("/", response_class=HTMLResponse, dependencies=[Depends(limiter.dependency("default"))])
 async def root(request: Request):
     """Serve the main page"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    return index_page.response(request.headers)
+
+def list_house_models(**filters) -> Tuple[List[House], Optional[str]]:
+    rows, next_cursor = repository.list_houses(**filters)
+    images = repository.images_for([row["id"] for row in rows], kind=IMAGE_UPLOAD)
+    return [house_from_row(row, images[row["id"]]) for row in rows], next_cursor
+
+@router.get("/api/houses", dependencies=[Depends(limiter.dependency("default"))])
+async def get_houses(
+    request: Request,
+    ward: Optional[str] = None,
+    min_price: Optional[int] = Query(None, ge=0, description="Minimum price in yen"),
+    max_price: Optional[int] = Query(None, ge=0, description="Maximum price in yen"),
+    min_area: Optional[float] = Query(None, ge=0, description="Minimum area in m²"),
+    max_area: Optional[float] = Query(None, ge=0, description="Maximum area in m²"),
+    min_age: Optional[int] = Query(None, ge=0, description="Minimum age in years"),
+    max_age: Optional[int] = Query(None, ge=0, description="Maximum age in years"),
+    sort: str = Query("id", pattern="^-?(id|price|area|age)$"),
+    limit: int = Query(HOUSES_PAGE_SIZE, ge=1, le=200),
+    cursor: Optional[str] = Query(None, max_length=500),
+):
+    """
+    List houses, optionally filtered and sorted.
 
-@app.get("/api/houses")
-@limiter.limit("100/minute")
-async def get_houses(request: Request):
-    """Get all houses"""
+    Pages are keyset-paginated: when more results exist, the cursor of the
+    next page is returned in the X-Next-Cursor header and a Link header.
+    """
+    filters = dict(
+        ward=ward, min_price=min_price, max_price=max_price, min_area=min_area, max_area=max_area,
+        min_age=min_age, max_age=max_age, sort=sort, limit=limit, cursor=cursor,
+    )
+    
+    def build() -> EncodedPayload:
+        houses, next_cursor = list_house_models(**filters)
+        return encode_payload(
+            [house.model_dump() for house in houses],
+            headers={"X-Next-Cursor": next_cursor} if next_cursor else None,
+        )
+    
+    def load() -> EncodedPayload:
+        catalog.refresh()
+        if request.url.query:
+            return build()
+        # The default first page is served pre-encoded until the data changes
+        return catalog.encoded("houses", build, revision=repository.revision())
+    
     try:
-        # Always return demo data in serverless environment
-        demo_houses = get_demo_houses()
-        houses_list = list(demo_houses.values())
-        print(f"Returning {len(houses_list)} houses")
-        return houses_list
-    except Exception as e:
-        print(f"Error in get_houses: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Error fetching houses: {str(e)}")
+        # SQLite reads (and seeding on a catalog change) stay off the event loop
+        payload = await run_in_threadpool(load)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    response = payload_response(payload, request)
+    next_cursor = response.headers.get("X-Next-Cursor")
+    if next_cursor:
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return response
+
+def require_house(house_id: str) -> None:
+    """404 unless the house is listed; blocking, so call it in the threadpool"""
+    catalog.refresh()
+    if not repository.house_exists(house_id):
+        raise HTTPException(status_code=404, detail="House not found")
+
+@router.get("/api/houses/{house_id}/images", dependencies=[Depends(limiter.dependency("default"))])
+async def get_house_images(house_id: str, request: Request, kind: Optional[str] = Query(None, pattern="^(upload|generated)$")):
+    """Uploaded and generated images linked to a house"""
+    await run_in_threadpool(require_house, house_id)
+    images = await run_in_threadpool(repository.images_for, [house_id], kind=kind)
+    return images[house_id]
 
-@app.get("/api/demo-images/{house_type}")
-@limiter.limit("100/minute")
+def with_variants(image: Dict[str, str]) -> Dict:
+    """A demo image with srcset-ready URLs of its renditions, when they were built"""
+    entry = demo_variants["images"].get(image.get("id"))
+    if entry is None:
+        return image
+    url_for = lambda name: assets.url_for(f"{demo_variants['directory']}/{name}")
+    return {
+        **image,
+        "width": entry["width"],
+        "height": entry["height"],
+        "srcset": {
+            "webp": srcset(entry, "image/webp", url_for),
+            "jpeg": srcset(entry, "image/jpeg", url_for),
+        },
+    }
+
+@router.get("/api/demo-images/{house_type}", dependencies=[Depends(limiter.dependency("default"))])
 async def get_demo_images(house_type: str, request: Request):
-    """Get demo images for a house type"""
-    if house_type == "house1":
-        return DEMO_IMAGES.get("kominka", [])
-    elif house_type == "house2":
-        return DEMO_IMAGES.get("ikkodate", [])
-    else:
+    """Get demo images for a house"""
+    
+    def load() -> Optional[EncodedPayload]:
+        images = catalog.demo_images(house_type)
+        if images is None:
+            return None
+        return catalog.encoded(f"demo-images:{house_type}", lambda: [with_variants(image) for image in images])
+    
+    payload = await run_in_threadpool(load)
+    if payload is None:
         raise HTTPException(status_code=404, detail="House type not found")
+    return payload_response(payload, request)
 
 
-@app.post("/api/renovate/{house_id}/{image_id}")
-@limiter.limit("10/hour")  # Strict limit for expensive AI operations
-async def renovate_image(house_id: str, image_id: str, renovation_request: RenovateRequest, request: Request):
-    """Generate a renovated version of the image"""
-    # Get demo houses for serverless environment
-    demo_houses = get_demo_houses()
+@router.post("/api/upload/{house_id}", dependencies=[Depends(limiter.dependency("upload"))])
+async def upload_image(house_id: str, request: Request):
+    """
+    Upload a photo for a house.
+
+    The body is streamed to a spooled temp file with a hard size limit, the
+    image header is validated and the stored copy is rotated per EXIF and
+    downscaled before it is ever sent upstream.
+    """
+    await run_in_threadpool(require_house, house_id)
     
-    if house_id not in demo_houses:
-        raise HTTPException(status_code=404, detail="House not found")
+    try:
+        received = await receive_file(request, "file", UPLOAD_MAX_BYTES)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    try:
+        # Decoding and resizing are CPU bound - keep them off the event loop
+        validate_image(received)
+        content, (width, height) = await run_in_threadpool(normalize_image, received.file, UPLOAD_MAX_SIDE)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        logging.error(f"Error processing upload: {str(e)}")
+        raise HTTPException(status_code=400, detail="画像を読み込めません")
+    finally:
+        received.file.close()
     
-    house = demo_houses[house_id]
+    image_id = await run_in_threadpool(upload_store.save, content)
+    await run_in_threadpool(
+        repository.add_image,
+        house_id,
+        IMAGE_UPLOAD,
+        url=f"{UPLOAD_URL_PREFIX}{image_id}",
+        name=received.filename[:200],
+        image_id=image_id,
+    )
+    
+    return {
+        "image_id": image_id,
+        "message": "Image uploaded successfully",
+        "url": f"{UPLOAD_URL_PREFIX}{image_id}",
+        "width": width,
+        "height": height,
+        "bytes": len(content)
+    }
+
+
+@router.get("/api/uploads/{image_id}")
+async def get_uploaded_image(image_id: str):
+    """Serve a normalized upload"""
+    path = upload_store.path(image_id)
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type="image/jpeg")
+
+
+def resolve_renovation_image(house_id: str, image_id: str, image_url: Optional[str]) -> Dict[str, str]:
+    """
+    Validate the house and image of a renovation request and return the image.
+    Reads the database: call it in the threadpool.
+    """
+    require_house(house_id)
     
     # Check if it's a demo image
     if image_id.startswith("demo-"):
         # For demo images, create a temporary image entry using the provided URL
-        if not renovation_request.image_url:
+        if not image_url:
             raise HTTPException(status_code=400, detail="Image URL required for demo images")
-        image = {"id": image_id, "data": renovation_request.image_url}
+        image = {"id": image_id, "data": image_url}
     else:
-        # Look for uploaded image
-        image = next((img for img in house.images if img["id"] == image_id), None)
-        if not image:
+        # Look up the uploaded image by its id
+        uploaded = repository.get_image(house_id, image_id)
+        if not uploaded or uploaded["kind"] != IMAGE_UPLOAD:
             raise HTTPException(status_code=404, detail="Image not found")
+        image = {"id": image_id, "data": uploaded["url"]}
     
-    if renovation_request.style not in RENOVATION_STYLES:
+    return image
+
+
+def validate_style(style: str) -> None:
+    if style not in RENOVATION_STYLES:
         raise HTTPException(status_code=400, detail="Invalid style")
+
+
+def renovation_cost(styles: int = 1, num_inference_steps: int = NUM_INFERENCE_STEPS) -> int:
+    """Rate-limit tokens for rendering ``styles`` styles; renders above the default step count cost more"""
+    return styles * max(1, math.ceil(num_inference_steps / NUM_INFERENCE_STEPS))
+
+
+async def fetch_remote_input(url: str) -> bytes:
+    """Download a remote input image and normalize it like an upload"""
+    try:
+        remote = await remote_images.fetch(url)
+    except RemoteImageError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    try:
+        # Same header check as uploads, so a small file cannot decode to a huge bitmap
+        await run_in_threadpool(check_dimensions, io.BytesIO(remote.content))
+        content, _ = await run_in_threadpool(normalize_image, io.BytesIO(remote.content), UPLOAD_MAX_SIDE)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception:
+        raise HTTPException(status_code=400, detail="画像を読み込めませんでした")
+    return content
+
+
+async def prepare_renovation_input(image: Dict[str, str]) -> RenderInput:
+    """
+    Decode an image reference once into what every style render needs.
+
+    Images are always sent to the model inline: /public assets and uploads
+    are read from disk and remote URLs are downloaded here, so the model never
+    fetches anything back from us or from a third party.
+    """
+    source = image["data"]
+    with renovation_phase.time(phase="input"):
+        if source.startswith("http"):
+            content = await fetch_remote_input(source)
+        else:
+            # Demo images are sent as their model-resolution rendition
+            content = load_image_bytes(demo_model_inputs.get(source, source))
+        if source.startswith("data:"):
+            image_input = source
+        elif content is not None:
+            image_input = to_data_url(content, sniff_image_type(content[:16]) or "image/jpeg")
+        elif source.startswith((UPLOAD_URL_PREFIX, "/public/")):
+            raise HTTPException(status_code=404, detail="Image not found")
+        else:
+            # Assume it's base64 without data URL prefix
+            image_input = f"data:image/png;base64,{source}"
+        digest = image_digest(source, content)
+    if content:
+        renovation_bytes.inc(len(content), direction="input")
+    return RenderInput(
+        data=source,
+        digest=digest,
+        input=image_input,
+        content=content,
+    )
+
+
+def link_generated_image(house_id: str, style: str, prepared: RenderInput, url: str) -> None:
+    """Record a render against its house; the same render is only linked once"""
+    source = prepared.data
+    if source.startswith("data:") or len(source) > 500:
+        source = f"sha256:{prepared.digest}"
+    image_id = hashlib.sha256(f"{house_id}\0{source}\0{url}".encode("utf-8")).hexdigest()[:32]
+    repository.add_image(house_id, IMAGE_GENERATED, url=url, style=style, source=source, image_id=image_id)
+
+
+def renovation_key(prepared: RenderInput, style: str) -> str:
+    """Identity of a render: the same key always produces the same image"""
+    return render_cache_key(
+        image_digest=prepared.digest,
+        style=style,
+        prompt=RENOVATION_STYLES[style]["prompt"],
+        negative_prompt=NEGATIVE_PROMPT,
+        num_inference_steps=NUM_INFERENCE_STEPS,
+        model_version=get_backend().version,
+    )
+
+
+def renovation_context(style: str) -> str:
+    """Identity of a render apart from its input image"""
+    return render_cache_key(
+        image_digest="",
+        style=style,
+        prompt=RENOVATION_STYLES[style]["prompt"],
+        negative_prompt=NEGATIVE_PROMPT,
+        num_inference_steps=NUM_INFERENCE_STEPS,
+        model_version=get_backend().version,
+    )
+
+
+def find_near_duplicate(context: str, perceptual: int) -> Optional[CacheEntry]:
+    """The cached render of the nearest similar input, dropping index entries whose render was evicted"""
+    for _, value_hash, key in near_duplicates.find(context, perceptual):
+        entry = render_cache.get(key)
+        if entry is not None:
+            return entry
+        near_duplicates.remove(context, value_hash, key)
+    return None
+
+
+def submit_renovation(
+    prepared: RenderInput, style: str, house_id: Optional[str] = None, detached: bool = False, client: str = ""
+):
+    """
+    Start a render, or attach to the identical render already in flight.
+
+    Concurrent requests for the same image and style share one upstream
+    prediction. A joined render was started for another request, so its
+    result is linked to ``house_id`` once it succeeds. New renders wait in
+    ``client``'s share of the queue; raises ``JobRejected`` when it is full.
+    """
+    job, joined = renovation_jobs.submit_shared(
+        renovation_key(prepared, style), render_renovation, prepared, style, house_id, detached=detached, client=client
+    )
+    if not joined:
+        def record_queue_time(future) -> None:
+            if job.started_at is not None:
+                renovation_phase.observe(job.started_at - job.created_at, phase="queue")
+        job.future.add_done_callback(record_queue_time)
+    if joined and house_id:
+        def link_result(future) -> None:
+            if future.cancelled() or future.exception() is not None:
+                return
+            url = future.result()["output"][0]
+            if url.startswith(RESULTS_URL_PREFIX):
+                link_generated_image(house_id, style, prepared, url)
+        job.future.add_done_callback(link_result)
+    return job
+
+
+def add_renditions(result: Dict, artifact_id: str, content: bytes, prepared: RenderInput) -> Dict:
+    """Attach the web renditions of a stored render; a render without them is still a result"""
+    try:
+        renovation_jobs.reporter()("postprocess")
+        with renovation_phase.time(phase="postprocess"):
+            result["renditions"] = postprocessor.renditions(artifact_id, content, prepared.content, prepared.digest)
+    except Exception as e:
+        logging.error(f"Post-processing failed: {str(e)}")
+    return result
+
+
+def render_renovation(prepared: RenderInput, style: str, house_id: Optional[str] = None) -> Dict:
+    """
+    Produce the renovated image for a validated request.
+
+    This blocks for the duration of the upstream prediction, so it must run
+    in the job worker pool rather than on the event loop. Renders stored as
+    artifacts are linked to ``house_id``.
+    """
+    style_config = RENOVATION_STYLES[style]
+    backend = get_backend()
+    report = renovation_jobs.reporter()
     
-    style_config = RENOVATION_STYLES[renovation_request.style]
-    
-    # Check if Replicate API token is configured
-    if not os.getenv("REPLICATE_API_TOKEN"):
+    # Without a Replicate API token (or with INFERENCE_BACKEND=mock)
+    if backend.name == "mock":
         # Return mock response for development
+        renovations_total.inc(backend="mock", outcome="succeeded")
         return {
             "id": f"mock-{uuid.uuid4()}",
             "status": "succeeded",
-            "output": [image["data"]],  # Return original image as mock
-            "style": renovation_request.style,
+            "output": [prepared.data],  # Return original image as mock
+            "style": style,
             "message": "Mock response - configure REPLICATE_API_TOKEN for real generation"
         }
     
     try:
-        # Initialize Replicate client
-        import replicate
-        
-        # Handle different image formats
-        if image["data"].startswith("data:"):
-            # It's a base64 data URL
-            image_input = image["data"]
-        elif image["data"].startswith("http"):
-            # It's a URL - use directly
-            image_input = image["data"]
-        elif image["data"].startswith("/public/"):
-            # In production on Vercel, these images are served from public folder
-            # The Replicate API can accept URLs
-            
-            # Get the base URL from the request
-            base_url = str(request.base_url).rstrip('/')
-            
-            # Construct the full URL for the image
-            image_input = f"{base_url}{image['data']}"
-            
-            print(f"Using demo image URL: {image_input}")
-        else:
-            # Assume it's base64 without data URL prefix
-            image_input = f"data:image/png;base64,{image['data']}"
-        
-        # Run Interior AI model by erayyavuz
-        # This model is specifically trained for interior design transformations
-        output = replicate.run(
-            "erayyavuz/interior-ai:e299c531485aac511610a878ef44b554381355de5ee032d109fcae5352f39fa9",
-            input={
-                "input": image_input,  # Note: this model uses "input" instead of "image"
-                "prompt": style_config["prompt"],
-                "negative_prompt": "lowres, watermark, banner, logo, watermark, contactinfo, text, deformed, blurry, blur, out of focus, out of frame, surreal, extra, ugly, upholstered walls, fabric walls, plush walls, mirror, mirrored, functional",
-                "num_inference_steps": 25
+        # Serve identical requests from the render cache
+        cache_key = renovation_key(prepared, style)
+        context = renovation_context(style)
+        perceptual = None
+        near_duplicate = False
+        with renovation_phase.time(phase="cache_lookup"):
+            cached = render_cache.get(cache_key)
+            if cached is None and prepared.content and near_duplicates.max_distance >= 0:
+                perceptual = dhash(prepared.content)
+                if perceptual is not None:
+                    cached = find_near_duplicate(context, perceptual)
+                    if cached is not None:
+                        near_duplicate = True
+                        near_duplicates.record_hit()
+                        # Exact repeats of this upload are plain cache hits from now on
+                        render_cache.put(cache_key, cached)
+        if cached is not None:
+            renovations_total.inc(backend=backend.name, outcome="near_duplicate" if near_duplicate else "cached")
+            # Storing existing bytes again is a no-op for the content-addressed store
+            artifact = artifact_store.put(cached.data, cached.content_type)
+            if house_id:
+                link_generated_image(house_id, style, prepared, f"{RESULTS_URL_PREFIX}{artifact.id}")
+            result = {
+                "id": cache_key,
+                "status": "succeeded",
+                "output": [f"{RESULTS_URL_PREFIX}{artifact.id}"],
+                "style": style,
+                "cached": True
             }
-        )
+            if near_duplicate:
+                result["near_duplicate"] = True
+            return add_renditions(result, artifact.id, cached.data, prepared)
+        
+        report("upstream", 0.0)
+        with renovation_phase.time(phase="upstream"):
+            output = upstream.call(
+                backend.predict,
+                prepared,
+                style=style,
+                prompt=style_config["prompt"],
+                negative_prompt=NEGATIVE_PROMPT,
+                num_inference_steps=NUM_INFERENCE_STEPS,
+                on_progress=lambda fraction: report("upstream", fraction),
+                cancellable=True,
+            )
         
         # Handle output from interior AI model
-        # Different models return different formats (bytes, file-like objects, or URLs)
+        # Bytes are stored as an artifact and returned by URL; upstream URLs expire,
+        # so only byte outputs are cached
+        content = None
+        generated_url = prepared.data
+        decode_started = time.perf_counter()
         try:
-            if hasattr(output, 'read'):
-                # It's a file-like object, read the bytes
-                content = output.read()
-                generated_url = f"data:image/png;base64,{base64.b64encode(content).decode('utf-8')}"
-            elif isinstance(output, bytes):
-                # Direct bytes
-                generated_url = f"data:image/png;base64,{base64.b64encode(output).decode('utf-8')}"
-            elif isinstance(output, str) and output.startswith('http'):
-                # It's already a URL
-                generated_url = output
-            elif isinstance(output, list) and len(output) > 0:
-                # List of outputs
-                first = output[0]
-                if hasattr(first, 'read'):
-                    content = first.read()
-                    generated_url = f"data:image/png;base64,{base64.b64encode(content).decode('utf-8')}"
-                elif isinstance(first, str):
-                    generated_url = first
-                else:
-                    generated_url = str(first)
-            else:
-                # Fallback
-                generated_url = image["data"]
+            content, output_url = read_output(output)
+            if output_url:
+                generated_url = output_url
         except Exception as e:
             # Don't expose error details, use fallback
-            generated_url = image["data"]
+            content = None
+        renovation_phase.observe(time.perf_counter() - decode_started, phase="output_decode")
         
-        # Store generated image
-        generated_image = {
-            "id": str(uuid.uuid4()),
-            "original_id": image_id,
-            "style": renovation_request.style,
-            "data": generated_url,
-            "generated_at": datetime.now().isoformat()
-        }
+        if content:
+            renovation_bytes.inc(len(content), direction="output")
+            store_started = time.perf_counter()
+            content_type = sniff_image_type(content[:16]) or "image/png"
+            artifact = artifact_store.put(content, content_type)
+            generated_url = f"{RESULTS_URL_PREFIX}{artifact.id}"
+            render_cache.put(cache_key, CacheEntry(
+                data=content,
+                content_type=content_type,
+                style=style,
+                fingerprint=render_cache.fingerprints[style],
+            ))
+            if perceptual is not None:
+                near_duplicates.add(context, perceptual, cache_key)
+            if house_id:
+                link_generated_image(house_id, style, prepared, generated_url)
+            renovation_phase.observe(time.perf_counter() - store_started, phase="output_store")
         
-        # Note: In serverless, we don't persist the generated images
-        # They would need to be stored in a database or external storage
-        
-        return {
-            "id": generated_image["id"],
+        renovations_total.inc(backend=backend.name, outcome="succeeded")
+        result = {
+            "id": str(uuid.uuid4()),
             "status": "succeeded",
-            "output": [str(generated_image["data"])],  # Ensure string
-            "style": renovation_request.style
+            "output": [str(generated_url)],  # Ensure string
+            "style": style
         }
+        if content:
+            add_renditions(result, artifact.id, content, prepared)
+        return result
         
+    except UpstreamUnavailable:
+        renovations_total.inc(backend=backend.name, outcome="rejected")
+        raise
+    except UpstreamTimeout:
+        renovations_total.inc(backend=backend.name, outcome="timeout")
+        raise
     except Exception as e:
         # Log the error internally but don't expose details to client
-        import logging
+        renovations_total.inc(backend=backend.name, outcome="failed")
         logging.error(f"Error in renovate endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail="画像生成に失敗しました")
+        raise JobError("画像生成に失敗しました")
+
+
+async def prerendered_result(image: Dict[str, str], style: str, house_id: str) -> Optional[Dict]:
+    """The response for a demo render made offline, or None when there is none"""
+    entry = prerendered.lookup(image["data"], style)
+    if entry is None:
+        return None
+    url = assets.url_for(entry["asset"])
+    renovations_total.inc(backend="prerendered", outcome="succeeded")
+    source = RenderInput(data=image["data"], digest=entry["source_sha256"], input=image["data"])
+    # A repeat finds the link already there; the first one writes off the event loop
+    await run_in_threadpool(link_generated_image, house_id, style, source, url)
+    return {
+        "id": entry["key"],
+        "status": "succeeded",
+        "output": [url],
+        "style": style,
+        "cached": True,
+        "prerendered": True,
+    }
+
+
+def job_error(status_code: int, detail: str, retry_after: Optional[float] = None) -> HTTPException:
+    headers = None
+    if retry_after is not None:
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+    return HTTPException(status_code=status_code, detail=detail, headers=headers)
+
+
+def job_failure(job) -> HTTPException:
+    """The error response for a failed render job"""
+    return job_error(job.error_status, job.error or "画像生成に失敗しました", job.retry_after)
+
+
+def renovation_client(request: Request) -> str:
+    """Whose share of the render queue a request uses: the rate-limit identity"""
+    return limiter.key_func(request)
+
+
+def admit_renovation(request: Request, styles: int = 1) -> str:
+    """
+    Shed a renovation before any work or rate-limit budget is spent on it
+    when the render queue has no room; returns the caller's queue identity.
+    """
+    client = renovation_client(request)
+    try:
+        renovation_jobs.admit(client, styles)
+    except JobRejected as e:
+        raise job_error(e.status_code, str(e), e.retry_after)
+    return client
+
+
+async def charged_input(request: Request, image: Dict[str, str], styles: int = 1) -> RenderInput:
+    """
+    Charge the renovate budget, then resolve the input image.
+
+    The budget is taken before any download or decoding, so an exhausted
+    client cannot make us fetch images; it is refunded when the input turns
+    out to be unusable.
+    """
+    cost = renovation_cost(styles)
+    await limiter.hit_async(request, "renovate", cost)
+    try:
+        return await prepare_renovation_input(image)
+    except Exception:
+        await limiter.refund_async(request, "renovate", cost)
+        raise
+
+
+@router.post("/api/renovate/{house_id}/{image_id}")
+async def renovate_image(house_id: str, image_id: str, renovation_request: RenovateRequest, request: Request):
+    """Generate a renovated version of the image (waits for the result)"""
+    image = await run_in_threadpool(resolve_renovation_image, house_id, image_id, renovation_request.image_url)
+    validate_style(renovation_request.style)
+    # Prerendered demo renders never go upstream, so they are not charged
+    result = await prerendered_result(image, renovation_request.style, house_id)
+    if result is not None:
+        return result
+    client = admit_renovation(request)
+    prepared = await charged_input(request, image)
+    
+    # Run in the worker pool so other requests keep being served meanwhile
+    try:
+        job = submit_renovation(prepared, renovation_request.style, house_id, client=client)
+    except JobRejected as e:
+        raise job_error(e.status_code, str(e), e.retry_after)
+    try:
+        return await renovation_jobs.wait(job)
+    except Exception:
+        raise job_failure(job)
+
+
+@router.post("/api/renovate/{house_id}/{image_id}/jobs", status_code=202)
+async def submit_renovation_job(house_id: str, image_id: str, renovation_request: RenovateRequest, request: Request):
+    """
+    Queue a renovation and return immediately with a job id to poll.
+
+    A prerendered demo render is answered right away with ``200`` and the result.
+    """
+    image = await run_in_threadpool(resolve_renovation_image, house_id, image_id, renovation_request.image_url)
+    validate_style(renovation_request.style)
+    result = await prerendered_result(image, renovation_request.style, house_id)
+    if result is not None:
+        return JSONResponse(status_code=200, content=result)
+    client = admit_renovation(request)
+    prepared = await charged_input(request, image)
+    try:
+        job = submit_renovation(prepared, renovation_request.style, house_id, detached=True, client=client)
+    except JobRejected as e:
+        raise job_error(e.status_code, str(e), e.retry_after)
+    status_url = f"/api/renovate/jobs/{job.id}"
+    described = renovation_jobs.describe(job)
+    content = {
+        "job_id": job.id,
+        "status": described["status"],
+        "status_url": status_url,
+        "events_url": f"{status_url}/events",
+    }
+    # Where the job stands in the render queue, while it waits
+    content.update({name: described[name] for name in ("queue_position", "estimated_wait") if name in described})
+    return JSONResponse(status_code=202, content=content, headers={"Location": status_url})
+
+
+@router.post("/api/renovate/{house_id}/{image_id}/batch")
+async def renovate_image_batch(house_id: str, image_id: str, batch_request: BatchRenovateRequest, request: Request):
+    """
+    Render one image in several styles concurrently.
+
+    Results are streamed as newline-delimited JSON, one line per style in the
+    order they finish. A failed style is reported on its own line and does not
+    affect the others.
+    """
+    image = await run_in_threadpool(resolve_renovation_image, house_id, image_id, batch_request.image_url)
+    if batch_request.styles == "all":
+        styles = list(RENOVATION_STYLES)
+    else:
+        # Keep the requested order but render each style once
+        styles = list(dict.fromkeys(batch_request.styles))
+        if not styles:
+            raise HTTPException(status_code=400, detail="No styles requested")
+        for style in styles:
+            validate_style(style)
+    # Prerendered demo renders are streamed first and neither queued nor charged
+    prerendered_lines = []
+    for style in list(styles):
+        result = await prerendered_result(image, style, house_id)
+        if result is not None:
+            prerendered_lines.append(result)
+            styles.remove(style)
+    prepared = None
+    client = None
+    if styles:
+        client = admit_renovation(request, len(styles))
+        # Decode and digest the input image once for the whole batch
+        prepared = await charged_input(request, image, len(styles))
+    parallelism = asyncio.Semaphore(RENOVATE_BATCH_PARALLELISM)
+    
+    async def render_style(style: str) -> Dict:
+        async with parallelism:
+            try:
+                job = submit_renovation(prepared, style, house_id, client=client)
+            except JobRejected as e:
+                return {"status": "failed", "style": style, "error": str(e), "retry_after": math.ceil(e.retry_after)}
+            try:
+                return await renovation_jobs.wait(job)
+            except Exception:
+                failure = {"status": "failed", "style": style, "error": job.error or "画像生成に失敗しました"}
+                if job.retry_after is not None:
+                    failure["retry_after"] = math.ceil(job.retry_after)
+                return failure
+    
+    async def stream_results():
+        for result in prerendered_lines:
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        tasks = [asyncio.create_task(render_style(style)) for style in styles]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # The client went away: stop the styles that have not finished,
+            # which also drops their jobs from the queue if they have not started
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@router.get("/api/results/{artifact_id}")
+async def get_result(artifact_id: str, request: Request):
+    """Serve a generated image by its content hash"""
+    artifact = artifact_store.get(artifact_id)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    
+    # Content never changes for a given id
+    headers = {
+        "ETag": artifact.etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if etag_matches(request.headers.get("if-none-match"), artifact.etag):
+        return Response(status_code=304, headers=headers)
+    if artifact.path is None:
+        return Response(content=artifact_store.read(artifact_id), media_type=artifact.content_type, headers=headers)
+    return ArtifactFileResponse(
+        artifact.path,
+        media_type=artifact.content_type,
+        headers=headers,
+        stat_result=os.stat(artifact.path),
+    )
+
+
+@router.get("/api/renovate/jobs/{job_id}")
+async def get_renovation_job(job_id: str):
+    """Poll the status of a renovation job, with its queue position while it waits"""
+    job = renovation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return renovation_jobs.describe(job)
+
+
+async def job_events(job_id: str):
+    """
+    Server-Sent Events for one job: its state now, then every change until
+    it finishes, with a heartbeat comment while nothing happens.
+    """
+    subscription = renovation_jobs.events.subscribe(job_id)
+    try:
+        # Subscribed first, so no change between the two is missed
+        job = renovation_jobs.get(job_id)
+        if job is None:
+            return
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        event = renovation_jobs.describe(job)
+        event_id = 0
+        while True:
+            if event is None:
+                yield ": heartbeat\n\n"
+            else:
+                event_id += 1
+                yield sse_message(event, event_id=event_id)
+                if event["status"] in (SUCCEEDED, FAILED):
+                    return
+            event = await subscription.next(SSE_HEARTBEAT)
+    finally:
+        subscription.close()
+
+
+@router.get("/api/renovate/jobs/{job_id}/events", dependencies=[Depends(limiter.dependency("default"))])
+async def stream_renovation_job(job_id: str):
+    """Stream the status, queue position and progress of a renovation job"""
+    if renovation_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        job_events(job_id),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def create_app() -> FastAPI:
+    """Build the ASGI app around the module-level services and routes"""
+    app = FastAPI(title="AkiyaVision", version="1.0.0", lifespan=lifespan)
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, handle_rate_limit_exceeded)
+    app.add_middleware(RateLimitHeadersMiddleware)
+
+    # JSON responses above the threshold are compressed; streams chunk by chunk
+    app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESS_MIN_BYTES", "1024")))
+
+    # Security headers middleware - pure ASGI with precomputed headers
+    # The page CSP applies to HTML and static files, API responses get a locked-down policy
+    app.add_middleware(
+        SecurityHeadersMiddleware,
+        policies=[
+            ("/", {"Content-Security-Policy": PAGE_CSP}),
+            ("/api/", {"Content-Security-Policy": API_CSP}),
+        ],
+    )
+
+    # Configure CORS - Restrict to specific origins in production
+    # For development, you can add localhost origins
+    allowed_origins = [
+        "http://localhost:8000",
+        "http://localhost:3000",
+        "http://127.0.0.1:8000",
+        # Add your production domain here when deploying
+        # "https://your-domain.com"
+        "*",  # Allow all origins temporarily for debugging
+    ]
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=allowed_origins,
+        allow_credentials=True,
+        allow_methods=["GET", "POST"],
+        allow_headers=["Content-Type", "Authorization", "Accept", "Origin"],
+    )
+
+    # Outermost, so request timings include every other middleware
+    app.add_middleware(MetricsMiddleware, registry=metrics)
+
+    app.include_router(router)
+    app.mount("/public", StaticAssets(assets), name="public")
+    # /static is kept as an alias for old links
+    app.mount("/static", StaticAssets(assets), name="static")
+    return app
+
+
+app = create_app()
 
 if __name__ == "__main__":
+    import uvicorn
+
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     uvicorn.run(app, host=host, port=port, reload=True)
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""
+End-to-end load benchmark: the app under uvicorn against a fake Replicate.
+
+Starts ``benchmarks.fake_replicate`` and ``benchmarks.serve`` as
+subprocesses, then drives a mixed workload over real HTTP at fixed arrival
+rates (open loop). Latency is measured from each request's scheduled start,
+so a stalled server shows up as queueing delay instead of fewer requests.
+
+Workloads:
+
+- ``catalog``: house list, filtered list, demo image list and house images
+- ``static``: demo JPEGs from /public
+- ``renovate``: demo image renders in a random style (repeat renders hit the
+  render cache or join an in-flight render)
+- ``renovate_unique``: a freshly generated image per request, always upstream
+
+Results are printed as JSON (and written to ``--output``); compare two runs
+with ``python -m benchmarks.compare``.
+
+Usage:
+    python -m benchmarks.bench_e2e [--duration 20] [--rate catalog=50]
+        [--rate static=20] [--rate renovate=2] [--rate renovate_unique=0.5]
+        [--latency-ms 2000] [--failure-rate 0.02] [--output-bytes 300000]
+        [--output results.json]
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.fake_replicate import add_arguments as add_fake_replicate_arguments
+from benchmarks.serve import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_RATES = {"catalog": 50.0, "static": 20.0, "renovate": 2.0, "renovate_unique": 0.5}
+
+CATALOG_PATHS = [
+    "/api/houses",
+    "/api/houses?sort=price",
+    "/api/demo-images/house1",
+    "/api/houses/house1/images",
+]
+DEMO_IMAGES = [f"demo{i}" for i in range(1, 7)]
+STYLES = [
+    "modern", "traditional", "western", "scandinavian", "industrial", "zen",
+    "showa", "luxury", "eco", "mediterranean", "smart", "bohemian",
+]
+
+Request = Tuple[str, str, dict]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def demo_url(name: str) -> str:
+    return next(f"/public/{p.name}" for p in (ROOT / "public").glob(f"{name}.*"))
+
+
+def unique_image(rng: random.Random) -> str:
+    """A small JPEG with random content, as a data URL"""
+    from PIL import Image
+
+    image = Image.new("RGB", (64, 48), tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def request_factories(rng: random.Random) -> Dict[str, Callable[[int], Request]]:
+    demo_urls = [demo_url(name) for name in DEMO_IMAGES]
+
+    def catalog(i: int) -> Request:
+        return "GET", CATALOG_PATHS[i % len(CATALOG_PATHS)], {}
+
+    def static(i: int) -> Request:
+        return "GET", demo_urls[i % len(demo_urls)], {}
+
+    def renovate(i: int) -> Request:
+        index = rng.randrange(len(demo_urls))
+        body = {"style": rng.choice(STYLES), "image_url": demo_urls[index]}
+        return "POST", f"/api/renovate/house1/{DEMO_IMAGES[index].replace('demo', 'demo-')}", {"json": body}
+
+    def renovate_unique(i: int) -> Request:
+        body = {"style": rng.choice(STYLES), "image_url": unique_image(rng)}
+        return "POST", "/api/renovate/house1/demo-bench", {"json": body}
+
+    return {
+        "catalog": catalog,
+        "static": static,
+        "renovate": renovate,
+        "renovate_unique": renovate_unique,
+    }
+
+
+async def run_workload(
+    client: httpx.AsyncClient, name: str, rate: float, duration: float, start: float, make: Callable[[int], Request],
+) -> Dict:
+    """Send ``rate`` requests per second for ``duration`` seconds, on schedule"""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    transferred = 0
+
+    async def one(i: int, scheduled: float) -> None:
+        nonlocal transferred
+        method, path, kwargs = make(i)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            response = await client.request(method, path, **kwargs)
+            statuses[str(response.status_code)] += 1
+            transferred += len(response.content)
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+
+    count = int(rate * duration)
+    await asyncio.gather(*(one(i, start + i / rate) for i in range(count)))
+    elapsed = max(time.perf_counter() - start, duration)
+    ok = sum(n for status, n in statuses.items() if status.startswith("2") or status == "304")
+    return {
+        "rate": rate,
+        "requests": count,
+        "ok": ok,
+        "errors": count - ok,
+        "status_counts": dict(sorted(statuses.items())),
+        "throughput_rps": round(ok / elapsed, 2),
+        "bytes_received": transferred,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(max(latencies, default=0.0), 2),
+        },
+    }
+
+
+async def wait_until_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not become ready")
+
+
+async def drive(base_url: str, upstream_url: str, rates: Dict[str, float], duration: float, seed: int) -> Dict:
+    factories = request_factories(random.Random(seed))
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        # Warm up imports, the catalog payloads and the backend client
+        for path in CATALOG_PATHS:
+            await client.get(path)
+        await client.post("/__bench/reset")
+
+        start = time.perf_counter() + 0.1
+        results = await asyncio.gather(*(
+            run_workload(client, name, rate, duration, start, factories[name])
+            for name, rate in rates.items() if rate > 0
+        ))
+        server = (await client.get("/__bench/stats")).json()
+        cache = (await client.get("/api/cache/stats")).json()
+    async with httpx.AsyncClient() as client:
+        upstream = (await client.get(f"{upstream_url}/stats")).json()
+    return {
+        "workloads": dict(zip((name for name, rate in rates.items() if rate > 0), results)),
+        "server": server,
+        "render_cache": cache,
+        "upstream": upstream,
+    }
+
+
+def parse_rates(values: List[str]) -> Dict[str, float]:
+    rates = dict(DEFAULT_RATES)
+    for value in values:
+        name, _, rate = value.partition("=")
+        if name not in DEFAULT_RATES:
+            raise SystemExit(f"Unknown workload: {name}")
+        rates[name] = float(rate)
+    return rates
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--rate", action="append", default=[], help="workload=requests per second")
+    parser.add_argument("--output", type=Path)
+    add_fake_replicate_arguments(parser)
+    args = parser.parse_args()
+    rates = parse_rates(args.rate)
+
+    app_port, upstream_port = free_port(), free_port()
+    base_url = f"http://127.0.0.1:{app_port}"
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    state_dir = Path(tempfile.mkdtemp(prefix="akiya-bench-"))
+    env = {
+        **os.environ,
+        "INFERENCE_BACKEND": "replicate",
+        "REPLICATE_API_TOKEN": "bench-token",
+        "REPLICATE_BASE_URL": upstream_url,
+        # Keep every run cold and independent of local state
+        "RENDER_CACHE_DIR": str(state_dir / "renders"),
+        "UPLOAD_DIR": str(state_dir / "uploads"),
+        "ARTIFACT_DIR": str(state_dir / "results"),
+        "DATABASE_PATH": str(state_dir / "akiya.db"),
+        # Measure the server, not the limiter
+        "RATE_LIMIT_DEFAULT": "1000000/second",
+        "RATE_LIMIT_UPLOAD": "1000000/second",
+        "RATE_LIMIT_RENOVATE": "1000000/second",
+    }
+    upstream_args = [
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--failure-rate", str(args.failure_rate), "--output-bytes", str(args.output_bytes),
+        "--slow-rate", str(args.slow_rate), "--slow-ms", str(args.slow_ms),
+        "--throttle-rate", str(args.throttle_rate), "--retry-after-s", str(args.retry_after_s),
+        "--seed", str(args.seed),
+    ]
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_replicate", "--port", str(upstream_port), *upstream_args],
+            cwd=ROOT, env=env,
+        ),
+        subprocess.Popen([sys.executable, "-m", "benchmarks.serve", "--port", str(app_port)], cwd=ROOT, env=env),
+    ]
+    try:
+        async def scenario() -> Dict:
+            await wait_until_ready(f"{upstream_url}/stats")
+            await wait_until_ready(f"{base_url}/api/health")
+            return await drive(base_url, upstream_url, rates, args.duration, args.seed)
+
+        results = asyncio.run(scenario())
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    report = {
+        "benchmark": "e2e",
+        "config": {
+            "duration": args.duration,
+            "rates": rates,
+            "upstream_latency_ms": args.latency_ms,
+            "upstream_jitter_ms": args.jitter_ms,
+            "upstream_failure_rate": args.failure_rate,
+            "upstream_output_bytes": args.output_bytes,
+            "seed": args.seed,
+        },
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        args.output.write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
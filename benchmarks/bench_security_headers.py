@@ -0,0 +1,110 @@
+"""
+Micro-benchmark: security headers middleware on /api/health.
+
+Compares the previous BaseHTTPMiddleware implementation with the pure ASGI
+middleware by driving the ASGI app directly (no sockets), so the numbers
+reflect middleware overhead rather than network or server costs.
+
+Usage:
+    python -m benchmarks.bench_security_headers [--requests 5000]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from akiya.security import BASE_SECURITY_HEADERS, PAGE_CSP, SecurityHeadersMiddleware
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """The original per-request implementation, kept for comparison"""
+
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        csp = (
+            "default-src 'self'; "
+            "script-src 'self' https://cdn.tailwindcss.com 'unsafe-inline'; "
+            "style-src 'self' https://cdn.tailwindcss.com 'unsafe-inline'; "
+            "img-src 'self' data: https:; "
+            "font-src 'self' https://fonts.gstatic.com; "
+            "connect-src 'self'; "
+            "frame-ancestors 'none';"
+        )
+        response.headers["Content-Security-Policy"] = csp
+        return response
+
+
+def build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/health")
+    async def health_check():
+        return {"status": "ok"}
+
+    if variant == "legacy":
+        app.add_middleware(LegacySecurityHeadersMiddleware)
+    elif variant == "asgi":
+        app.add_middleware(
+            SecurityHeadersMiddleware,
+            headers={**BASE_SECURITY_HEADERS, "Content-Security-Policy": PAGE_CSP},
+        )
+    return app
+
+
+async def drive(app, requests: int) -> float:
+    """Send ``requests`` GET /api/health calls and return requests per second"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/health",
+        "raw_path": b"/api/health",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    # Warm up routing and middleware stack construction
+    for _ in range(100):
+        await app(dict(scope), receive, send)
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return requests / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    results = {}
+    for variant in ("none", "legacy", "asgi"):
+        results[variant] = round(asyncio.run(drive(build_app(variant), args.requests)), 1)
+    print(json.dumps({
+        "benchmark": "security_headers",
+        "requests_per_second": results,
+        "speedup": round(results["asgi"] / results["legacy"], 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare two benchmark reports and flag regressions.
+
+Compares per-workload latency percentiles and throughput, event-loop lag and
+peak RSS of ``bench_e2e`` reports. Exits with status 1 when any metric got
+worse by more than ``--threshold`` (relative), so it can gate CI.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.1]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+# (name, value, lower_is_better)
+Metric = Tuple[str, float, bool]
+
+
+def metrics(report: Dict) -> Iterator[Metric]:
+    for name, workload in report.get("workloads", {}).items():
+        for quantile, value in workload["latency_ms"].items():
+            if quantile != "max":
+                yield f"{name}.latency_ms.{quantile}", value, True
+        yield f"{name}.throughput_rps", workload["throughput_rps"], False
+        yield f"{name}.errors", workload["errors"], True
+    server = report.get("server", {})
+    if "loop_lag_ms" in server:
+        yield "server.loop_lag_ms.p99", server["loop_lag_ms"]["p99"], True
+    if "peak_rss_bytes" in server:
+        yield "server.peak_rss_bytes", server["peak_rss_bytes"], True
+
+
+def compare(baseline: Dict, candidate: Dict, threshold: float) -> Dict[str, Dict]:
+    """Relative change of every metric present in both reports"""
+    before = {name: (value, lower_is_better) for name, value, lower_is_better in metrics(baseline)}
+    changes = {}
+    for name, value, lower_is_better in metrics(candidate):
+        if name not in before:
+            continue
+        old = before[name][0]
+        change = (value - old) / old if old else (0.0 if value == old else float("inf"))
+        worse = change if lower_is_better else -change
+        changes[name] = {
+            "baseline": old,
+            "candidate": value,
+            "change": round(change, 4),
+            "regression": worse > threshold,
+        }
+    return changes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    changes = compare(json.loads(args.baseline.read_text()), json.loads(args.candidate.read_text()), args.threshold)
+    regressions = sorted(name for name, change in changes.items() if change["regression"])
+    print(json.dumps({"threshold": args.threshold, "regressions": regressions, "metrics": changes}, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
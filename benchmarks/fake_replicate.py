@@ -0,0 +1,182 @@
+"""
+Local stand-in for the Replicate predictions API.
+
+Implements just enough of the predictions and model version endpoints for
+the official client's ``replicate.run``. Latency, failure rate and output
+size are configurable, and outputs are returned inline as data URLs so the
+client never needs TLS or a second request. Point the app at it with
+``REPLICATE_BASE_URL``.
+
+Slowdowns (a fraction of predictions taking ``slow_ms`` longer) and
+throttling (429 with ``Retry-After``) can be injected too, at startup or
+while running with ``POST /control`` and a JSON object of config fields.
+
+Usage:
+    python -m benchmarks.fake_replicate [--port 9100] [--latency-ms 2000]
+        [--jitter-ms 500] [--failure-rate 0.02] [--output-bytes 300000]
+        [--slow-rate 0.1] [--slow-ms 20000] [--throttle-rate 0.05]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import random
+import uuid
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from typing import Dict
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+@dataclass
+class FakeReplicateConfig:
+    latency_ms: float = 2000.0
+    jitter_ms: float = 0.0
+    failure_rate: float = 0.0
+    output_bytes: int = 300_000
+    slow_rate: float = 0.0
+    slow_ms: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after_s: int = 5
+    seed: int = 0
+
+
+def fake_output(input_data: Dict, size: int) -> str:
+    """Deterministic PNG-signed payload of ``size`` bytes as a data URL"""
+    digest = hashlib.sha256(repr(sorted(input_data.items())).encode("utf-8")).digest()
+    body = PNG_SIGNATURE + (digest * (size // len(digest) + 1))[: max(0, size - len(PNG_SIGNATURE))]
+    return "data:image/png;base64," + base64.b64encode(body).decode("ascii")
+
+
+def build_app(config: FakeReplicateConfig) -> Starlette:
+    rng = random.Random(config.seed)
+    predictions: Dict[str, Dict] = {}
+    counters = {"predictions": 0, "failed": 0, "slow": 0, "throttled": 0}
+
+    def prediction_body(prediction_id: str, version: str, input_data: Dict, failed: bool) -> Dict:
+        now = datetime.now(timezone.utc).isoformat()
+        return {
+            "id": prediction_id,
+            "model": "fake/model",
+            "version": version,
+            "input": input_data,
+            "status": "failed" if failed else "succeeded",
+            "output": None if failed else fake_output(input_data, config.output_bytes),
+            "error": "Simulated model failure" if failed else None,
+            "logs": "",
+            "created_at": now,
+            "started_at": now,
+            "completed_at": now,
+            "urls": {
+                "get": f"/v1/predictions/{prediction_id}",
+                "cancel": f"/v1/predictions/{prediction_id}/cancel",
+            },
+        }
+
+    async def create_prediction(request: Request) -> JSONResponse:
+        payload = await request.json()
+        if rng.random() < config.throttle_rate:
+            counters["throttled"] += 1
+            return JSONResponse(
+                {"title": "Too Many Requests", "detail": "Simulated throttling", "status": 429},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after_s)},
+            )
+        counters["predictions"] += 1
+        delay = config.latency_ms + rng.uniform(-config.jitter_ms, config.jitter_ms)
+        if rng.random() < config.slow_rate:
+            counters["slow"] += 1
+            delay += config.slow_ms
+        await asyncio.sleep(max(0.0, delay) / 1000)
+        failed = rng.random() < config.failure_rate
+        counters["failed"] += failed
+        prediction_id = uuid.uuid4().hex
+        body = prediction_body(prediction_id, payload.get("version", ""), payload.get("input", {}), failed)
+        # Only the state is kept; outputs are rebuilt on polling
+        predictions[prediction_id] = {"version": body["version"], "input": body["input"], "failed": failed}
+        return JSONResponse(body, status_code=201)
+
+    async def get_prediction(request: Request) -> JSONResponse:
+        prediction_id = request.path_params["prediction_id"]
+        state = predictions.get(prediction_id)
+        if state is None:
+            return JSONResponse({"detail": "Not found."}, status_code=404)
+        return JSONResponse(prediction_body(prediction_id, state["version"], state["input"], state["failed"]))
+
+    async def get_version(request: Request) -> JSONResponse:
+        # Looked up by replicate.run for "owner/name:version" references
+        return JSONResponse({
+            "id": request.path_params["version_id"],
+            "created_at": "2024-01-01T00:00:00Z",
+            "cog_version": "0.9.0",
+            "openapi_schema": {},
+        })
+
+    async def stats(request: Request) -> JSONResponse:
+        return JSONResponse(counters)
+
+    async def control(request: Request) -> JSONResponse:
+        # Change the injected latency and faults of a running server
+        changes = await request.json()
+        # The random generator is already seeded
+        names = {f.name for f in fields(FakeReplicateConfig)} - {"seed"}
+        unknown = sorted(set(changes) - names)
+        if unknown:
+            return JSONResponse({"detail": f"Unknown fields: {', '.join(unknown)}"}, status_code=400)
+        for name, value in changes.items():
+            setattr(config, name, value)
+        return JSONResponse({f.name: getattr(config, f.name) for f in fields(FakeReplicateConfig)})
+
+    return Starlette(routes=[
+        Route("/v1/predictions", create_prediction, methods=["POST"]),
+        Route("/v1/predictions/{prediction_id}", get_prediction, methods=["GET"]),
+        Route("/v1/models/{owner}/{name}/versions/{version_id}", get_version, methods=["GET"]),
+        Route("/stats", stats, methods=["GET"]),
+        Route("/control", control, methods=["POST"]),
+    ])
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=2000.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--output-bytes", type=int, default=300_000)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of predictions slowed down")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="extra latency of a slowed prediction")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of submissions answered with 429")
+    parser.add_argument("--retry-after-s", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeReplicateConfig:
+    return FakeReplicateConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        output_bytes=args.output_bytes,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        throttle_rate=args.throttle_rate,
+        retry_after_s=args.retry_after_s,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(build_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
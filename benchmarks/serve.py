@@ -0,0 +1,102 @@
+"""
+Run the app under uvicorn with benchmark probes.
+
+Wraps the application with an event-loop lag probe and two extra routes
+used by the load driver:
+
+- ``GET /__bench/stats``: loop lag percentiles and peak RSS of this process
+- ``POST /__bench/reset``: clear the lag samples (after warm-up)
+
+Usage:
+    python -m benchmarks.serve [--port 8000]
+"""
+import argparse
+import asyncio
+import json
+import resource
+import sys
+import time
+from typing import List
+
+import uvicorn
+
+LAG_PROBE_INTERVAL = 0.01
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of unsorted samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class BenchmarkProbe:
+    """ASGI wrapper measuring how late the event loop wakes up"""
+
+    def __init__(self, app):
+        self.app = app
+        self.lag: List[float] = []
+        self._task = None
+
+    async def _probe(self) -> None:
+        while True:
+            expected = time.perf_counter() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.lag.append(max(0.0, time.perf_counter() - expected))
+
+    def stats(self) -> dict:
+        lag_ms = [value * 1000 for value in self.lag]
+        return {
+            "loop_lag_ms": {
+                "samples": len(lag_ms),
+                "p50": round(percentile(lag_ms, 0.50), 3),
+                "p99": round(percentile(lag_ms, 0.99), 3),
+                "max": round(max(lag_ms, default=0.0), 3),
+            },
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+    async def _respond(self, send, body: dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http":
+            if self._task is None:
+                self._task = asyncio.ensure_future(self._probe())
+            if scope["path"] == "/__bench/stats":
+                await self._respond(send, self.stats())
+                return
+            if scope["path"] == "/__bench/reset":
+                self.lag.clear()
+                await self._respond(send, {"reset": True})
+                return
+        await self.app(scope, receive, send)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    # Imported here so the environment set by the driver applies
+    from app import app
+
+    uvicorn.run(BenchmarkProbe(app), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -107,7 +107,7 @@ async function loadDemoImages(houseId) {
         const container = document.getElementById('demoImages');
         container.innerHTML = demoImages.map(img => `
             <div class="cursor-pointer hover:opacity-80 transition" onclick="selectDemoImage('${escapeHtml(img.url)}', '${escapeHtml(img.name)}', '${escapeHtml(img.id)}')">
-                <img src="${escapeHtml(img.url)}" alt="${escapeHtml(img.name)}" class="w-full h-24 object-cover rounded-lg demo-image" data-id="${escapeHtml(img.id)}">
+                ${demoPicture(img)}
                 <p class="text-xs text-center mt-1 text-gray-600">${escapeHtml(img.name)}</p>
             </div>
         `).join('');
@@ -116,6 +116,18 @@ async function loadDemoImages(houseId) {
     }
 }
 
+// Demo thumbnail; the browser picks the smallest rendition that fits
+function demoPicture(img) {
+    const imgTag = (srcset) => `<img src="${escapeHtml(img.url)}"${srcset ? ` srcset="${escapeHtml(srcset)}" sizes="(min-width: 768px) 12rem, 33vw"` : ''}${img.width ? ` width="${img.width}" height="${img.height}"` : ''} loading="lazy" decoding="async" alt="${escapeHtml(img.name)}" class="w-full h-24 object-cover rounded-lg demo-image" data-id="${escapeHtml(img.id)}">`;
+    if (!img.srcset) {
+        return imgTag('');
+    }
+    return `<picture>
+                    <source type="image/webp" srcset="${escapeHtml(img.srcset.webp)}" sizes="(min-width: 768px) 12rem, 33vw">
+                    ${imgTag(img.srcset.jpeg)}
+                </picture>`;
+}
+
 // Select a demo image
 function selectDemoImage(imageUrl, imageName, imageId) {
     // For demo, we'll use the URL directly instead of converting to base64
@@ -161,6 +173,7 @@ async function generateRenovation(style) {
         // Show loading state
         document.getElementById('resultsSection').classList.remove('hidden');
         document.getElementById('loadingState').classList.remove('hidden');
+        document.getElementById('loadingMessage').textContent = progressMessage({ status: 'running' });
         document.getElementById('sliderContainer').classList.add('hidden');
         
         // Disable all style buttons
@@ -172,30 +185,20 @@ async function generateRenovation(style) {
         // Scroll to results
         document.getElementById('resultsSection').scrollIntoView({ behavior: 'smooth' });
         
-        const response = await fetch(`/api/renovate/${selectedHouseId}/${selectedImageId}`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ 
-                style: style,
-                image_url: selectedImageData  // Include the image URL/data
-            })
-        });
-        
-        if (!response.ok) {
-            throw new Error('Generation failed');
-        }
-        
-        const result = await response.json();
+        const result = await requestRenovation(style);
         
         // Use the stored image data instead of looking it up
         if (!selectedImageData) {
             throw new Error('Original image data not found');
         }
         
-        // Display before/after (original first, then generated)
-        displayBeforeAfter(selectedImageData, result.output[0]);
+        // Display before/after (original first, then generated), using the
+        // server's display-sized renditions when it made them
+        const renditions = result.renditions || {};
+        displayBeforeAfter(
+            renditions.before ? renditions.before.url : selectedImageData,
+            renditions.display ? renditions.display.url : result.output[0]
+        );
         
         // Enable buttons
         document.querySelectorAll('.style-button').forEach(btn => {
@@ -216,6 +219,120 @@ async function generateRenovation(style) {
     }
 }
 
+// The job this page followed is not known to the server instance it reached
+class JobLostError extends Error {}
+
+// Render one style. By default this is one request that returns the result;
+// with RENOVATE_PROGRESS_STREAM the render is queued and followed over its
+// progress stream, falling back to the plain request if the job is lost
+async function requestRenovation(style) {
+    const url = `/api/renovate/${selectedHouseId}/${selectedImageId}`;
+    const options = {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ 
+            style: style,
+            image_url: selectedImageData  // Include the image URL/data
+        })
+    };
+    
+    if (document.body.dataset.renovateProgress === 'stream') {
+        try {
+            const response = await fetch(`${url}/jobs`, options);
+            if (response.status === 200) {
+                // Prerendered: the result comes back right away
+                return await response.json();
+            }
+            if (!response.ok) {
+                throw new Error('Generation failed');
+            }
+            return await followRenovation(await response.json());
+        } catch (error) {
+            if (!(error instanceof JobLostError)) {
+                throw error;
+            }
+            console.warn('Renovation job lost, rendering directly:', error);
+        }
+    }
+    
+    const response = await fetch(url, options);
+    if (!response.ok) {
+        throw new Error('Generation failed');
+    }
+    return await response.json();
+}
+
+// Loading message for a job status update from the progress stream
+function progressMessage(job) {
+    if (job.status === 'queued') {
+        return job.queue_position
+            ? `順番待ち中です（${job.queue_position}番目、約${job.estimated_wait}秒）`
+            : '順番待ち中です...';
+    }
+    if (job.phase === 'upstream' && job.progress !== undefined) {
+        return `AIがリノベーション画像を生成中... ${Math.round(job.progress * 100)}%`;
+    }
+    if (job.phase === 'postprocess') {
+        return '画像を仕上げています...';
+    }
+    return 'AIがリノベーション画像を生成中...';
+}
+
+// Follow a queued renovation over Server-Sent Events until it finishes;
+// falls back to polling the job when EventSource is not available
+function followRenovation(job) {
+    const message = document.getElementById('loadingMessage');
+    const finish = (update, resolve, reject) => {
+        if (update.status === 'succeeded') {
+            resolve(update.result);
+            return true;
+        }
+        if (update.status === 'failed') {
+            reject(new Error(update.error || 'Generation failed'));
+            return true;
+        }
+        message.textContent = progressMessage(update);
+        return false;
+    };
+
+    if (!window.EventSource) {
+        return new Promise((resolve, reject) => {
+            const poll = async () => {
+                try {
+                    const response = await fetch(job.status_url);
+                    if (response.status === 404) {
+                        throw new JobLostError('Job not found');
+                    }
+                    if (!finish(await response.json(), resolve, reject)) {
+                        setTimeout(poll, 2000);
+                    }
+                } catch (error) {
+                    reject(error);
+                }
+            };
+            poll();
+        });
+    }
+
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(job.events_url);
+        source.onmessage = (event) => {
+            if (finish(JSON.parse(event.data), resolve, reject)) {
+                source.close();
+            }
+        };
+        source.onerror = () => {
+            // EventSource reconnects by itself and only stops for good when
+            // the stream is refused, e.g. with a 404 for an unknown job
+            if (source.readyState === EventSource.CLOSED) {
+                reject(new JobLostError('Progress stream closed'));
+            }
+        };
+    });
+}
+
 // Display before/after comparison
 function displayBeforeAfter(beforeUrl, afterUrl) {
     // Set images correctly: bottom layer = after (generated), top clipped layer = before (original)
@@ -1,14 +1,42 @@
 """
 Test configuration and fixtures for AkiyaVision tests.
 """
+import os
 import pytest
 from fastapi.testclient import TestClient
 import sys
+import tempfile
 from pathlib import Path
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# Keep test runs away from the real render cache and Replicate account
+os.environ["RENDER_CACHE_DIR"] = tempfile.mkdtemp(prefix="akiya-test-cache-")
+os.environ["UPLOAD_DIR"] = tempfile.mkdtemp(prefix="akiya-test-uploads-")
+os.environ["ARTIFACT_DIR"] = tempfile.mkdtemp(prefix="akiya-test-results-")
+os.environ["DATABASE_PATH"] = str(Path(tempfile.mkdtemp(prefix="akiya-test-db-")) / "akiya.db")
+os.environ.pop("REPLICATE_API_TOKEN", None)
+# Renditions are made in-process; tests/test_postprocess.py covers the process pool
+os.environ["POSTPROCESS_WORKERS"] = "0"
+
+
+@pytest.fixture(autouse=True)
+def reset_app_state(tmp_path, monkeypatch):
+    """Reset rate limits, cached renders, upstream state and the listing database between tests."""
+    import app as app_module
+    from akiya.repository import Repository
+    app_module.limiter.reset()
+    app_module.render_cache.clear()
+    app_module.near_duplicates.clear()
+    app_module.upstream.reset()
+    repository = Repository(tmp_path / "akiya.db")
+    monkeypatch.setattr(app_module, "repository", repository)
+    app_module.seed_repository(app_module.catalog.data)
+    app_module.catalog.bump()
+    yield
+    repository.close()
+
 
 @pytest.fixture
 def client():
@@ -31,4 +59,64 @@ def mock_replicate_response():
         "id": "test-prediction-id",
         "status": "succeeded",
         "output": ["https://replicate.delivery/pbxt/test-image.png"]
-    }
\ No newline at end of file
+    }
+
+@pytest.fixture
+def fake_replicate(monkeypatch):
+    """Install a fake replicate module that records calls instead of predicting."""
+    import types
+    module = types.ModuleType("replicate")
+    module.calls = []
+
+    def run(model, input):
+        module.calls.append({"model": model, "input": input})
+        return b"\x89PNG fake output for " + input["prompt"][:16].encode()
+
+    class Prediction:
+        """Polled prediction; each reload appends the next of module.progress_logs"""
+
+        def __init__(self, output):
+            self.id = f"prediction-{len(module.calls)}"
+            self.output = output
+            self.error = None
+            self.logs = ""
+            self._pending = list(module.progress_logs)
+            self.status = "processing" if self._pending else "succeeded"
+
+        def cancel(self):
+            module.cancelled.append(self.id)
+            self.status = "canceled"
+
+        def reload(self):
+            if self._pending:
+                self.logs += self._pending.pop(0) + "\n"
+            if not self._pending:
+                self.status = "succeeded"
+
+    class Predictions:
+        def create(self, version, input):
+            return Prediction(module.run(version, input))
+
+    class Client:
+        poll_interval = 0
+
+        def __init__(self, api_token=None, base_url=None, **options):
+            self.api_token = api_token
+            self.predictions = Predictions()
+
+        def run(self, model, input):
+            # Looked up on each call so tests can swap module.run
+            return module.run(model, input)
+
+    helpers = types.ModuleType("replicate.helpers")
+    helpers.transform_output = lambda value, client: value
+
+    module.run = run
+    module.Client = Client
+    module.helpers = helpers
+    module.progress_logs = []
+    module.cancelled = []
+    monkeypatch.setitem(sys.modules, "replicate", module)
+    monkeypatch.setitem(sys.modules, "replicate.helpers", helpers)
+    monkeypatch.setenv("REPLICATE_API_TOKEN", "test-token")
+    return module
@@ -0,0 +1,78 @@
+"""
+Result artifact tests for AkiyaVision
+"""
+import asyncio
+import os
+
+from akiya.artifacts import ArtifactFileResponse, LocalArtifactStore, parse_artifact_id
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+def test_store_is_content_addressed(tmp_path):
+    store = LocalArtifactStore(tmp_path)
+    first = store.put(PNG_BYTES, "image/png")
+    second = store.put(PNG_BYTES, "image/png")
+    assert first.id == second.id
+    assert first.id.endswith(".png")
+    assert store.read(first.id) == PNG_BYTES
+    assert store.get("../" + first.id) is None
+    assert parse_artifact_id("not-an-id") is None
+
+    store.delete(first.id)
+    assert store.get(first.id) is None
+
+
+def test_renovate_returns_result_url(client, fake_replicate):
+    response = client.post(
+        "/api/renovate/house1/demo-1",
+        json={"style": "modern", "image_url": "/public/demo1.jpg"},
+    )
+    url = response.json()["output"][0]
+    assert url.startswith("/api/results/")
+    assert "base64" not in response.text
+
+    result = client.get(url)
+    assert result.status_code == 200
+    assert result.headers["content-type"] == "image/png"
+    assert "immutable" in result.headers["cache-control"]
+    etag = result.headers["etag"]
+    assert etag.strip('"') in url
+
+    # Revalidation is answered without a body
+    revalidated = client.get(url, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+
+def test_result_range_request(client):
+    from app import artifact_store
+    artifact = artifact_store.put(PNG_BYTES, "image/png")
+
+    response = client.get(f"/api/results/{artifact.id}", headers={"Range": "bytes=0-7"})
+    assert response.status_code == 206
+    assert response.content == PNG_BYTES[:8]
+    assert response.headers["content-range"] == f"bytes 0-7/{len(PNG_BYTES)}"
+
+
+def test_unknown_result_returns_404(client):
+    assert client.get("/api/results/" + "0" * 64 + ".png").status_code == 404
+    assert client.get("/api/results/whatever").status_code == 404
+
+
+def test_pathsend_is_used_when_server_supports_it(tmp_path):
+    store = LocalArtifactStore(tmp_path)
+    artifact = store.put(PNG_BYTES, "image/png")
+    response = ArtifactFileResponse(artifact.path, media_type="image/png", stat_result=os.stat(artifact.path))
+
+    sent = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "headers": [], "extensions": {"http.response.pathsend": {}}}
+    asyncio.run(response(scope, receive, send))
+    assert sent[1] == {"type": "http.response.pathsend", "path": str(artifact.path)}
@@ -0,0 +1,139 @@
+"""
+Static asset pipeline tests for AkiyaVision
+"""
+import gzip
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from akiya import assets as assets_module
+from akiya.assets import AssetIndex, StaticAssets, accepted_encodings, build, fingerprinted_name
+
+
+@pytest.fixture
+def asset_dir(tmp_path):
+    (tmp_path / "script.js").write_text("console.log('hello');\n" * 200)
+    (tmp_path / "photo.jpg").write_bytes(b"\xff\xd8\xff" + b"\x00" * 100)
+    return tmp_path
+
+
+@pytest.fixture
+def asset_client(asset_dir):
+    index = AssetIndex(asset_dir, check_interval=0)
+    app = FastAPI()
+    app.mount("/public", StaticAssets(index))
+    return TestClient(app), index
+
+
+def test_fingerprinted_name():
+    assert fingerprinted_name("script.js", "ab" * 32) == "script.abababababab.js"
+    assert fingerprinted_name("img/demo.jpeg", "cd" * 32) == "img/demo.cdcdcdcdcdcd.jpeg"
+    assert fingerprinted_name("LICENSE", "ef" * 32) == "LICENSE.efefefefefef"
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate, br") == ("gzip", "deflate", "br")
+    assert accepted_encodings("br;q=0, gzip;q=0.5") == ("gzip",)
+    assert accepted_encodings(None) == ()
+
+
+def test_hashed_urls_are_immutable(asset_client):
+    client, index = asset_client
+    url = index.url_for("script.js")
+    assert re.fullmatch(r"/public/script\.[0-9a-f]{12}\.js", url)
+
+    hashed = client.get(url)
+    assert hashed.status_code == 200
+    assert "immutable" in hashed.headers["cache-control"]
+
+    plain = client.get("/public/script.js")
+    assert plain.headers["cache-control"] == "no-cache"
+    assert plain.content == hashed.content
+
+    revalidated = client.get("/public/script.js", headers={"If-None-Match": plain.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert client.get("/public/missing.js").status_code == 404
+    assert client.get("/public/../app.py").status_code == 404
+
+
+def test_precompressed_variants(asset_client, asset_dir, monkeypatch):
+    client, index = asset_client
+    monkeypatch.setattr(assets_module, "brotli", None)
+    manifest = build(asset_dir)
+    assert manifest["script.js"]["encodings"] == ["gzip"]
+    # Incompressible files get no variants
+    assert manifest["photo.jpg"]["encodings"] == []
+    assert not (asset_dir / "photo.jpg.gz").exists()
+
+    response = client.get("/public/script.js", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == manifest["script.js"]["gzip_size"]
+    assert response.content == (asset_dir / "script.js").read_bytes()
+
+    identity = client.get("/public/script.js", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] != response.headers["etag"]
+
+    # A stale variant is ignored once the source changes
+    (asset_dir / "script.js").write_text("console.log('changed');\n")
+    response = client.get("/public/script.js", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == "console.log('changed');\n"
+
+
+def test_brotli_variant_preferred(asset_client, asset_dir):
+    pytest.importorskip("brotli")
+    client, _ = asset_client
+    build(asset_dir)
+    response = client.get("/public/script.js", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+
+
+def test_index_uses_hashed_urls(client):
+    html = client.get("/").text
+    assert re.search(r'src="/public/script\.[0-9a-f]{12}\.js"', html)
+    assert re.search(r'href="/public/favicon\.[0-9a-f]{12}\.svg"', html)
+    # The old /static prefix serves the same files
+    assert client.get("/static/script.js").status_code == 200
+
+
+def test_deployment_builds_the_assets(tmp_path):
+    import json
+    import shutil
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    root = Path(__file__).resolve().parent.parent
+    public = tmp_path / "public"
+    shutil.copytree(root / "public", public, ignore=shutil.ignore_patterns("*.gz", "*.br", "asset-manifest.json"))
+    subprocess.run([sys.executable, "-m", "akiya.assets", "build", str(public)], cwd=root, check=True, capture_output=True)
+
+    manifest = json.loads((public / "asset-manifest.json").read_text())
+    encodings = manifest["files"]["script.js"]["encodings"]
+    assert "gzip" in encodings
+    for encoding in encodings:
+        assert (public / f"script.js.{'br' if encoding == 'br' else 'gz'}").exists()
+
+    # What the app serves from the built directory
+    index = AssetIndex(public)
+    app = FastAPI()
+    app.mount("/public", StaticAssets(index))
+    client = TestClient(app)
+    for encoding in encodings:
+        served = client.get(index.url_for("script.js"), headers={"Accept-Encoding": encoding})
+        assert served.headers["content-encoding"] == encoding
+        assert served.headers["etag"]
+        assert "immutable" in served.headers["cache-control"]
+        assert served.content == (public / "script.js").read_bytes()
+        plain = client.get("/public/script.js", headers={"Accept-Encoding": encoding})
+        assert plain.headers["content-encoding"] == encoding
+        revalidated = client.get("/public/script.js", headers={"Accept-Encoding": encoding, "If-None-Match": plain.headers["etag"]})
+        assert revalidated.status_code == 304
+
+    # The deploy runs the same build, since the generated files are not committed
+    config = json.loads((root / "vercel.json").read_text())
+    assert "python3 -m akiya.assets build public" in config["buildCommand"]
@@ -0,0 +1,90 @@
+"""
+Inference backend tests for AkiyaVision
+"""
+import io
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from akiya.backends import (
+    LocalBackend,
+    PredictionCancelled,
+    RenderInput,
+    ReplicateBackend,
+    backend_name,
+    get_backend,
+)
+
+DEMO_IMAGE = Path(__file__).parent.parent / "public" / "demo1.jpg"
+
+
+def demo_input():
+    content = DEMO_IMAGE.read_bytes()
+    return RenderInput(data="/public/demo1.jpg", digest="d", input="/public/demo1.jpg", content=content)
+
+
+def test_backend_selection(monkeypatch):
+    monkeypatch.delenv("INFERENCE_BACKEND", raising=False)
+    monkeypatch.delenv("REPLICATE_API_TOKEN", raising=False)
+    assert backend_name() == "mock"
+    monkeypatch.setenv("REPLICATE_API_TOKEN", "token")
+    assert backend_name() == "replicate"
+    monkeypatch.setenv("INFERENCE_BACKEND", "local")
+    assert get_backend().name == "local"
+
+
+def test_local_backend_is_deterministic():
+    backend = LocalBackend(max_side=256)
+    first = backend.predict(demo_input(), "modern", "prompt", "negative", 25)
+    second = backend.predict(demo_input(), "modern", "prompt", "negative", 25)
+    other = backend.predict(demo_input(), "showa", "prompt", "negative", 25)
+    assert first == second
+    assert first != other
+
+    with Image.open(io.BytesIO(first)) as image:
+        assert image.format == "PNG"
+        assert max(image.size) == 256
+
+
+def test_local_backend_latency():
+    backend = LocalBackend(latency=0.2, max_side=64)
+    started = time.monotonic()
+    backend.predict(demo_input(), "zen", "prompt", "negative", 25)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_renovate_with_local_backend(client, monkeypatch):
+    monkeypatch.setenv("INFERENCE_BACKEND", "local")
+    response = client.post(
+        "/api/renovate/house1/demo-1",
+        json={"style": "scandinavian", "image_url": "/public/demo1.jpg"},
+    )
+    assert response.status_code == 200
+    output = response.json()["output"][0]
+    assert output.startswith("/api/results/")
+    assert client.get(output).content.startswith(b"\x89PNG")
+
+
+def test_replicate_client_is_reused(fake_replicate, monkeypatch):
+    backend = ReplicateBackend()
+    client = backend.client()
+    assert backend.client() is client
+    backend.predict(demo_input(), "zen", "prompt", "negative", 25)
+    assert fake_replicate.calls[0]["input"]["input"] == "/public/demo1.jpg"
+
+    # A new token gets a new client
+    monkeypatch.setenv("REPLICATE_API_TOKEN", "other-token")
+    assert backend.client() is not client
+    assert backend.client().api_token == "other-token"
+
+
+def test_cancelled_replicate_prediction_stops_polling(fake_replicate):
+    fake_replicate.progress_logs = [" 10%|#         | 2/20"] * 1000
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(PredictionCancelled):
+        ReplicateBackend().predict(demo_input(), "modern", "prompt", "", 20, cancel=cancel)
+    assert fake_replicate.cancelled == ["prediction-1"]
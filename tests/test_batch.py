@@ -0,0 +1,129 @@
+"""
+Multi-style batch renovation tests for AkiyaVision
+"""
+import json
+import threading
+import time
+
+import app as app_module
+
+
+def read_lines(response):
+    return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+def test_batch_all_styles(client, fake_replicate, monkeypatch):
+    digests = []
+    original_digest = app_module.image_digest
+    monkeypatch.setattr(app_module, "image_digest", lambda data, content=None: digests.append(data) or original_digest(data, content))
+
+    response = client.post(
+        "/api/renovate/house1/demo-1/batch",
+        json={"styles": "all", "image_url": "/public/demo1.jpg"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    results = read_lines(response)
+    assert sorted(r["style"] for r in results) == sorted(app_module.RENOVATION_STYLES)
+    assert all(r["status"] == "succeeded" for r in results)
+    assert len(fake_replicate.calls) == len(app_module.RENOVATION_STYLES)
+    # The input image was decoded and hashed once for the whole batch
+    assert len(digests) == 1
+
+
+def test_batch_partial_failure(client, fake_replicate):
+    zen_prompt = app_module.RENOVATION_STYLES["zen"]["prompt"]
+    original_run = fake_replicate.run
+
+    def flaky_run(model, input):
+        if input["prompt"] == zen_prompt:
+            raise RuntimeError("upstream failure")
+        return original_run(model, input)
+
+    fake_replicate.run = flaky_run
+    response = client.post(
+        "/api/renovate/house1/demo-1/batch",
+        json={"styles": ["modern", "zen", "eco", "modern"], "image_url": "/public/demo1.jpg"},
+    )
+    assert response.status_code == 200
+
+    results = {r["style"]: r for r in read_lines(response)}
+    assert set(results) == {"modern", "zen", "eco"}
+    assert results["zen"]["status"] == "failed"
+    assert results["modern"]["status"] == "succeeded"
+    assert results["eco"]["status"] == "succeeded"
+
+
+def test_batch_respects_parallelism_cap(client, fake_replicate, monkeypatch):
+    monkeypatch.setattr(app_module, "RENOVATE_BATCH_PARALLELISM", 2)
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def slow_run(model, input):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.05)
+        with lock:
+            state["active"] -= 1
+        return b"\x89PNG"
+
+    fake_replicate.run = slow_run
+    response = client.post(
+        "/api/renovate/house1/demo-1/batch",
+        json={"styles": ["modern", "zen", "eco", "luxury", "smart"], "image_url": "/public/demo1.jpg"},
+    )
+    assert len(read_lines(response)) == 5
+    assert state["peak"] == 2
+
+
+def test_batch_rejects_invalid_style(client):
+    response = client.post(
+        "/api/renovate/house1/demo-1/batch",
+        json={"styles": ["modern", "bogus"], "image_url": "/public/demo1.jpg"},
+    )
+    assert response.status_code == 400
+    assert "Invalid style" in response.json()["detail"]
+
+
+def test_batch_disconnect_cancels_remaining_styles(client, fake_replicate, monkeypatch):
+    import asyncio
+
+    from starlette.requests import Request
+
+    monkeypatch.setattr(app_module, "RENOVATE_BATCH_PARALLELISM", 1)
+    modern_prompt = app_module.RENOVATION_STYLES["modern"]["prompt"]
+    release = threading.Event()
+    original_run = fake_replicate.run
+
+    def run(model, input):
+        if input["prompt"] != modern_prompt:
+            release.wait(5)
+        return original_run(model, input)
+
+    fake_replicate.run = run
+    request = Request({
+        "type": "http", "method": "POST", "path": "/api/renovate/house1/demo-1/batch",
+        "headers": [], "query_string": b"", "client": ("198.51.100.7", 1234),
+    })
+    batch = app_module.BatchRenovateRequest(styles=["modern", "zen", "eco", "luxury"], image_url="/public/demo1.jpg")
+
+    async def read_first_then_disconnect():
+        response = await app_module.renovate_image_batch("house1", "demo-1", batch, request)
+        lines = response.body_iterator
+        first = json.loads(await lines.__anext__())
+        await lines.aclose()
+        return first
+
+    try:
+        first = asyncio.run(read_first_then_disconnect())
+    finally:
+        release.set()
+    assert first["style"] == "modern"
+    deadline = time.time() + 2
+    while app_module.renovation_jobs.stats()["renders_in_flight"] and time.time() < deadline:
+        time.sleep(0.01)
+    # At most the style already running when the client left was rendered
+    assert len(fake_replicate.calls) <= 2
+    assert app_module.renovation_jobs.stats()["renders_queued"] == 0
@@ -0,0 +1,43 @@
+"""
+Benchmark tooling tests for AkiyaVision
+"""
+import pytest
+import replicate
+from fastapi.testclient import TestClient
+
+from benchmarks.compare import compare
+from benchmarks.fake_replicate import FakeReplicateConfig, build_app
+
+
+def fake_replicate_client(**config):
+    transport = TestClient(build_app(FakeReplicateConfig(**config)))._transport
+    return replicate.Client(api_token="bench-token", base_url="http://testserver", transport=transport)
+
+
+def test_fake_replicate_works_with_official_client():
+    client = fake_replicate_client(latency_ms=0, output_bytes=2048)
+    output = client.run("erayyavuz/interior-ai:" + "0" * 64, input={"prompt": "modern"})
+    data = output.read()
+    assert len(data) == 2048
+    assert data.startswith(b"\x89PNG")
+
+
+def test_fake_replicate_failures():
+    client = fake_replicate_client(latency_ms=0, failure_rate=1.0)
+    with pytest.raises(replicate.exceptions.ModelError):
+        client.run("erayyavuz/interior-ai:" + "0" * 64, input={"prompt": "modern"})
+
+
+def test_compare_flags_regressions():
+    def report(p99, throughput):
+        return {"workloads": {"catalog": {
+            "latency_ms": {"p50": 5.0, "p95": 10.0, "p99": p99, "max": 100.0},
+            "throughput_rps": throughput,
+            "errors": 0,
+        }}}
+
+    changes = compare(report(20.0, 50.0), report(30.0, 40.0), threshold=0.1)
+    assert changes["catalog.latency_ms.p99"]["regression"]
+    assert changes["catalog.throughput_rps"]["regression"]
+    assert not changes["catalog.latency_ms.p50"]["regression"]
+    assert not compare(report(20.0, 50.0), report(15.0, 60.0), threshold=0.1)["catalog.latency_ms.p99"]["regression"]
@@ -0,0 +1,96 @@
+"""
+Render cache tests for AkiyaVision
+"""
+from akiya.cache import CacheEntry, RenderCache, prompt_fingerprint, render_cache_key
+
+
+def make_entry(data=b"image", style="modern", fingerprint="fp1"):
+    return CacheEntry(data=data, content_type="image/png", style=style, fingerprint=fingerprint)
+
+
+def test_cache_key_depends_on_every_parameter():
+    base = dict(
+        image_digest="abc", style="modern", prompt="p", negative_prompt="n",
+        num_inference_steps=25, model_version="v1",
+    )
+    keys = {render_cache_key(**base)}
+    for field, value in [("image_digest", "abd"), ("style", "zen"), ("prompt", "q"),
+                         ("negative_prompt", "m"), ("num_inference_steps", 30), ("model_version", "v2")]:
+        keys.add(render_cache_key(**dict(base, **{field: value})))
+    assert len(keys) == 7
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    cache = RenderCache(tmp_path, memory_items=1, fingerprints={"modern": "fp1"})
+    cache.put("a" * 64, make_entry(b"first"))
+    cache.put("b" * 64, make_entry(b"second"))
+
+    # "a" was evicted from memory but is still on disk
+    assert cache.get("b" * 64).data == b"second"
+    assert cache.get("a" * 64).data == b"first"
+    assert cache.get("c" * 64) is None
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["disk_hits"] == 1
+    assert stats["misses"] == 1
+
+    # A fresh instance picks the entries up from disk
+    reopened = RenderCache(tmp_path, fingerprints={"modern": "fp1"})
+    assert reopened.get("a" * 64).data == b"first"
+
+
+def test_disk_size_eviction(tmp_path):
+    cache = RenderCache(tmp_path, memory_items=0, disk_bytes=10)
+    cache.put("a" * 64, make_entry(b"123456"))
+    cache.put("b" * 64, make_entry(b"123456"))
+    assert cache.get("a" * 64) is None
+    assert cache.get("b" * 64) is not None
+    assert cache.stats()["disk_bytes"] <= 10
+
+
+def test_prompt_change_invalidates_entries(tmp_path):
+    cache = RenderCache(tmp_path, fingerprints={"modern": "fp1", "zen": "fz"})
+    cache.put("a" * 64, make_entry(fingerprint="fp1"))
+    cache.put("b" * 64, make_entry(style="zen", fingerprint="fz"))
+
+    removed = cache.set_fingerprints({"modern": "fp2", "zen": "fz"})
+    assert removed == 1
+    assert cache.get("a" * 64) is None
+    assert cache.get("b" * 64) is not None
+
+    # Entries written by an older deployment are dropped when first read
+    stale = RenderCache(tmp_path / "other", fingerprints={"modern": "old"})
+    stale.put("c" * 64, make_entry(fingerprint="old"))
+    fresh = RenderCache(tmp_path / "other", fingerprints={"modern": "new"})
+    assert fresh.get("c" * 64) is None
+    assert prompt_fingerprint({"prompt": "a"}) != prompt_fingerprint({"prompt": "b"})
+
+
+def test_renovate_uses_cache(client, fake_replicate):
+    """Identical renovation requests only reach the model once"""
+    body = {"style": "modern", "image_url": "/public/demo1.jpg"}
+    first = client.post("/api/renovate/house1/demo-1", json=body)
+    second = client.post("/api/renovate/house1/demo-2", json=body)
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert len(fake_replicate.calls) == 1
+    assert second.json()["cached"] is True
+    assert second.json()["output"] == first.json()["output"]
+
+    result = client.get(second.json()["output"][0])
+    assert result.content.startswith(b"\x89PNG")
+
+    # A different style is a different prediction
+    client.post("/api/renovate/house1/demo-3", json={"style": "zen", "image_url": "/public/demo1.jpg"})
+    assert len(fake_replicate.calls) == 2
+
+    stats = client.get("/api/cache/stats").json()
+    assert stats["hits"] >= 1
+    assert stats["misses"] >= 2
+
+
+def test_public_path_traversal_is_not_read():
+    from app import load_image_bytes
+    assert load_image_bytes("/public/../app.py") is None
+    assert load_image_bytes("/public/demo1.jpg").startswith(b"\xff\xd8")
@@ -0,0 +1,74 @@
+"""
+Catalog tests for AkiyaVision
+"""
+import json
+import os
+
+from akiya.catalog import Catalog
+
+
+def write_catalog(path, name):
+    path.write_text(json.dumps({
+        "houses": [{"id": "h1", "name": name, "house_type": "t"}],
+        "demo_images": {"t": [{"id": "d1", "url": "/public/demo1.jpg"}]},
+    }), encoding="utf-8")
+
+
+def test_houses_etag_revalidation(client):
+    first = client.get("/api/houses")
+    etag = first.headers["etag"]
+    assert first.headers["content-type"] == "application/json"
+
+    revalidated = client.get("/api/houses", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert client.get("/api/houses").headers["etag"] == etag
+
+
+def test_upload_changes_houses_etag(client, sample_image_base64):
+    import base64
+    etag = client.get("/api/houses").headers["etag"]
+    client.post(
+        "/api/upload/house1",
+        files={"file": ("test.png", base64.b64decode(sample_image_base64), "image/png")},
+    )
+    response = client.get("/api/houses", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert len(response.json()[0]["images"]) == 1
+
+
+def test_demo_images(client):
+    response = client.get("/api/demo-images/house1")
+    assert [image["id"] for image in response.json()] == ["demo1", "demo2", "demo3"]
+    assert client.get("/api/demo-images/house2").json()[0]["id"] == "demo4"
+    assert client.get("/api/demo-images/house9").status_code == 404
+
+    etag = response.headers["etag"]
+    assert client.get("/api/demo-images/house1", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_payload_is_built_once_and_rebuilt_on_file_change(tmp_path):
+    path = tmp_path / "catalog.json"
+    write_catalog(path, "before")
+    reloads = []
+    catalog = Catalog(path, check_interval=0, on_reload=reloads.append)
+
+    builds = []
+
+    def build():
+        builds.append(1)
+        return catalog.houses()
+
+    first = catalog.encoded("houses", build)
+    assert catalog.encoded("houses", build) is first
+    assert len(builds) == 1
+
+    write_catalog(path, "after")
+    os.utime(path, ns=(1, 1))
+    second = catalog.encoded("houses", build)
+    assert second.etag != first.etag
+    assert b"after" in second.body
+    assert len(reloads) == 2
+    assert catalog.demo_images("h1")[0]["id"] == "d1"
+    assert catalog.demo_images("missing") is None
@@ -0,0 +1,126 @@
+"""
+Prerendered page and response compression tests for AkiyaVision
+"""
+import asyncio
+import gzip
+import json
+import zlib
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.testclient import TestClient
+
+import app as app_module
+from akiya.compression import CompressionMiddleware
+from akiya.pages import PrerenderedPage
+
+
+def test_index_page_is_prerendered_with_validators(client):
+    plain = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert plain.headers["cache-control"] == "no-cache"
+    assert "content-encoding" not in plain.headers
+
+    compressed = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.text == plain.text
+    assert compressed.headers["etag"] != plain.headers["etag"]
+
+    revalidated = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+
+def test_page_renders_once_unless_reloading():
+    html = ["<html>" + "a" * 2000 + "</html>"]
+    calls = []
+
+    def render():
+        calls.append(1)
+        return html[0]
+
+    page = PrerenderedPage(render)
+    first = page.refresh()
+    assert page.refresh() is first
+    assert len(calls) == 1
+    assert "gzip" in first.variants
+
+    reloading = PrerenderedPage(render, reload_interval=0)
+    same = reloading.refresh()
+    assert reloading.refresh() is same
+    html[0] = "<html>changed</html>"
+    assert reloading.refresh().body == b"<html>changed</html>"
+
+
+def json_app():
+    api = FastAPI()
+    rows = [{"id": i, "name": f"house-{i}"} for i in range(200)]
+
+    @api.get("/large")
+    async def large():
+        return JSONResponse(rows, headers={"ETag": '"rows"'})
+
+    @api.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @api.get("/text")
+    async def text():
+        return PlainTextResponse("x" * 4096)
+
+    api.add_middleware(CompressionMiddleware)
+    return TestClient(api), rows
+
+
+def test_json_above_threshold_is_compressed():
+    client, rows = json_app()
+    large = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert large.headers["content-encoding"] == "gzip"
+    assert large.headers["vary"] == "Accept-Encoding"
+    assert large.headers["etag"] == 'W/"rows"'
+    assert int(large.headers["content-length"]) < len(json.dumps(rows))
+    assert large.json() == rows
+
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.headers["vary"] == "Accept-Encoding"
+    assert "content-encoding" not in client.get("/text", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/large", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_streams_are_flushed_chunk_by_chunk():
+    lines = [json.dumps({"line": i}).encode() + b"\n" for i in range(3)]
+
+    async def streaming_app(scope, receive, send):
+        await send({
+            "type": "http.response.start", "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson")],
+        })
+        for i, line in enumerate(lines):
+            await send({"type": "http.response.body", "body": line, "more_body": i < len(lines) - 1})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(CompressionMiddleware(streaming_app)(scope, None, send))
+    assert (b"content-encoding", b"gzip") in sent[0]["headers"]
+    assert not any(name == b"content-length" for name, _ in sent[0]["headers"])
+
+    # Each line can be decoded as soon as its chunk arrives
+    decoder = zlib.decompressobj(31)
+    for message, line in zip(sent[1:], lines):
+        assert decoder.decompress(message["body"]) == line
+    assert gzip.decompress(b"".join(message["body"] for message in sent[1:])) == b"".join(lines)
+
+
+def test_api_json_is_compressed(monkeypatch):
+    monkeypatch.setenv("COMPRESS_MIN_BYTES", "100")
+    client = TestClient(app_module.create_app())
+    listing = client.get("/api/houses", headers={"Accept-Encoding": "gzip"})
+    assert listing.headers["content-encoding"] == "gzip"
+    assert listing.json()
+    # Pre-encoded catalog responses keep their validators working
+    etag = listing.headers["etag"]
+    assert client.get("/api/houses", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
@@ -0,0 +1,234 @@
+"""
+Renovation job tests for AkiyaVision
+"""
+import asyncio
+import threading
+import time
+
+import httpx
+
+SLOW_PREDICTION_SECONDS = 0.5
+
+
+def wait_for_job(client, status_url, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(status_url).json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError("job did not finish in time")
+
+
+def test_submit_and_poll_job(client):
+    response = client.post(
+        "/api/renovate/house1/demo-1/jobs",
+        json={"style": "modern", "image_url": "/public/demo1.jpg"},
+    )
+    assert response.status_code == 202
+    submitted = response.json()
+    assert submitted["status"] in ("queued", "running", "succeeded")
+    assert response.headers["location"] == submitted["status_url"]
+
+    job = wait_for_job(client, submitted["status_url"])
+    assert job["status"] == "succeeded"
+    assert job["result"]["style"] == "modern"
+    assert job["result"]["output"] == ["/public/demo1.jpg"]
+
+
+def test_job_validation_errors_are_immediate(client):
+    response = client.post("/api/renovate/nope/demo-1/jobs", json={"style": "modern", "image_url": "/public/demo1.jpg"})
+    assert response.status_code == 404
+    response = client.post("/api/renovate/house1/demo-1/jobs", json={"style": "unknown", "image_url": "/public/demo1.jpg"})
+    assert response.status_code == 400
+
+
+def test_unknown_job_returns_404(client):
+    response = client.get("/api/renovate/jobs/does-not-exist")
+    assert response.status_code == 404
+
+
+def test_failed_job_reports_error(client, fake_replicate):
+    def broken_run(model, input):
+        raise RuntimeError("upstream exploded")
+
+    fake_replicate.run = broken_run
+    submitted = client.post(
+        "/api/renovate/house1/demo-1/jobs",
+        json={"style": "modern", "image_url": "/public/demo1.jpg"},
+    ).json()
+    job = wait_for_job(client, submitted["status_url"])
+    assert job["status"] == "failed"
+    assert "upstream exploded" not in job["error"]
+
+    response = client.post(
+        "/api/renovate/house1/demo-2",
+        json={"style": "zen", "image_url": "/public/demo1.jpg"},
+    )
+    assert response.status_code == 500
+
+
+def test_health_stays_fast_during_slow_renovations(fake_replicate):
+    """A slow upstream must not stall unrelated endpoints"""
+    from app import app
+
+    def slow_run(model, input):
+        time.sleep(SLOW_PREDICTION_SECONDS)
+        return b"\x89PNG slow output " + input["prompt"][:8].encode()
+
+    fake_replicate.run = slow_run
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            renovations = [
+                asyncio.create_task(client.post(
+                    f"/api/renovate/house1/demo-{i}",
+                    json={"style": style, "image_url": "/public/demo1.jpg"},
+                ))
+                for i, style in enumerate(["modern", "zen", "eco", "luxury"])
+            ]
+            await asyncio.sleep(0.05)
+
+            latencies = []
+            for _ in range(5):
+                started = time.perf_counter()
+                response = await client.get("/api/health")
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200
+                await asyncio.sleep(0.02)
+
+            results = await asyncio.gather(*renovations)
+            return latencies, results
+
+    started = time.perf_counter()
+    latencies, results = asyncio.run(scenario())
+    elapsed = time.perf_counter() - started
+
+    assert all(r.status_code == 200 for r in results)
+    assert max(latencies) < SLOW_PREDICTION_SECONDS / 2
+    # The predictions ran concurrently in the worker pool, not one after another
+    assert elapsed < SLOW_PREDICTION_SECONDS * 3
+
+
+def test_identical_renovations_share_one_prediction(fake_replicate):
+    from app import app
+
+    original_run = fake_replicate.run
+
+    def slow_run(model, input):
+        time.sleep(0.2)
+        return original_run(model, input)
+
+    fake_replicate.run = slow_run
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            before = (await client.get("/api/cache/stats")).json()
+            responses = await asyncio.gather(*[
+                client.post("/api/renovate/house1/demo-6", json={"style": "modern", "image_url": "/public/demo6.jpg"})
+                for _ in range(5)
+            ])
+            after = (await client.get("/api/cache/stats")).json()
+            return before, responses, after
+
+    before, responses, after = asyncio.run(scenario())
+    assert all(r.status_code == 200 for r in responses)
+    assert len({tuple(r.json()["output"]) for r in responses}) == 1
+    assert len(fake_replicate.calls) == 1
+    assert after["renders_coalesced"] - before["renders_coalesced"] == 4
+
+
+def test_cancelled_waiter_does_not_cancel_shared_job():
+    from akiya.jobs import FAILED, JobManager
+
+    manager = JobManager(max_workers=1)
+    release = threading.Event()
+    manager.submit(release.wait)  # occupy the only worker
+
+    async def scenario():
+        first, _ = manager.submit_shared("k", lambda: {"value": 1})
+        second, joined = manager.submit_shared("k", lambda: {"value": 2})
+        assert joined and first is second
+        waiters = [asyncio.create_task(manager.wait(first)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        return first, await waiters[1]
+
+    job, result = asyncio.run(scenario())
+    assert result == {"value": 1}
+    assert manager.stats()["renders_abandoned"] == 0
+
+    # Once every waiter is gone, a job that has not started is cancelled
+    release.clear()
+    manager.submit(release.wait)
+
+    async def abandon():
+        job, _ = manager.submit_shared("k2", lambda: {"value": 3})
+        waiter = asyncio.create_task(manager.wait(job))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+        return job
+
+    job = asyncio.run(abandon())
+    release.set()
+    assert job.status == FAILED
+    assert manager.stats()["renders_abandoned"] == 1
+    assert manager.stats()["renders_in_flight"] == 0
+    manager.shutdown()
+
+
+def test_lifespan_shutdown_cancels_queued_jobs(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import app as app_module
+    from akiya.jobs import FAILED, JobManager
+
+    manager = JobManager(max_workers=1)
+    monkeypatch.setattr(app_module, "renovation_jobs", manager)
+    release = threading.Event()
+    with TestClient(app_module.create_app()):
+        running = manager.submit(lambda: release.wait(5) and {"value": 1})
+        queued = manager.submit(lambda: {"value": 2})
+        while running.status != "running":
+            time.sleep(0.01)
+    try:
+        assert queued.status == FAILED
+        assert queued.future.cancelled()
+    finally:
+        release.set()
+    assert running.future.result(timeout=5) == {"value": 1}
+
+    # The next lifespan gets a working manager again
+    assert manager.submit(lambda: {"value": 3}).future.result(timeout=5) == {"value": 3}
+    manager.shutdown()
+
+
+def test_job_cancelled_between_dequeue_and_start_keeps_the_worker():
+    from akiya.jobs import FAILED, JobManager
+
+    manager = JobManager(max_workers=1)
+    dequeue = manager.queue.get
+    cancelled = []
+
+    def get(timeout=None):
+        job = dequeue(timeout)
+        if job is not None and not cancelled:
+            # The last waiter leaves after the worker popped the job, before it starts
+            manager._release(job, abandoned=True)
+            cancelled.append(job)
+        return job
+
+    manager.queue.get = get
+    first = manager.submit(lambda: {"value": 1})
+    second = manager.submit(lambda: {"value": 2})
+    try:
+        assert second.future.result(timeout=5) == {"value": 2}
+    finally:
+        manager.shutdown()
+    assert cancelled == [first]
+    assert first.status == FAILED and first.future.cancelled()
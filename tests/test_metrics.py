@@ -0,0 +1,70 @@
+"""
+Metrics tests for AkiyaVision
+"""
+import asyncio
+import time
+
+import app as app_module
+from akiya.metrics import LoopLagMonitor, Registry
+from akiya.ratelimit import RateLimit
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("demo_requests_total", "Requests", ("route",))
+    latency = registry.histogram("demo_latency_seconds", "Latency", buckets=(0.1, 1.0))
+    requests.inc(route='/a"b')
+    requests.inc(2, route='/a"b')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE demo_requests_total counter" in text
+    assert 'demo_requests_total{route="/a\\"b"} 3' in text
+    assert 'demo_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'demo_latency_seconds_bucket{le="1"} 2' in text
+    assert 'demo_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "demo_latency_seconds_count 3" in text
+    # Registering the same metric again returns the original
+    assert registry.counter("demo_requests_total", "Requests", ("route",)) is requests
+
+
+def test_metrics_endpoint(client, fake_replicate):
+    client.get("/api/houses/house1/images")
+    client.post("/api/renovate/house1/demo-1", json={"style": "modern", "image_url": "/public/demo1.jpg"})
+
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    # Labelled by route template, not the raw path
+    assert 'route="/api/houses/{house_id}/images",status="200"' in text
+    assert "/api/houses/house1/images" not in text
+    for phase in ("input", "queue", "cache_lookup", "upstream", "output_decode", "output_store"):
+        assert f'akiya_renovation_phase_seconds_count{{phase="{phase}"}}' in text
+    assert 'akiya_renovations_total{backend="replicate",outcome="succeeded"}' in text
+    assert 'akiya_renovation_bytes_total{direction="output"}' in text
+    assert "akiya_event_loop_lag_seconds" in text
+
+
+def test_rate_limit_rejections_are_counted(client, monkeypatch):
+    monkeypatch.setitem(app_module.limiter.limits, "default", RateLimit("default", 1, 60.0))
+    before = app_module.rate_limit_rejections.value(limit="default")
+    client.get("/api/houses")
+    assert client.get("/api/houses").status_code == 429
+    assert app_module.rate_limit_rejections.value(limit="default") == before + 1
+
+
+def test_loop_lag_monitor_sees_blocking_calls():
+    monitor = LoopLagMonitor(interval=0.01)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.2)  # block the loop
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    assert monitor.max_lag >= 0.1
@@ -0,0 +1,94 @@
+"""
+Perceptual hash and near-duplicate lookup tests for AkiyaVision
+"""
+import io
+import random
+
+import numpy as np
+from PIL import Image
+
+from akiya.phash import HammingIndex, NearDuplicateIndex, dhash, hamming
+
+
+def photo(seed: int, size=(640, 480)) -> Image.Image:
+    """Smooth random shapes, a stand-in for a room photo"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+def encode(image: Image.Image, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def test_dhash_survives_resize_and_recompression():
+    original = photo(1)
+    reference = dhash(encode(original))
+    assert hamming(reference, dhash(encode(original.resize((320, 240)), quality=60))) <= 4
+    cropped = original.crop((8, 6, 632, 474))
+    assert hamming(reference, dhash(encode(cropped))) <= 6
+    assert hamming(reference, dhash(encode(photo(2)))) > 12
+    assert dhash(b"not an image") is None
+
+
+def test_hamming_index_matches_brute_force():
+    rng = random.Random(7)
+    hashes = [rng.getrandbits(64) for _ in range(5000)]
+    index = HammingIndex()
+    for i, value_hash in enumerate(hashes):
+        index.add(value_hash, str(i))
+    for value_hash in hashes[:50]:
+        query = value_hash ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        expected = sorted(
+            (hamming(h, query), h, str(i)) for i, h in enumerate(hashes) if hamming(h, query) <= 9
+        )
+        assert index.search(query, 9) == expected
+
+    assert index.remove(hashes[0], "0")
+    assert not index.remove(hashes[0], "0")
+    assert (hashes[0], "0") not in index
+    assert len(index) == 4999
+
+
+def test_near_duplicate_index_persists(tmp_path):
+    path = tmp_path / "near.jsonl"
+    index = NearDuplicateIndex(path, max_distance=4)
+    index.add("modern", 0b1111, "key-a")
+    index.add("modern", 0b1111 << 40, "key-b")
+    index.add("zen", 0b1111, "key-c")
+    index.remove("modern", 0b1111 << 40, "key-b")
+
+    reopened = NearDuplicateIndex(path, max_distance=4)
+    assert [key for _, _, key in reopened.find("modern", 0b0111)] == ["key-a"]
+    assert reopened.find("modern", 0b1111 << 40) == []
+    assert reopened.stats()["near_duplicate_entries"] == 2
+    # Disabled with a negative distance
+    assert NearDuplicateIndex(path, max_distance=-1).find("modern", 0b1111) == []
+
+
+def renovate_upload(client, image: Image.Image, style: str, quality: int = 90):
+    upload = client.post("/api/upload/house1", files={"file": ("room.jpg", encode(image, quality), "image/jpeg")}).json()
+    return client.post(f"/api/renovate/house1/{upload['image_id']}", json={"style": style})
+
+
+def test_reupload_reuses_earlier_render(client, fake_replicate):
+    original = photo(3, size=(800, 600))
+    first = renovate_upload(client, original, "modern")
+    assert first.status_code == 200
+    assert len(fake_replicate.calls) == 1
+
+    # The same photo, downscaled and recompressed by the agent
+    reupload = original.resize((600, 450))
+    second = renovate_upload(client, reupload, "modern", quality=70)
+    assert second.status_code == 200
+    assert second.json()["near_duplicate"] is True
+    assert len(fake_replicate.calls) == 1
+    assert client.get(second.json()["output"][0]).content == client.get(first.json()["output"][0]).content
+
+    # Other styles and other photos still render
+    renovate_upload(client, reupload, "zen", quality=70)
+    renovate_upload(client, photo(4), "modern")
+    assert len(fake_replicate.calls) == 3
+    assert client.get("/api/cache/stats").json()["near_duplicate_hits"] == 1
@@ -0,0 +1,99 @@
+"""
+Server-side rendition tests for AkiyaVision
+"""
+import io
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+import app as app_module
+from akiya.artifacts import LocalArtifactStore
+from akiya.postprocess import COMPOSITE_GAP, PostProcessor, make_renditions
+
+
+def encoded(size, format="PNG", color=(90, 120, 150)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def test_renditions_are_sized_for_the_web():
+    renditions = make_renditions(encoded((2048, 1536)), before=encoded((1024, 1024), format="JPEG"))
+    assert {name: (width, height) for name, (_, _, width, height) in renditions.items()} == {
+        "display": (1280, 960),
+        "thumbnail": (320, 240),
+        # Cropped to the display size so the slider lines up
+        "before": (1280, 960),
+        "composite": (2 * 960 + COMPOSITE_GAP, 720),
+    }
+    data, content_type, width, height = renditions["display"]
+    assert content_type == "image/webp"
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == "WEBP" and image.size == (width, height)
+
+    assert set(make_renditions(encoded((640, 480)), composite=True)) == {"display", "thumbnail"}
+
+
+def test_renditions_run_in_process_pool_and_are_reused(tmp_path):
+    store = LocalArtifactStore(tmp_path / "results")
+    processor = PostProcessor(store, tmp_path / "renditions", "/api/results/", max_workers=1, composite=False)
+    try:
+        output, before = encoded((1536, 1024)), encoded((800, 600), format="JPEG")
+        first = processor.renditions("render-1", output, before, "digest-1")
+        assert set(first) == {"display", "thumbnail", "before"}
+        artifact = store.get(first["thumbnail"]["url"][len("/api/results/"):])
+        assert artifact is not None and artifact.content_type == "image/webp"
+
+        assert processor.renditions("render-1", output, before, "digest-1") == first
+        assert processor.stats() == {"renditions_processed": 1, "renditions_reused": 1}
+        # Another input photo is another set
+        processor.renditions("render-1", output, before, "digest-2")
+        assert processor.stats()["renditions_processed"] == 2
+    finally:
+        processor.shutdown()
+
+
+def test_renovation_returns_renditions(client, fake_replicate):
+    fake_replicate.run = lambda model, input: encoded((1536, 1024))
+    body = {"style": "modern", "image_url": "/public/demo1.jpg"}
+    result = client.post("/api/renovate/house1/demo-1", json=body).json()
+    assert set(result["renditions"]) == {"display", "thumbnail", "before", "composite"}
+    display = client.get(result["renditions"]["display"]["url"])
+    assert display.status_code == 200
+    assert display.headers["content-type"] == "image/webp"
+
+    # A cache hit answers with the same renditions
+    assert client.post("/api/renovate/house1/demo-1", json=body).json()["renditions"] == result["renditions"]
+    assert app_module.postprocessor.stats()["renditions_reused"] >= 1
+
+
+def test_renditions_fall_back_in_process_when_the_pool_cannot_start(tmp_path, monkeypatch):
+    from akiya import postprocess
+
+    attempts = []
+
+    def no_pool(**options):
+        attempts.append(options)
+        raise FileNotFoundError("/dev/shm")
+
+    monkeypatch.setattr(postprocess, "ProcessPoolExecutor", no_pool)
+    processor = PostProcessor(LocalArtifactStore(tmp_path / "results"), None, "/api/results/", max_workers=2)
+    output = encoded((640, 480))
+    assert set(processor.renditions("render-1", output)) == {"display", "thumbnail"}
+    assert set(processor.renditions("render-2", output)) == {"display", "thumbnail"}
+    # Tried once, then encoded in the calling thread
+    assert len(attempts) == 1
+    assert processor.max_workers == 0
+
+
+def test_postprocess_defaults_to_in_process_on_serverless():
+    env = {key: value for key, value in os.environ.items() if key != "POSTPROCESS_WORKERS"}
+    env["VERCEL"] = "1"
+    output = subprocess.run(
+        [sys.executable, "-c", "import app; print(app.postprocessor.max_workers)"],
+        cwd=Path(__file__).resolve().parent.parent, env=env, capture_output=True, text=True, check=True,
+    )
+    assert output.stdout.strip() == "0"
@@ -0,0 +1,107 @@
+"""
+Offline demo prerender tests for AkiyaVision
+"""
+import pytest
+from PIL import Image
+
+from akiya import styles
+from akiya.backends import LocalBackend
+from akiya.prerender import Prerendered, load_manifest, plan, run
+
+BACKEND = LocalBackend(max_side=64)
+
+
+@pytest.fixture
+def demo(tmp_path):
+    source = tmp_path / "demo1.jpg"
+    Image.new("RGB", (96, 64), (150, 120, 90)).save(source)
+    return {"/public/demo1.jpg": source}
+
+
+def prerender(tmp_path, inputs, styles=("modern", "zen")):
+    manifest_path = tmp_path / "prerendered.json"
+    output = tmp_path / "public" / "prerendered"
+    manifest = load_manifest(manifest_path)
+    tasks = plan(inputs, styles, manifest, output, BACKEND.version)
+    failures = run(BACKEND, tasks, output, manifest_path, manifest, concurrency=2, report=lambda line: None)
+    assert failures == 0
+    return tasks, manifest_path
+
+
+def test_prerender_is_resumable_and_tracks_prompts(tmp_path, demo, monkeypatch):
+    tasks, manifest_path = prerender(tmp_path, demo)
+    assert len(tasks) == 2
+    renders = load_manifest(manifest_path)["renders"]["/public/demo1.jpg"]
+    assert (tmp_path / "public" / "prerendered" / renders["zen"]["file"]).read_bytes().startswith(b"\x89PNG")
+
+    # Up-to-date entries are skipped
+    assert prerender(tmp_path, demo)[0] == []
+
+    # Changing a prompt makes only that style stale
+    monkeypatch.setitem(styles.RENOVATION_STYLES, "zen", {**styles.RENOVATION_STYLES["zen"], "prompt": "new zen"})
+    assert [task.style for task in prerender(tmp_path, demo)[0]] == ["zen"]
+
+
+def test_lookup_ignores_stale_entries(tmp_path, demo):
+    _, manifest_path = prerender(tmp_path, demo)
+    digest = plan(demo, ["modern"], {"renders": {}}, tmp_path, BACKEND.version)[0].digest
+
+    index = Prerendered(manifest_path, tmp_path / "public", BACKEND.version, digest_for=lambda source: digest)
+    assert index.lookup("/public/demo1.jpg", "modern")["asset"].startswith("prerendered/demo1-modern")
+    assert index.lookup("/public/demo1.jpg", "eco") is None
+
+    # A different input image or model version invalidates every entry
+    assert Prerendered(manifest_path, tmp_path / "public", BACKEND.version, lambda s: "other").lookup("/public/demo1.jpg", "modern") is None
+    assert Prerendered(manifest_path, tmp_path / "public", "v2", lambda s: digest).lookup("/public/demo1.jpg", "modern") is None
+
+
+def test_renovate_answers_demo_from_prerender(client, fake_replicate, monkeypatch, tmp_path):
+    import app as app_module
+
+    source = app_module.BASE_DIR / "public" / app_module.demo_model_inputs["/public/demo1.jpg"][len("/public/"):]
+    _, manifest_path = prerender(tmp_path, {"/public/demo1.jpg": source}, styles=("modern",))
+    index = Prerendered(manifest_path, tmp_path / "public", BACKEND.version, app_module.prerendered.digest_for)
+    monkeypatch.setattr(app_module, "prerendered", index)
+
+    body = {"style": "modern", "image_url": "/public/demo1.jpg"}
+    # More than the renovate limit, none of them charged
+    for i in range(12):
+        response = client.post("/api/renovate/house1/demo-1", json=body)
+        assert response.status_code == 200
+        if i == 0:
+            revision = app_module.repository.revision()
+    # Linked once; repeats neither write nor invalidate the listing
+    assert app_module.repository.revision() == revision
+    result = response.json()
+    assert result["prerendered"] is True
+    assert result["output"][0].startswith("/public/prerendered/demo1-modern")
+    assert fake_replicate.calls == []
+
+    # Styles that were not prerendered still go upstream
+    response = client.post("/api/renovate/house1/demo-1", json={"style": "zen", "image_url": "/public/demo1.jpg"})
+    assert response.status_code == 200
+    assert len(fake_replicate.calls) == 1
+
+
+def test_jobs_and_batch_answer_demo_from_prerender(client, fake_replicate, monkeypatch, tmp_path):
+    import json
+
+    import app as app_module
+
+    source = app_module.BASE_DIR / "public" / app_module.demo_model_inputs["/public/demo1.jpg"][len("/public/"):]
+    _, manifest_path = prerender(tmp_path, {"/public/demo1.jpg": source}, styles=("modern",))
+    index = Prerendered(manifest_path, tmp_path / "public", BACKEND.version, app_module.prerendered.digest_for)
+    monkeypatch.setattr(app_module, "prerendered", index)
+
+    for _ in range(12):
+        job = client.post("/api/renovate/house1/demo-1/jobs", json={"style": "modern", "image_url": "/public/demo1.jpg"})
+        assert job.status_code == 200
+        assert job.json()["prerendered"] is True
+
+    batch = client.post("/api/renovate/house1/demo-1/batch", json={"styles": ["modern", "zen"], "image_url": "/public/demo1.jpg"})
+    lines = [json.loads(line) for line in batch.text.splitlines()]
+    assert [line["style"] for line in lines] == ["modern", "zen"]
+    assert lines[0]["prerendered"] is True
+    # Only the style without a prerender went upstream and was charged
+    assert len(fake_replicate.calls) == 1
+    assert int(batch.headers["X-RateLimit-Remaining"]) == 9
@@ -0,0 +1,135 @@
+"""
+Renovation progress stream tests for AkiyaVision
+"""
+import asyncio
+import json
+import threading
+
+import app as app_module
+from akiya.jobs import JobManager
+from akiya.progress import ProgressBroker
+
+
+def test_broker_delivers_across_threads_and_drops_oldest():
+    async def scenario():
+        broker = ProgressBroker(max_pending=2)
+        subscription = broker.subscribe("job")
+        publisher = threading.Thread(target=lambda: [broker.publish("job", {"step": i}) for i in range(4)])
+        publisher.start()
+        publisher.join()
+        await asyncio.sleep(0)
+        received = [await subscription.next(0.1), await subscription.next(0.1)]
+        assert received == [{"step": 2}, {"step": 3}]
+        assert await subscription.next(0.01) is None
+        subscription.close()
+        assert "job" not in broker and len(broker) == 0
+
+    asyncio.run(scenario())
+
+
+def test_many_idle_subscribers_share_one_loop():
+    async def scenario():
+        broker = ProgressBroker()
+        subscriptions = [broker.subscribe(f"job-{i % 10}") for i in range(2000)]
+        assert threading.active_count() < 50
+        waiting = [asyncio.ensure_future(subscription.next(5)) for subscription in subscriptions]
+        await asyncio.sleep(0)
+        threading.Thread(target=broker.publish, args=("job-3", {"status": "running"})).start()
+        await asyncio.wait(waiting, timeout=2, return_when=asyncio.FIRST_COMPLETED)
+        await asyncio.sleep(0.05)
+        assert sum(task.done() for task in waiting) == 200
+        for task in waiting:
+            task.cancel()
+        for subscription in subscriptions:
+            subscription.close()
+
+    asyncio.run(scenario())
+
+
+def test_job_reports_are_published():
+    async def scenario():
+        manager = JobManager(max_workers=1)
+        release = threading.Event()
+
+        def work():
+            release.wait(2)
+            report = manager.reporter()
+            report("upstream", 0.5)
+            report("upstream", 0.3)  # an older attempt lagging behind
+            report("postprocess")
+            return {"value": 1}
+
+        job = manager.submit(work)
+        subscription = manager.events.subscribe(job.id)
+        release.set()
+        events = []
+        while not events or events[-1]["status"] not in ("succeeded", "failed"):
+            event = await subscription.next(2)
+            assert event is not None
+            events.append(event)
+        subscription.close()
+        manager.shutdown()
+        return events
+
+    events = asyncio.run(scenario())
+    steps = [(event["status"], event.get("phase"), event.get("progress")) for event in events]
+    assert ("running", "upstream", 0.5) in steps
+    assert ("running", "upstream", 0.3) not in steps
+    assert ("running", "postprocess", None) in steps
+    assert events[-1]["result"] == {"value": 1}
+    # Outside a job reporting does nothing
+    JobManager().reporter()("upstream", 1.0)
+
+
+def parse_events(text):
+    """Parsed data of each message, and the comment lines, of an SSE body"""
+    events = [json.loads(line[len("data: "):]) for line in text.splitlines() if line.startswith("data: ")]
+    return events, [line for line in text.splitlines() if line.startswith(":")]
+
+
+def test_progress_stream_follows_a_renovation(client, fake_replicate, monkeypatch):
+    release = threading.Event()
+    original_run = fake_replicate.run
+
+    def blocked_run(model, input):
+        release.wait(5)
+        return original_run(model, input)
+
+    fake_replicate.run = blocked_run
+    fake_replicate.progress_logs = [" 40%|####      | 8/20", "100%|##########| 20/20"]
+    monkeypatch.setattr(app_module, "SSE_HEARTBEAT", 0.05)
+
+    submitted = client.post("/api/renovate/house1/demo-1/jobs", json={"style": "modern", "image_url": "/public/demo1.jpg"})
+    assert submitted.status_code == 202
+    job_id = submitted.json()["job_id"]
+
+    async def follow():
+        chunks = []
+        async for chunk in app_module.job_events(job_id):
+            chunks.append(chunk)
+            if chunk.startswith(":"):
+                # Idle until the prediction moves: heartbeats keep the stream open
+                release.set()
+        return "".join(chunks)
+
+    try:
+        events, comments = parse_events(asyncio.run(follow()))
+    finally:
+        release.set()
+    assert comments
+    phases = [(event.get("phase"), event.get("progress")) for event in events]
+    assert ("upstream", 0.4) in phases and ("upstream", 1.0) in phases
+    assert events[-1]["status"] == "succeeded"
+    assert events[-1]["result"]["output"][0].startswith("/api/results/")
+    assert len(app_module.renovation_jobs.events) == 0
+
+    # A finished job answers with its final state right away
+    response = client.get(submitted.json()["events_url"])
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "content-encoding" not in response.headers
+    assert [event["status"] for event in parse_events(response.text)[0]] == ["succeeded"]
+    assert client.get("/api/renovate/jobs/missing/events").status_code == 404
+
+
+def test_web_ui_uses_plain_requests_unless_configured(client):
+    assert 'data-renovate-progress="request"' in client.get("/").text
@@ -0,0 +1,146 @@
+"""
+Token-bucket rate limiter tests for AkiyaVision
+"""
+import multiprocessing
+import threading
+
+import pytest
+
+import app as app_module
+from akiya.ratelimit import MemoryStore, RateLimit, SQLiteStore, parse_rate
+
+
+def test_parse_rate():
+    limit = parse_rate("renovate", "10/hour")
+    assert (limit.capacity, limit.period) == (10, 3600)
+    assert limit.describe() == "10 per 1 hour"
+    with pytest.raises(ValueError):
+        parse_rate("renovate", "10 per hour")
+
+
+@pytest.mark.parametrize("make_store", [lambda tmp: MemoryStore(), lambda tmp: SQLiteStore(tmp / "limits.db")])
+def test_refill_and_take(tmp_path, make_store):
+    store = make_store(tmp_path)
+    # 10 tokens refilled at 1 token per second
+    assert store.take("k", 10, 1.0, 4, now=100.0).remaining == 6
+    result = store.take("k", 10, 1.0, 8, now=100.0)
+    assert not result.allowed
+    assert result.retry_after == pytest.approx(2.0)
+    # Two seconds later the tokens are back
+    assert store.take("k", 10, 1.0, 8, now=102.0).allowed
+    # Never refills above capacity
+    assert store.take("k", 10, 1.0, 1, now=10_000.0).remaining == 9
+    # Refunds are negative costs, capped at capacity as well
+    assert store.take("k", 10, 1.0, -5, now=10_000.0).remaining == 10
+
+
+def test_memory_store_is_atomic_across_threads():
+    store = MemoryStore()
+    allowed = []
+
+    def worker():
+        for _ in range(50):
+            allowed.append(store.take("k", 100, 1e-9, 1, now=0.0).allowed)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert allowed.count(True) == 100
+
+
+def _take_many(path, count, results):
+    store = SQLiteStore(path)
+    results.put(sum(store.take("k", 50, 1e-9, 1, now=0.0).allowed for _ in range(count)))
+
+
+def test_sqlite_store_shares_budget_across_processes(tmp_path):
+    path = tmp_path / "limits.db"
+    SQLiteStore(path).reset()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_take_many, args=(path, 30, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+    # 120 attempts against one 50-token bucket
+    assert sum(results.get(timeout=5) for _ in processes) == 50
+
+
+def test_headers_and_retry_after(client, monkeypatch):
+    monkeypatch.setitem(app_module.limiter.limits, "default", RateLimit("default", 2, 60.0))
+    first = client.get("/api/houses")
+    assert first.headers["X-RateLimit-Limit"] == "2"
+    assert first.headers["X-RateLimit-Remaining"] == "1"
+    client.get("/api/houses")
+
+    rejected = client.get("/api/houses")
+    assert rejected.status_code == 429
+    assert rejected.headers["X-RateLimit-Remaining"] == "0"
+    assert 1 <= int(rejected.headers["Retry-After"]) <= 30
+    assert rejected.json()["detail"] == "Rate limit exceeded: 2 per 1 minute"
+
+
+def test_batch_costs_one_token_per_style(client, fake_replicate):
+    response = client.post(
+        "/api/renovate/house1/demo-1/batch",
+        json={"styles": ["modern", "zen", "eco"], "image_url": "/public/demo1.jpg"},
+    )
+    assert response.status_code == 200
+    assert response.headers["X-RateLimit-Remaining"] == "7"
+
+    single = client.post("/api/renovate/house1/demo-1", json={"style": "modern", "image_url": "/public/demo1.jpg"})
+    assert single.headers["X-RateLimit-Remaining"] == "6"
+
+
+def test_invalid_requests_are_not_charged(client, fake_replicate):
+    response = client.post("/api/renovate/house1/demo-1", json={"style": "gothic", "image_url": "/public/demo1.jpg"})
+    assert response.status_code == 400
+    assert "X-RateLimit-Remaining" not in response.headers
+
+    # An input image that does not resolve is refunded on every endpoint
+    missing = "/public/missing.jpg"
+    for path, body in (
+        ("/api/renovate/house1/demo-1", {"style": "modern", "image_url": missing}),
+        ("/api/renovate/house1/demo-1/jobs", {"style": "modern", "image_url": missing}),
+        ("/api/renovate/house1/demo-1/batch", {"styles": ["modern", "zen"], "image_url": missing}),
+    ):
+        response = client.post(path, json=body)
+        assert response.status_code == 404
+        assert response.headers["X-RateLimit-Remaining"] == "10"
+    single = client.post("/api/renovate/house1/demo-1", json={"style": "modern", "image_url": "/public/demo1.jpg"})
+    assert single.headers["X-RateLimit-Remaining"] == "9"
+
+
+def test_renovate_budget_exhausted(client, fake_replicate):
+    response = client.post(
+        "/api/renovate/house1/demo-1/batch",
+        json={"styles": "all", "image_url": "/public/demo1.jpg"},
+    )
+    # Twelve styles exceed the bucket; the cost is capped at its capacity
+    assert response.status_code == 200
+    assert response.headers["X-RateLimit-Remaining"] == "0"
+
+    rejected = client.post("/api/renovate/house1/demo-1", json={"style": "modern", "image_url": "/public/demo1.jpg"})
+    assert rejected.status_code == 429
+    assert "Retry-After" in rejected.headers
+
+
+def test_exhausted_budget_is_rejected_before_fetching_input(client, fake_replicate, monkeypatch):
+    client.post("/api/renovate/house1/demo-1/batch", json={"styles": "all", "image_url": "/public/demo1.jpg"})
+    fetched = []
+
+    async def fetch_remote_input(url):
+        fetched.append(url)
+        raise AssertionError("input fetched for an exhausted client")
+
+    monkeypatch.setattr(app_module, "fetch_remote_input", fetch_remote_input)
+    remote = "https://images.example/photo.jpg"
+    for path, body in (
+        ("/api/renovate/house1/demo-1", {"style": "modern", "image_url": remote}),
+        ("/api/renovate/house1/demo-1/jobs", {"style": "modern", "image_url": remote}),
+        ("/api/renovate/house1/demo-1/batch", {"styles": ["modern", "zen"], "image_url": remote}),
+    ):
+        assert client.post(path, json=body).status_code == 429
+    assert fetched == []
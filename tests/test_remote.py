@@ -0,0 +1,169 @@
+"""
+Shared HTTP pool and remote input image tests for AkiyaVision
+"""
+import asyncio
+import base64
+import io
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import app as app_module
+from akiya import backends
+from akiya.remote import HttpPool, RemoteImageError, RemoteImages, public_address_only
+
+
+def jpeg(size=(1600, 1200)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (120, 140, 160)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+PHOTO = jpeg()
+
+
+class Origin:
+    """Image server that honours If-None-Match and records every request"""
+
+    def __init__(self, content: bytes = PHOTO, cache_control: str = "max-age=0"):
+        self.content = content
+        self.cache_control = cache_control
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path == "/moved":
+            return httpx.Response(302, headers={"Location": "http://internal.example/photo.jpg"})
+        headers = {"ETag": '"v1"', "Cache-Control": self.cache_control}
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers=headers)
+        return httpx.Response(200, content=self.content, headers=headers)
+
+
+def remote(tmp_path, origin, **options) -> RemoteImages:
+    pool = HttpPool(async_transport=httpx.MockTransport(origin))
+    return RemoteImages(pool, tmp_path / "remote", check_host=options.pop("check_host", lambda host: None), **options)
+
+
+def test_remote_images_revalidate_with_conditional_get(tmp_path):
+    origin = Origin()
+    images = remote(tmp_path, origin)
+    first = asyncio.run(images.fetch("https://images.example/photo.jpg"))
+    second = asyncio.run(images.fetch("https://images.example/photo.jpg"))
+    assert first.content == second.content == PHOTO
+    assert origin.requests[1].headers["if-none-match"] == '"v1"'
+    assert images.stats() == {"remote_fetches": 1, "remote_fresh_hits": 0, "remote_revalidated": 1}
+
+    # Within max-age nothing is sent at all
+    fresh_origin = Origin(cache_control="public, max-age=600")
+    fresh = remote(tmp_path / "fresh", fresh_origin)
+    for _ in range(3):
+        asyncio.run(fresh.fetch("https://images.example/photo.jpg"))
+    assert len(fresh_origin.requests) == 1
+
+
+def test_remote_images_are_capped_and_checked(tmp_path):
+    with pytest.raises(RemoteImageError) as too_large:
+        asyncio.run(remote(tmp_path, Origin(), max_bytes=1000).fetch("https://images.example/photo.jpg"))
+    assert too_large.value.status_code == 413
+
+    with pytest.raises(RemoteImageError) as not_image:
+        asyncio.run(remote(tmp_path, Origin(content=b"<html></html>")).fetch("https://images.example/page"))
+    assert not_image.value.status_code == 415
+
+    # Every redirect hop goes through the host check
+    checked = []
+
+    def check_host(host):
+        checked.append(host)
+        if host == "internal.example":
+            raise RemoteImageError(400, "blocked")
+
+    with pytest.raises(RemoteImageError):
+        asyncio.run(remote(tmp_path, Origin(), check_host=check_host).fetch("https://images.example/moved"))
+    assert checked == ["images.example", "internal.example"]
+
+    for host in ("127.0.0.1", "10.0.0.8", "169.254.169.254", "::1"):
+        with pytest.raises(RemoteImageError):
+            public_address_only(host)
+
+
+def test_remote_images_connect_to_the_checked_address(tmp_path):
+    import http.server
+    import threading
+
+    seen = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            seen.append((self.headers["Host"], self.client_address[1]))
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(PHOTO)))
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(PHOTO)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    # Names that do not resolve: only the vetted address can reach the server
+    images = RemoteImages(HttpPool(), None, check_host=lambda host: "127.0.0.1")
+
+    async def fetch_all():
+        try:
+            for host in ("a.invalid", "a.invalid", "b.invalid"):
+                await images.fetch(f"http://{host}:{port}/photo.jpg")
+        finally:
+            await images.pool.aclose()
+
+    try:
+        asyncio.run(fetch_all())
+    finally:
+        server.shutdown()
+    assert [host for host, _ in seen] == [f"a.invalid:{port}", f"a.invalid:{port}", f"b.invalid:{port}"]
+    # Kept alive for the same host, never shared with another host on the same address
+    assert seen[0][1] == seen[1][1]
+    assert seen[2][1] != seen[0][1]
+
+
+def test_remote_input_rejects_decompression_bombs(client, fake_replicate, monkeypatch, tmp_path):
+    buffer = io.BytesIO()
+    # A few kilobytes on the wire, 48 megapixels once decoded
+    Image.new("1", (8000, 6000)).save(buffer, format="PNG")
+    monkeypatch.setattr(app_module, "remote_images", remote(tmp_path, Origin(content=buffer.getvalue())))
+
+    body = {"style": "modern", "image_url": "https://images.example/bomb.png"}
+    response = client.post("/api/renovate/house1/demo-1", json=body)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "画像の解像度が大きすぎます"
+    assert fake_replicate.calls == []
+
+
+def test_remote_input_is_sent_inline(client, fake_replicate, monkeypatch, tmp_path):
+    origin = Origin()
+    monkeypatch.setattr(app_module, "remote_images", remote(tmp_path, origin))
+    body = {"style": "modern", "image_url": "https://images.example/photo.jpg"}
+    assert client.post("/api/renovate/house1/demo-1", json=body).status_code == 200
+
+    sent = fake_replicate.calls[0]["input"]["input"]
+    assert sent.startswith("data:image/jpeg;base64,")
+    with Image.open(io.BytesIO(base64.b64decode(sent.split(",", 1)[1]))) as image:
+        assert max(image.size) == app_module.UPLOAD_MAX_SIDE
+
+    # Same bytes behind the same URL: a cache hit, revalidated but not rendered again
+    assert client.post("/api/renovate/house1/demo-1", json=body).json()["cached"] is True
+    assert len(fake_replicate.calls) == 1
+    assert len(origin.requests) == 2
+
+
+def test_lifespan_shares_one_transport_with_replicate():
+    with TestClient(app_module.create_app()):
+        assert backends._transport is app_module.http_pool.transport
+    assert backends._transport is None
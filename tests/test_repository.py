@@ -0,0 +1,158 @@
+"""
+Listing repository tests for AkiyaVision
+"""
+import pytest
+
+from akiya.repository import (
+    Repository,
+    encode_cursor,
+    parse_age_years,
+    parse_area_m2,
+    parse_price_yen,
+    parse_ward,
+)
+
+WARDS = ["世田谷区", "杉並区", "練馬区", "大田区"]
+
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = Repository(tmp_path / "listings.db")
+    repository.upsert_houses(
+        {
+            "id": f"h{i:04d}",
+            "name": f"物件 {i}",
+            "address": f"東京都{WARDS[i % len(WARDS)]}",
+            "price": f"{1000 + (i * 37) % 5000:,}万円",
+            "area": f"{60 + i % 140}㎡",
+            "age": f"築{i % 90}年",
+            "description": "",
+        }
+        for i in range(1000)
+    )
+    yield repository
+    repository.close()
+
+
+def test_parsers():
+    assert parse_price_yen("3,800万円") == 38_000_000
+    assert parse_price_yen("1億2,000万円") == 120_000_000
+    assert parse_price_yen("980万円") == 9_800_000
+    assert parse_price_yen("応相談") is None
+    assert parse_area_m2("180㎡") == 180.0
+    assert parse_area_m2("95.5㎡") == 95.5
+    assert parse_age_years("築80年") == 80
+    assert parse_age_years("新築") == 0
+    assert parse_ward("東京都世田谷区") == "世田谷区"
+    assert parse_ward("北海道札幌市中央区") == "札幌市"
+
+
+def test_filtered_keyset_pagination(repository):
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = repository.list_houses(
+            ward="杉並区", min_price=20_000_000, sort="-price", limit=40, cursor=cursor
+        )
+        seen.extend(page)
+        if cursor is None:
+            break
+
+    assert len(seen) == len({house["id"] for house in seen})
+    assert all(house["ward"] == "杉並区" and house["price_yen"] >= 20_000_000 for house in seen)
+    prices = [(house["price_yen"], house["id"]) for house in seen]
+    assert prices == sorted(prices, reverse=True)
+
+    everything, _ = repository.list_houses(ward="杉並区", min_price=20_000_000, limit=1000)
+    assert len(everything) == len(seen)
+
+
+def test_sorted_queries_use_indexes(repository):
+    plan = " ".join(
+        row["detail"] for row in repository.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM houses WHERE price_yen IS NOT NULL "
+            "AND (price_yen, id) > (?, ?) ORDER BY price_yen, id LIMIT 10",
+            (1, "a"),
+        )
+    )
+    assert "idx_houses_price" in plan
+
+
+def test_images_are_linked_by_id(repository):
+    repository.add_image("h0001", "upload", url="/api/uploads/x", image_id="img1")
+    repository.add_image("h0001", "generated", url="/api/results/y.png", style="zen", image_id="img2")
+    repository.add_image("h0001", "generated", url="/api/results/y.png", style="zen", image_id="img2")
+
+    assert repository.get_image("h0001", "img1")["url"] == "/api/uploads/x"
+    assert repository.get_image("h0002", "img1") is None
+    images = repository.images_for(["h0001", "h0002"])
+    assert [image["id"] for image in images["h0001"]] == ["img2", "img1"]
+    assert images["h0002"] == []
+
+
+def test_houses_api_filters_and_pages(client):
+    houses = client.get("/api/houses").json()
+    assert houses[0]["price_yen"] == 38_000_000
+    assert houses[0]["ward"] == "世田谷区"
+
+    filtered = client.get("/api/houses", params={"ward": "杉並区"}).json()
+    assert [house["id"] for house in filtered] == ["house2"]
+    assert client.get("/api/houses", params={"max_price": 40_000_000}).json()[0]["id"] == "house1"
+
+    first = client.get("/api/houses", params={"sort": "-price", "limit": 1})
+    assert [house["id"] for house in first.json()] == ["house2"]
+    cursor = first.headers["x-next-cursor"]
+    assert 'rel="next"' in first.headers["link"]
+    second = client.get("/api/houses", params={"sort": "-price", "limit": 1, "cursor": cursor})
+    assert [house["id"] for house in second.json()] == ["house1"]
+    assert "x-next-cursor" not in second.headers
+
+    assert client.get("/api/houses", params={"cursor": "garbage"}).status_code == 400
+    for forged in ([{"a": 1}, "x"], [[1, 2], "x"], [1, 2], [1], {"a": 1}):
+        cursor = encode_cursor(forged)
+        assert client.get("/api/houses", params={"sort": "price", "cursor": cursor}).status_code == 400
+    assert client.get("/api/houses", params={"sort": "name"}).status_code == 422
+
+
+def test_generated_images_are_linked(client, fake_replicate):
+    client.post("/api/renovate/house2/demo-1", json={"style": "zen", "image_url": "/public/demo4.jpeg"})
+    client.post("/api/renovate/house2/demo-2", json={"style": "zen", "image_url": "/public/demo4.jpeg"})
+
+    images = client.get("/api/houses/house2/images", params={"kind": "generated"}).json()
+    assert len(images) == 1
+    assert images[0]["style"] == "zen"
+    assert images[0]["source"] == "/public/demo4.jpeg"
+    assert images[0]["url"].startswith("/api/results/")
+    assert client.get("/api/houses/nope/images").status_code == 404
+
+
+def test_repository_is_not_used_on_the_event_loop(client, fake_replicate, monkeypatch):
+    import asyncio
+    import io
+
+    from PIL import Image
+
+    import app as app_module
+
+    on_loop = []
+    for name in ("house_exists", "get_image", "add_image", "images_for", "list_houses", "revision"):
+        method = getattr(app_module.repository, name)
+
+        def checked(*args, _method=method, _name=name, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(_name)
+            except RuntimeError:
+                pass
+            return _method(*args, **kwargs)
+
+        monkeypatch.setattr(app_module.repository, name, checked)
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48)).save(buffer, format="JPEG")
+    uploaded = client.post("/api/upload/house1", files={"file": ("room.jpg", buffer.getvalue(), "image/jpeg")}).json()
+    assert client.post(f"/api/renovate/house1/{uploaded['image_id']}", json={"style": "zen"}).status_code == 200
+    assert client.get("/api/houses").status_code == 200
+    assert client.get("/api/houses", params={"sort": "price"}).status_code == 200
+    assert client.get("/api/houses/house1/images").status_code == 200
+    assert on_loop == []
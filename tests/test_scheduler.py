@@ -0,0 +1,113 @@
+"""
+Fair render queue and admission control tests for AkiyaVision
+"""
+import threading
+import time
+
+import pytest
+
+import app as app_module
+from akiya.jobs import JobManager, JobRejected
+from akiya.scheduler import FairQueue, QueueFull
+
+
+def drain(queue: FairQueue):
+    items = []
+    while len(queue):
+        items.append(queue.get(timeout=0))
+    return items
+
+
+def test_deficit_round_robin_interleaves_clients():
+    queue = FairQueue(max_size=100)
+    for i in range(6):
+        queue.put("heavy", f"h{i}")
+    queue.put("light", "l0")
+    queue.put("light", "l1")
+    queue.put("other", "o0")
+    assert queue.position("o0") == 2
+    assert queue.positions(["l1", "gone", "o0", "l0"]) == [4, None, 2, 1]
+    assert drain(queue) == ["h0", "l0", "o0", "h1", "l1", "h2", "h3", "h4", "h5"]
+
+
+def test_costly_items_wait_for_credit():
+    queue = FairQueue(max_size=100)
+    queue.put("batch", "big", cost=3)
+    for i in range(4):
+        queue.put("single", f"s{i}")
+    # Three rounds of credit before the batch's turn comes
+    assert drain(queue) == ["s0", "s1", "big", "s2", "s3"]
+
+
+def test_queue_bounds_and_removal():
+    queue = FairQueue(max_size=3, max_per_client=2)
+    queue.put("a", "a0")
+    queue.put("a", "a1")
+    with pytest.raises(QueueFull):
+        queue.put("a", "a2")
+    queue.put("b", "b0")
+    with pytest.raises(QueueFull):
+        queue.check("c")
+    assert queue.remove("a0")
+    assert queue.position("b0") == 1
+    assert queue.close() == ["a1", "b0"]
+    assert queue.get(timeout=0) is None
+
+
+def test_job_manager_rejects_with_predicted_wait():
+    manager = JobManager(max_workers=1, max_queued=2, service_time=10.0)
+    release = threading.Event()
+    manager.submit(release.wait)
+    deadline = time.monotonic() + 2
+    while len(manager.queue) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    first = manager.submit(lambda: {"value": 1}, client="a")
+    second = manager.submit(lambda: {"value": 2}, client="b")
+    assert manager.describe(second)["queue_position"] == 2
+    with pytest.raises(JobRejected) as rejected:
+        manager.submit(lambda: {"value": 3}, client="c")
+    assert rejected.value.status_code == 503
+    assert rejected.value.retry_after == pytest.approx(25.0)
+    assert manager.stats()["renders_rejected"] == 1
+
+    release.set()
+    assert first.future.result(timeout=2) == {"value": 1}
+    assert "queue_position" not in manager.describe(first)
+    manager.shutdown()
+
+
+def test_full_queue_sheds_renovations_before_charging(client, fake_replicate, monkeypatch):
+    release = threading.Event()
+    original_run = fake_replicate.run
+
+    def blocked_run(model, input):
+        release.wait(5)
+        return original_run(model, input)
+
+    fake_replicate.run = blocked_run
+    manager = JobManager(max_workers=1, max_queued=1)
+    monkeypatch.setattr(app_module, "renovation_jobs", manager)
+    try:
+        running = client.post("/api/renovate/house1/demo-1/jobs", json={"style": "modern", "image_url": "/public/demo1.jpg"})
+        assert running.status_code == 202
+        deadline = time.monotonic() + 2
+        while len(manager.queue) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        queued = client.post("/api/renovate/house1/demo-1/jobs", json={"style": "zen", "image_url": "/public/demo1.jpg"})
+        assert queued.json()["queue_position"] == 1
+        assert client.get(queued.json()["status_url"]).json()["estimated_wait"] > 0
+
+        rejected = client.post("/api/renovate/house1/demo-1", json={"style": "eco", "image_url": "/public/demo1.jpg"})
+        assert rejected.status_code == 503
+        assert int(rejected.headers["Retry-After"]) >= 1
+        # Shed before the renovate budget was charged
+        assert "X-RateLimit-Remaining" not in rejected.headers
+
+        release.set()
+        while client.get(queued.json()["status_url"]).json()["status"] not in ("succeeded", "failed"):
+            time.sleep(0.01)
+    finally:
+        release.set()
+        manager.shutdown()
@@ -0,0 +1,58 @@
+"""
+Security headers tests for AkiyaVision
+"""
+import asyncio
+
+from akiya.security import API_CSP, PAGE_CSP, SecurityHeadersMiddleware
+
+
+def assert_base_headers(response):
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert response.headers["x-frame-options"] == "DENY"
+    assert response.headers["x-xss-protection"] == "1; mode=block"
+    assert response.headers["referrer-policy"] == "strict-origin-when-cross-origin"
+
+
+def test_page_gets_page_csp(client):
+    response = client.get("/")
+    assert_base_headers(response)
+    assert response.headers["content-security-policy"] == PAGE_CSP
+
+
+def test_api_gets_strict_csp(client):
+    response = client.get("/api/health")
+    assert_base_headers(response)
+    assert response.headers["content-security-policy"] == API_CSP
+
+
+def test_static_files_get_headers(client):
+    response = client.get("/public/favicon.svg")
+    assert response.status_code == 200
+    assert_base_headers(response)
+
+
+def test_headers_replace_application_values_and_keep_streaming():
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"x-frame-options", b"SAMEORIGIN"), (b"content-type", b"text/plain")],
+        })
+        await send({"type": "http.response.body", "body": b"a", "more_body": True})
+        await send({"type": "http.response.body", "body": b"b"})
+
+    middleware = SecurityHeadersMiddleware(app, policies=[("/api/", {"Content-Security-Policy": API_CSP})])
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware({"type": "http", "path": "/api/x"}, None, send))
+
+    headers = messages[0]["headers"]
+    assert (b"x-frame-options", b"DENY") in headers
+    assert (b"x-frame-options", b"SAMEORIGIN") not in headers
+    assert (b"content-type", b"text/plain") in headers
+    assert (b"content-security-policy", API_CSP.encode()) in headers
+    # Body chunks are forwarded one by one
+    assert [m["body"] for m in messages[1:]] == [b"a", b"b"]
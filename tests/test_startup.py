@@ -0,0 +1,57 @@
+"""
+Cold start tests for AkiyaVision
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cumulative import time of the serverless entry point; about 0.5 s on a laptop
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+
+# Only needed by some requests, so they must not be imported at startup
+DEFERRED_MODULES = ("uvicorn", "jinja2", "dotenv", "replicate", "PIL", "numpy", "httpx")
+
+
+def import_entry_point() -> subprocess.CompletedProcess:
+    code = f"import sys, api.index; print(' '.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+
+
+def entry_point_import_ms(stderr: str) -> float:
+    for line in stderr.splitlines():
+        if line.endswith("| api.index"):
+            return int(line.split("|")[1]) / 1000
+    raise AssertionError("api.index missing from -X importtime output")
+
+
+def test_heavy_modules_are_deferred():
+    assert import_entry_point().stdout.split() == []
+
+
+def test_import_does_not_touch_the_database(tmp_path):
+    database = tmp_path / "import" / "akiya.db"
+    env = {**os.environ, "DATABASE_PATH": str(database)}
+    subprocess.run([sys.executable, "-c", "import api.index"], cwd=ROOT, env=env, check=True)
+    assert not database.exists()
+
+
+def test_import_time_budget():
+    # Best of three, to ignore a busy machine
+    elapsed = min(entry_point_import_ms(import_entry_point().stderr) for _ in range(3))
+    assert elapsed < IMPORT_TIME_BUDGET_MS, f"import took {elapsed:.0f} ms, budget {IMPORT_TIME_BUDGET_MS:.0f} ms"
+
+
+def test_create_app_builds_independent_apps(client):
+    import app as app_module
+    from fastapi.testclient import TestClient
+
+    other = TestClient(app_module.create_app())
+    assert other.get("/api/health").status_code == 200
+    assert other.get("/public/script.js").status_code == 200
+    assert "text/html" in client.get("/").headers["content-type"]
@@ -0,0 +1,78 @@
+"""
+Streaming upload tests for AkiyaVision
+"""
+import io
+
+from PIL import Image
+
+import app as app_module
+
+
+def make_jpeg(size=(3000, 2000), orientation=None):
+    image = Image.new("RGB", size, (120, 80, 40))
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(buffer, format="JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def test_upload_is_rotated_and_downscaled(client):
+    # Orientation 6 means the camera was rotated 90 degrees
+    response = client.post(
+        "/api/upload/house1",
+        files={"file": ("phone.jpg", make_jpeg(orientation=6), "image/jpeg")},
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["width"], result["height"]) == (683, 1024)
+
+    served = client.get(result["url"])
+    assert served.status_code == 200
+    assert served.headers["content-type"] == "image/jpeg"
+    with Image.open(io.BytesIO(served.content)) as image:
+        assert image.size == (683, 1024)
+
+
+def test_upload_over_limit_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(app_module, "UPLOAD_MAX_BYTES", 10_000)
+    response = client.post(
+        "/api/upload/house1",
+        files={"file": ("big.jpg", make_jpeg(), "image/jpeg")},
+    )
+    assert response.status_code == 413
+    assert client.get("/api/houses").json()[0]["images"] == []
+
+
+def test_upload_with_mismatched_header_is_rejected(client):
+    response = client.post(
+        "/api/upload/house1",
+        files={"file": ("fake.jpg", b"GIF89a not really a jpeg", "image/jpeg")},
+    )
+    assert response.status_code == 400
+    assert "ファイルタイプが無効です" in response.json()["detail"]
+
+
+def test_upload_requires_file_field(client):
+    response = client.post("/api/upload/house1", files={"other": ("a.jpg", make_jpeg((10, 10)), "image/jpeg")})
+    assert response.status_code == 400
+
+
+def test_uploaded_image_is_sent_inline_and_small(client, fake_replicate):
+    upload = client.post(
+        "/api/upload/house1",
+        files={"file": ("phone.jpg", make_jpeg((4000, 3000)), "image/jpeg")},
+    ).json()
+    response = client.post(f"/api/renovate/house1/{upload['image_id']}", json={"style": "modern"})
+    assert response.status_code == 200
+
+    sent = fake_replicate.calls[0]["input"]["input"]
+    assert sent.startswith("data:image/jpeg;base64,")
+    # The downscaled photo is sent, not the original
+    assert len(sent) < upload["bytes"] * 4 / 3 + 100
+
+
+def test_unknown_upload_returns_404(client):
+    assert client.get("/api/uploads/../../etc/passwd").status_code == 404
+    assert client.get("/api/uploads/" + "0" * 32).status_code == 404
@@ -0,0 +1,248 @@
+"""
+Upstream concurrency limit, circuit breaker, deadline and hedging tests for AkiyaVision
+"""
+import threading
+import time
+
+import pytest
+import replicate
+from fastapi.testclient import TestClient
+
+import app as app_module
+from akiya.upstream import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    AdaptiveLimit,
+    CircuitBreaker,
+    UpstreamClient,
+    UpstreamTimeout,
+    UpstreamUnavailable,
+)
+from benchmarks.fake_replicate import FakeReplicateConfig, build_app
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Throttled(Exception):
+    status = 429
+    retry_after = 7
+
+
+def test_adaptive_limit_grows_and_backs_off():
+    clock = Clock()
+    limit = AdaptiveLimit(initial=4, maximum=8, min_samples=10, clock=clock)
+    for _ in range(40):
+        assert limit.acquire(0)
+        limit.release(0.1, ok=True)
+    assert limit.limit > 6
+
+    # Far slower than the baseline: one decrease per baseline interval, not per call
+    before = limit.limit
+    for _ in range(5):
+        assert limit.acquire(0)
+        limit.release(5.0, ok=True)
+    assert limit.limit == pytest.approx(before * 0.7)
+    clock.now += 1
+    assert limit.acquire(0)
+    limit.release(0.0, ok=False)
+    assert limit.limit == pytest.approx(before * 0.7 * 0.7)
+
+
+def test_adaptive_limit_caps_concurrency():
+    limit = AdaptiveLimit(initial=2)
+    assert limit.acquire(0) and limit.acquire(0)
+    assert not limit.acquire(0.01)
+    limit.release(0.1, ok=True)
+    assert limit.acquire(0)
+
+
+def test_circuit_breaker_opens_probes_and_closes():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4, cooldown=30, clock=clock)
+    for ok in (True, False, False, True):
+        breaker.before_call()
+        breaker.record(ok)
+    assert breaker.state == OPEN
+    with pytest.raises(UpstreamUnavailable) as rejected:
+        breaker.before_call()
+    assert rejected.value.status_code == 503
+    assert rejected.value.retry_after == 30
+
+    # One probe after the cooldown; everyone else still fails fast
+    clock.now += 31
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+    clock.now += 31
+    breaker.before_call()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.trips == 2
+
+
+def test_probe_without_a_free_slot_records_nothing():
+    clock = Clock()
+    breaker = CircuitBreaker(min_calls=1, cooldown=30, clock=clock)
+    upstream = UpstreamClient(limit=AdaptiveLimit(initial=1, maximum=1), breaker=breaker, queue_timeout=0.01)
+    breaker.record(False)
+    clock.now += 31
+    assert upstream.limit.acquire(0)
+    with pytest.raises(UpstreamUnavailable):
+        upstream.call(lambda: "image")
+    # Still half open, and the next call may probe
+    assert breaker.state == HALF_OPEN
+    upstream.limit.abandon()
+    assert upstream.call(lambda: "image") == "image"
+    assert breaker.state == CLOSED
+
+
+def test_upstream_throttling_opens_circuit_for_retry_after():
+    upstream = UpstreamClient(retries=1)
+    calls = []
+
+    def throttled():
+        calls.append(1)
+        raise Throttled()
+
+    with pytest.raises(Throttled):
+        upstream.call(throttled)
+    # Never retried into a throttle, and the next call fails fast
+    assert len(calls) == 1
+    with pytest.raises(UpstreamUnavailable) as rejected:
+        upstream.call(throttled)
+    assert 6 < rejected.value.retry_after <= 7
+    assert len(calls) == 1
+
+
+def test_failed_attempt_is_retried():
+    upstream = UpstreamClient(retries=1)
+    outcomes = iter([RuntimeError("flaky"), "image"])
+
+    def flaky():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert upstream.call(flaky) == "image"
+    assert upstream.stats()["retried"] == 1
+
+
+def test_deadline_keeps_slot_until_call_finishes():
+    upstream = UpstreamClient(limit=AdaptiveLimit(initial=1, maximum=1), timeout=0.05, queue_timeout=0.01)
+    release = threading.Event()
+    with pytest.raises(UpstreamTimeout) as timed_out:
+        upstream.call(release.wait, 5)
+    assert timed_out.value.status_code == 504
+    # The abandoned prediction still occupies the upstream
+    with pytest.raises(UpstreamUnavailable):
+        upstream.call(lambda: "image")
+    release.set()
+    deadline = time.monotonic() + 2
+    while upstream.limit.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert upstream.call(lambda: "image") == "image"
+
+
+def test_hedged_attempt_wins_over_stuck_call():
+    upstream = UpstreamClient(hedge_quantile=0.9, hedge_min_samples=5)
+    for _ in range(5):
+        upstream.call(time.sleep, 0.01)
+    stuck = threading.Event()
+    attempts = []
+
+    def predict():
+        attempts.append(1)
+        if len(attempts) == 1:
+            stuck.wait(5)
+            return "late"
+        return "hedged"
+
+    assert upstream.call(predict) == "hedged"
+    assert upstream.stats()["hedge_wins"] == 1
+    stuck.set()
+
+
+def test_losing_and_timed_out_attempts_are_cancelled():
+    upstream = UpstreamClient(hedge_quantile=0.9, hedge_min_samples=5)
+    for _ in range(5):
+        upstream.call(time.sleep, 0.01)
+    cancels = []
+
+    def predict(cancel):
+        cancels.append(cancel)
+        if len(cancels) == 1:
+            cancel.wait(5)
+            raise RuntimeError("cancelled")
+        return "hedged"
+
+    limit_before = upstream.limit.limit
+    assert upstream.call(predict, cancellable=True) == "hedged"
+    assert cancels[0].wait(1) and not cancels[1].is_set()
+    deadline = time.monotonic() + 2
+    while upstream.limit.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # A cancelled attempt does not count as an upstream failure
+    assert upstream.limit.limit >= limit_before
+
+    slow = UpstreamClient(timeout=0.05)
+    seen = []
+
+    def stuck(cancel):
+        seen.append(cancel)
+        cancel.wait(5)
+        raise RuntimeError("cancelled")
+
+    with pytest.raises(UpstreamTimeout):
+        slow.call(stuck, cancellable=True)
+    assert seen[0].wait(1)
+
+
+def fake_replicate_client(**config):
+    transport = TestClient(build_app(FakeReplicateConfig(**config)))._transport
+    return replicate.Client(api_token="bench-token", base_url="http://testserver", transport=transport)
+
+
+def test_fake_upstream_throttling_trips_the_breaker():
+    client = fake_replicate_client(latency_ms=0, output_bytes=64, throttle_rate=1.0, retry_after_s=3)
+    upstream = UpstreamClient()
+    with pytest.raises(replicate.exceptions.ReplicateError):
+        upstream.call(client.run, "erayyavuz/interior-ai:" + "0" * 64, input={"prompt": "modern"})
+    assert upstream.breaker.state == OPEN
+
+
+def test_fake_upstream_control_changes_faults():
+    fake = TestClient(build_app(FakeReplicateConfig(latency_ms=0)))
+    assert fake.post("/control", json={"slow_rate": 1.0, "slow_ms": 5}).json()["slow_rate"] == 1.0
+    assert fake.post("/control", json={"bogus": 1}).status_code == 400
+
+
+def test_renovate_fails_fast_while_circuit_is_open(client, fake_replicate, monkeypatch):
+    def broken_run(model, input):
+        fake_replicate.calls.append({"model": model, "input": input})
+        raise RuntimeError("upstream exploded")
+
+    fake_replicate.run = broken_run
+    monkeypatch.setattr(app_module.upstream, "retries", 0)
+    monkeypatch.setattr(app_module.upstream.breaker, "min_calls", 2)
+    for style in ("modern", "zen"):
+        response = client.post("/api/renovate/house1/demo-1", json={"style": style, "image_url": "/public/demo1.jpg"})
+        assert response.status_code == 500
+    assert len(fake_replicate.calls) == 2
+
+    response = client.post("/api/renovate/house1/demo-1", json={"style": "eco", "image_url": "/public/demo1.jpg"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert len(fake_replicate.calls) == 2
+    assert client.get("/api/upstream/stats").json()["circuit"] == OPEN
@@ -0,0 +1,75 @@
+"""
+Demo image rendition tests for AkiyaVision
+"""
+import asyncio
+import io
+import json
+
+from PIL import Image
+
+from akiya.variants import load_manifest, model_inputs, render_image, rendition_widths, srcset
+
+
+def test_rendition_widths():
+    assert rendition_widths(4032, (320, 640, 1024)) == [320, 640, 1024]
+    # Never upscaled; the source width stands in for the larger ones
+    assert rendition_widths(512, (320, 640, 1024)) == [320, 512]
+    assert rendition_widths(200, (320, 640, 1024)) == [200]
+
+
+def test_render_image(tmp_path):
+    source = tmp_path / "room.jpg"
+    Image.new("RGB", (1600, 1200), (120, 90, 60)).save(source, quality=90)
+    entry = render_image("room", str(source), str(tmp_path / "out"), widths=(320, 640), model_width=800)
+
+    assert (entry["width"], entry["height"]) == (1600, 1200)
+    files = {r["file"]: r for r in entry["renditions"]}
+    assert set(files) == {"room-320w.webp", "room-640w.webp", "room-320w.jpg", "room-640w.jpg"}
+    assert files["room-320w.webp"]["height"] == 240
+    for name, rendition in files.items():
+        assert (tmp_path / "out" / name).stat().st_size == rendition["bytes"]
+    with Image.open(tmp_path / "out" / entry["model"]) as model:
+        assert model.size == (800, 600)
+
+    url_for = lambda name: f"/public/variants/{name}"
+    assert srcset(entry, "image/webp", url_for) == (
+        "/public/variants/room-320w.webp 320w, /public/variants/room-640w.webp 640w"
+    )
+
+
+def test_model_inputs_only_for_built_files(tmp_path):
+    (tmp_path / "variants").mkdir()
+    (tmp_path / "variants" / "demo1-model.jpg").write_bytes(b"\xff\xd8")
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text(json.dumps({"directory": "variants", "images": {
+        "demo1": {"source": "demo1.jpg", "model": "demo1-model.jpg", "renditions": []},
+        "demo2": {"source": "demo2.jpg", "model": "demo2-model.jpg", "renditions": []},
+    }}))
+    manifest = load_manifest(manifest_path)
+    assert model_inputs(manifest, tmp_path) == {"/public/demo1.jpg": "/public/variants/demo1-model.jpg"}
+    assert load_manifest(tmp_path / "missing.json") == {"directory": "variants", "images": {}}
+
+
+def test_demo_images_have_srcset(client):
+    images = client.get("/api/demo-images/house1").json()
+    image = images[0]
+    # The original stays available for old clients
+    assert image["url"].startswith("/public/demo")
+    webp = image["srcset"]["webp"].split(", ")
+    assert webp[0].startswith("/public/variants/") and webp[0].endswith(" 320w")
+    first_url = webp[0].split(" ")[0]
+    response = client.get(first_url)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "immutable" in response.headers["cache-control"]
+
+
+def test_model_rendition_is_sent_upstream():
+    import app as app_module
+
+    prepared = asyncio.run(app_module.prepare_renovation_input({"id": "demo-1", "data": "/public/demo1.jpg"}))
+    # Read from disk and sent inline, not fetched back by URL
+    model_file = app_module.BASE_DIR / "public" / "variants" / "demo1-model.jpg"
+    assert prepared.input == app_module.to_data_url(model_file.read_bytes(), "image/jpeg")
+    with Image.open(io.BytesIO(prepared.content)) as image:
+        assert image.width == 1024